@@ -0,0 +1,578 @@
+"""
+Benchmark de carga das rotas /analise/{exam_type}/* e do /chat.
+
+Roda sem acesso à rede: usa as imagens de imgs/ e imagens sintéticas, um
+YOLOv8 minúsculo gerado localmente (benchmarks/tiny_model.py) e o stub da
+OpenAI (tools/openai_stub.py) com latência configurável. Cada cenário (rota,
+arquivos por requisição e concorrência) é medido no próprio processo ou por
+HTTP contra um uvicorn, com p50/p95/p99, vazão, pico de RSS e a duração de
+cada etapa lida do /metrics. Exemplos:
+
+    python benchmarks/bench_api.py --mode inprocess --concurrency 1,8 --files 1,4
+    python benchmarks/bench_api.py --mode http --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_api.py --mode http --baseline benchmarks/baseline.json \
+        --tolerance 0.2
+
+Com --baseline, o script termina com código 1 se algum cenário ficar mais
+lento (p95) ou com menor vazão que a baseline além da tolerância.
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMGS_DIR = os.path.join(ROOT, "imgs")
+ROUTES = {
+    "result_object": "/analise/{exam_type}/result_object",
+    "result_interpretation": "/analise/{exam_type}/result_interpretation",
+    "result_img": "/analise/{exam_type}/result_img",
+    "result_full": "/analise/{exam_type}/result_full",
+    "jobs": "/analise/{exam_type}/jobs",
+    "chat": "/chat",
+}
+CHAT_PAYLOAD = {
+    "ecg_signal": [
+        {"name": "qrs", "confidence": 0.91},
+        {"name": "onda_p", "confidence": 0.62},
+        {"name": "onda_t", "confidence": 0.58},
+    ]
+}
+JOB_FINISHED = ("done", "failed", "cancelled")
+JOB_POLL_S = 0.05
+
+_BUCKET_LINE = re.compile(
+    r"^app_stage_duration_seconds_(bucket|sum|count)\{(.*)\} (\S+)$"
+)
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _csv(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item.strip()]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_http(url: str, timeout_s: float, process: subprocess.Popen = None):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Processo encerrou antes de responder em {url}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"Sem resposta de {url} em {timeout_s:.0f} s")
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout_s: float):
+    # O aquecimento dos modelos roda em segundo plano (MODEL_PRELOAD_BLOCKING=0)
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if (await client.get("/ready")).status_code == 200:
+            return
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"Worker não ficou pronto em {timeout_s:.0f} s")
+
+
+def load_images(
+    synthetic: int, synthetic_size: Tuple[int, int], seed: int
+) -> List[Tuple[str, bytes]]:
+    """
+    Carrega as imagens de imgs/ e gera `synthetic` imagens parecidas com um
+    traçado de ECG, cada uma diferente das demais.
+    """
+    images = []
+    for filename in sorted(os.listdir(IMGS_DIR)):
+        with open(os.path.join(IMGS_DIR, filename), "rb") as file:
+            images.append((filename, file.read()))
+    rng = random.Random(seed)
+    width, height = synthetic_size
+    for index in range(synthetic):
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        for x in range(0, width, 20):
+            draw.line([(x, 0), (x, height)], fill=(255, 200, 200))
+        for row in range(3):
+            baseline = height * (row + 1) // 4
+            points = [
+                (
+                    x,
+                    baseline
+                    - (rng.randint(30, 80) if x % 120 < 8 else rng.randint(-3, 3)),
+                )
+                for x in range(0, width, 4)
+            ]
+            draw.line(points, fill="black", width=2)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append((f"synthetic-{index}.jpg", buffer.getvalue()))
+    return images
+
+
+class RssSampler:
+    """
+    Amostra o RSS de um processo em uma thread, para o pico de cada cenário.
+
+    Lê /proc/<pid>/status (Linux); em outros sistemas o pico fica vazio.
+    """
+
+    def __init__(self, pid: int, interval_s: float = 0.02):
+        self._path = f"/proc/{pid}/status"
+        self._interval_s = interval_s
+        self._peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="rss-sampler", daemon=True
+        )
+
+    def _read_kb(self) -> int:
+        try:
+            with open(self._path) as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def _run(self):
+        while not self._stop.wait(self._interval_s):
+            self._peak_kb = max(self._peak_kb, self._read_kb())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def reset(self):
+        self._peak_kb = self._read_kb()
+
+    def peak_mb(self) -> Optional[float]:
+        return round(self._peak_kb / 1024, 1) if self._peak_kb else None
+
+
+def parse_stage_metrics(text: str) -> Dict[str, dict]:
+    """Soma os histogramas app_stage_duration_seconds por etapa."""
+    stages = defaultdict(
+        lambda: {"buckets": defaultdict(float), "sum": 0.0, "count": 0.0}
+    )
+    for line in text.splitlines():
+        match = _BUCKET_LINE.match(line)
+        if not match:
+            continue
+        kind, labels, value = match.groups()
+        labels = dict(_LABEL.findall(labels))
+        stage = stages[labels["stage"]]
+        if kind == "bucket":
+            stage["buckets"][float(labels["le"])] += float(value)
+        else:
+            stage[kind] += float(value)
+    return stages
+
+
+def stage_summary(before: Dict[str, dict], after: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Duração média e p95 (limite superior do bucket) de cada etapa entre duas
+    leituras do /metrics.
+    """
+    summary = {}
+    for name, stage in after.items():
+        previous = before.get(name, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        count = stage["count"] - previous["count"]
+        if count <= 0:
+            continue
+        p95 = None
+        for bound in sorted(stage["buckets"]):
+            if (
+                stage["buckets"][bound] - previous["buckets"].get(bound, 0)
+                >= 0.95 * count
+            ):
+                p95 = bound
+                break
+        summary[name] = {
+            "count": int(count),
+            "mean_ms": round((stage["sum"] - previous["sum"]) / count * 1000, 2),
+            "p95_le_ms": None if p95 in (None, float("inf")) else round(p95 * 1000, 2),
+        }
+    return summary
+
+
+class Scenario:
+    def __init__(self, route: str, exam_type: str, files: int, concurrency: int):
+        self.route = route
+        self.exam_type = exam_type if route != "chat" else ""
+        self.files = files if route != "chat" else 0
+        self.concurrency = concurrency
+
+    def key(self, mode: str) -> str:
+        return (
+            f"{mode}:{self.route} exam={self.exam_type} "
+            f"files={self.files} c={self.concurrency}"
+        )
+
+    async def send(self, client: httpx.AsyncClient, images: list, index: int) -> int:
+        """Envia uma requisição (ou um job até terminar) e retorna o status final."""
+        if self.route == "chat":
+            response = await client.post("/chat", json=CHAT_PAYLOAD)
+            return response.status_code
+        files = [
+            ("files", (name, data, "image/jpeg"))
+            for name, data in (
+                images[(index * self.files + offset) % len(images)]
+                for offset in range(self.files)
+            )
+        ]
+        path = ROUTES[self.route].format(exam_type=self.exam_type)
+        response = await client.post(path, files=files)
+        if self.route != "jobs" or response.status_code != 202:
+            await response.aread()
+            return response.status_code
+        status_url = response.json()["status_url"]
+        while True:
+            await asyncio.sleep(JOB_POLL_S)
+            status = await client.get(status_url)
+            if status.status_code != 200:
+                return status.status_code
+            if status.json()["status"] in JOB_FINISHED:
+                return 200 if status.json()["status"] == "done" else 500
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    images: list,
+    args,
+    sampler: RssSampler,
+) -> dict:
+    for index in range(args.warmup):
+        await scenario.send(client, images, index)
+
+    before = parse_stage_metrics((await client.get("/metrics")).text)
+    sampler.reset()
+    latencies, statuses = [], Counter()
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            index = next(counter)
+            if index >= args.requests:
+                return
+            start = time.perf_counter()
+            try:
+                status = await scenario.send(client, images, index)
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(scenario.concurrency)))
+    elapsed = time.perf_counter() - start
+    after = parse_stage_metrics((await client.get("/metrics")).text)
+
+    ok = sum(count for status, count in statuses.items() if 200 <= status < 300)
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99]).tolist()
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "requests_per_s": round(ok / elapsed, 2),
+        "images_per_s": round(ok * scenario.files / elapsed, 2),
+        "peak_rss_mb": sampler.peak_mb(),
+        "stages": stage_summary(before, after),
+    }
+
+
+def print_result(key: str, result: dict):
+    print(
+        f"{key}\n  n={result['requests']} erros={result['errors']} "
+        f"p50={result['p50_ms']:.1f} ms p95={result['p95_ms']:.1f} ms "
+        f"p99={result['p99_ms']:.1f} ms "
+        f"req/s={result['requests_per_s']:.1f} img/s={result['images_per_s']:.1f} "
+        f"rss_pico={result['peak_rss_mb']} MB"
+    )
+    for stage, stats in sorted(result["stages"].items()):
+        print(
+            f"    {stage:<12} n={stats['count']:<5} média={stats['mean_ms']:.2f} ms "
+            f"p95<={stats['p95_le_ms']} ms"
+        )
+
+
+def compare_baseline(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """Lista os cenários mais lentos (p95) ou com menor vazão que a baseline."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{key}: p95 {reference['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms"
+            )
+        if result["requests_per_s"] < reference["requests_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: req/s {reference['requests_per_s']:.1f} -> "
+                f"{result['requests_per_s']:.1f}"
+            )
+    return regressions
+
+
+def build_env(args, stub_url: str, workdir: str) -> Dict[str, str]:
+    """Variáveis de ambiente do app: padrões do benchmark, ambiente atual e --env."""
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "LOG_LEVEL": "WARNING",
+        "LOG_FILE": "",
+        # Sem cache, toda requisição passa pelo modelo e pelo GPT
+        "DETECTION_CACHE_ENABLED": "0",
+        "INTERPRETATION_CACHE_ENABLED": "0",
+        "MODEL_PRELOAD": ",".join(args.exam_types),
+        "JOBS_DB": os.path.join(workdir, "jobs.db"),
+    }
+    if args.model != "original":
+        model_path = args.model
+        if model_path == "tiny":
+            from tiny_model import build_tiny_model
+
+            model_path = build_tiny_model()
+        env["INFERENCE_MODEL_PATHS"] = ",".join(
+            f"{exam_type}={os.path.abspath(model_path)}"
+            for exam_type in args.exam_types
+        )
+    env.update(os.environ)
+    env.update(item.split("=", 1) for item in args.env)
+    env["OPENAI_BASE_URL"] = f"{stub_url}/v1"
+    return env
+
+
+async def run_all(
+    client: httpx.AsyncClient, scenarios: List[Scenario], images, args, sampler
+) -> dict:
+    results = {}
+    for scenario in scenarios:
+        key = scenario.key(args.mode)
+        results[key] = await run_scenario(client, scenario, images, args, sampler)
+        print_result(key, results[key])
+    return results
+
+
+async def run_inprocess(scenarios, images, args, env) -> dict:
+    os.environ.update(env)
+    from main import app
+
+    await app.router.startup()
+    sampler = RssSampler(os.getpid())
+    sampler.start()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            await _wait_ready(client, args.startup_timeout_s)
+            return await run_all(client, scenarios, images, args, sampler)
+    finally:
+        sampler.stop()
+        await app.router.shutdown()
+
+
+async def run_http(scenarios, images, args, env) -> dict:
+    server = None
+    url = args.url
+    pid = args.server_pid
+    if not url:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            cwd=ROOT,
+            env=env,
+        )
+        pid = server.pid
+    try:
+        _wait_http(f"{url}/ready", args.startup_timeout_s, server)
+        sampler = RssSampler(pid or 0)
+        sampler.start()
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(
+            base_url=url, timeout=None, limits=limits
+        ) as client:
+            try:
+                return await run_all(client, scenarios, images, args, sampler)
+            finally:
+                sampler.stop()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument(
+        "--url", help="Servidor já em execução (modo http); padrão inicia um uvicorn"
+    )
+    parser.add_argument(
+        "--server-pid", type=int, help="PID do servidor de --url, para o RSS"
+    )
+    parser.add_argument("--exam-types", type=_csv(str), default=["ecg_signal"])
+    parser.add_argument("--routes", type=_csv(str), default=list(ROUTES))
+    parser.add_argument("--concurrency", type=_csv(int), default=[1, 8])
+    parser.add_argument(
+        "--files", type=_csv(int), default=[1, 4], help="Arquivos por requisição"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=40, help="Requisições medidas por cenário"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=2, help="Requisições de aquecimento por cenário"
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=16,
+        help="Imagens sintéticas somadas às de imgs/",
+    )
+    parser.add_argument("--synthetic-size", default="1600x800")
+    parser.add_argument(
+        "--model",
+        default="tiny",
+        help="tiny (gerado localmente), original (pesos de AI/) ou um arquivo",
+    )
+    parser.add_argument("--gpt-latency-ms", type=float, default=300.0)
+    parser.add_argument("--gpt-jitter-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        help="Variável do app, ex: MICRO_BATCH_ENABLED=0",
+    )
+    parser.add_argument("--startup-timeout-s", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Grava os resultados em JSON")
+    parser.add_argument("--save-baseline", help="Grava os resultados como baseline")
+    parser.add_argument("--baseline", help="Compara com a baseline gravada")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Piora relativa tolerada"
+    )
+    args = parser.parse_args()
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"Rotas desconhecidas: {', '.join(sorted(unknown))}")
+
+    random.seed(args.seed)
+    width, height = (int(value) for value in args.synthetic_size.split("x"))
+    images = load_images(args.synthetic, (width, height), args.seed)
+    scenarios = []
+    for route in args.routes:
+        exam_types = [""] if route == "chat" else args.exam_types
+        files = [0] if route == "chat" else args.files
+        for exam_type, count, concurrency in itertools.product(
+            exam_types, files, args.concurrency
+        ):
+            scenarios.append(Scenario(route, exam_type, count, concurrency))
+
+    stub_port = _free_port()
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "tools", "openai_stub.py"),
+            "--port",
+            str(stub_port),
+            "--latency-ms",
+            str(args.gpt_latency_ms),
+            "--jitter-ms",
+            str(args.gpt_jitter_ms),
+        ],
+        cwd=ROOT,
+    )
+    try:
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        _wait_http(f"{stub_url}/stats", 30, stub)
+        with tempfile.TemporaryDirectory(prefix="bench-api-") as workdir:
+            env = build_env(args, stub_url, workdir)
+            runner = run_inprocess if args.mode == "inprocess" else run_http
+            results = asyncio.run(runner(scenarios, images, args, env))
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "mode": args.mode,
+            "model": args.model,
+            "gpt_latency_ms": args.gpt_latency_ms,
+            "requests": args.requests,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "env": args.env,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {path}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["scenarios"]
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSÃO {regression}")
+        compared = len(set(results) & set(baseline))
+        print(
+            f"{compared} cenários comparados com {args.baseline}, "
+            f"{len(regressions)} regressões"
+        )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
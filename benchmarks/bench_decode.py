@@ -0,0 +1,90 @@
+"""
+Microbenchmark da decodificação das imagens enviadas.
+
+Compara o caminho original (decodificação completa + RGB + conversão feita
+pelo ultralytics) com `get_array_from_bytes`, usando as imagens de `imgs/` e
+versões ampliadas delas, que simulam os JPEGs grandes de cine/multiview.
+
+    python benchmarks/bench_decode.py --repeat 50 --sizes 1024,2048,4096
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.uses_for_images import get_array_from_bytes  # noqa: E402
+
+IMGS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "imgs"
+)
+
+
+def baseline_decode(binary_image: bytes) -> np.ndarray:
+    # get_image_from_bytes original + conversão feita pelo LoadPilAndNumpy
+    image = Image.open(io.BytesIO(binary_image)).convert("RGB")
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+
+def load_samples(sizes: list) -> list:
+    """Carrega as imagens de imgs/ e gera versões ampliadas em JPEG."""
+    samples = []
+    for filename in sorted(os.listdir(IMGS_DIR)):
+        with open(os.path.join(IMGS_DIR, filename), "rb") as file:
+            binary_image = file.read()
+        image = Image.open(io.BytesIO(binary_image)).convert("RGB")
+        samples.append(
+            (f"{filename[:24]} {image.size[0]}x{image.size[1]}", binary_image)
+        )
+        for size in sizes:
+            buffer = io.BytesIO()
+            image.resize((size, size), Image.BICUBIC).save(
+                buffer, format="JPEG", quality=90
+            )
+            samples.append((f"{filename[:24]} {size}x{size}", buffer.getvalue()))
+    return samples
+
+
+def measure(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--sizes", default="1024,2048,4096")
+    parser.add_argument("--target-size", type=int, default=640)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    print(
+        f"{'imagem':<36}{'original (ms)':>15}{'draft (ms)':>12}"
+        f"{'ganho':>8}{'saída':>14}"
+    )
+    for name, binary_image in load_samples(sizes):
+        baseline_ms = measure(lambda: baseline_decode(binary_image), args.repeat)
+        fast_ms = measure(
+            lambda: get_array_from_bytes(binary_image, args.target_size), args.repeat
+        )
+        pixels, _ = get_array_from_bytes(binary_image, args.target_size)
+        shape = f"{pixels.shape[1]}x{pixels.shape[0]}"
+        print(
+            f"{name:<36}{baseline_ms:>15.2f}{fast_ms:>12.2f}"
+            f"{baseline_ms / fast_ms:>7.1f}x{shape:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
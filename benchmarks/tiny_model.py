@@ -0,0 +1,69 @@
+"""
+Gera localmente um modelo YOLOv8 minúsculo, com pesos aleatórios, para os benchmarks.
+
+O modelo tem a mesma arquitetura e o mesmo pós-processamento dos modelos
+reais, mas poucos canais, e não depende de download nem dos pesos de AI/.
+Ele serve para medir latência e vazão, não a qualidade das detecções.
+
+    python benchmarks/tiny_model.py --output benchmarks/.cache/tiny-yolov8.pt
+"""
+
+import argparse
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DEFAULT_PATH = os.path.join(CACHE_DIR, "tiny-yolov8.pt")
+DEFAULT_NAMES = {0: "onda_p", 1: "qrs", 2: "onda_t"}
+
+
+def build_tiny_model(
+    path: str = DEFAULT_PATH,
+    names: dict = None,
+    width_multiple: float = 0.125,
+    seed: int = 0,
+) -> str:
+    """
+    Cria o checkpoint .pt de um YOLOv8 reduzido, se ainda não existir.
+
+    Args:
+        path (str, opcional): Onde gravar o checkpoint.
+        names (dict, opcional): Classes do modelo (ID -> nome).
+        width_multiple (float, opcional): Fração dos canais do YOLOv8 (0.25 no
+            yolov8n).
+        seed (int, opcional): Semente dos pesos aleatórios, para resultados
+            reproduzíveis.
+
+    Returns:
+        str: O caminho do checkpoint.
+    """
+    if os.path.exists(path):
+        return path
+    import torch
+    from ultralytics.nn.tasks import DetectionModel, yaml_model_load
+
+    names = names or DEFAULT_NAMES
+    cfg = yaml_model_load("yolov8n.yaml")
+    # Sem "scales", o parse_model usa os multiplicadores abaixo
+    cfg.pop("scales", None)
+    cfg.update(nc=len(names), depth_multiple=0.33, width_multiple=width_multiple)
+
+    torch.manual_seed(seed)
+    model = DetectionModel(cfg, nc=len(names), verbose=False)
+    model.names = dict(names)
+    model.eval()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save({"model": model, "train_args": {}, "epoch": -1}, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    parser.add_argument("--width-multiple", type=float, default=0.125)
+    args = parser.parse_args()
+    print(build_tiny_model(args.output, width_multiple=args.width_multiple))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Carrega as variáveis de ambiente
 load_dotenv()
@@ -11,5 +10,246 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("A chave da API OpenAI não foi encontrada. Verifique seu arquivo .env.")
 
-# Inicializa o cliente com a chave da API
-client = OpenAI(api_key=api_key)
+# Cliente da OpenAI (services/gpt_services.py)
+# URL base da API; permite apontar para um servidor local (ex: tools/openai_stub.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4-turbo-preview")
+GPT_TEMPERATURE = float(os.getenv("GPT_TEMPERATURE", "0.5"))
+# Tempo limite de cada chamada e número de novas tentativas em 429/5xx
+GPT_TIMEOUT_S = float(os.getenv("GPT_TIMEOUT_S", "60"))
+GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "3"))
+# Chamadas simultâneas por worker e tamanho do pool de conexões HTTP
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "16"))
+GPT_MAX_CONNECTIONS = int(os.getenv("GPT_MAX_CONNECTIONS", "32"))
+# Interpreta os arquivos de uma requisição em uma única chamada, com resposta
+# em JSON; se a resposta não puder ser lida, volta às chamadas por arquivo
+INTERPRETATION_BATCH_ENABLED = os.getenv("INTERPRETATION_BATCH_ENABLED", "1") == "1"
+# Número máximo de arquivos por chamada; requisições maiores são divididas
+INTERPRETATION_BATCH_MAX_FILES = int(os.getenv("INTERPRETATION_BATCH_MAX_FILES", "10"))
+# Formato da resposta em lote: "json_object" ou "json_schema" (saída
+# estruturada, apenas nos modelos que a suportam)
+INTERPRETATION_BATCH_RESPONSE_FORMAT = os.getenv(
+    "INTERPRETATION_BATCH_RESPONSE_FORMAT", "json_object"
+)
+
+
+def _env_list(name: str) -> list:
+    """Lê uma variável de ambiente no formato "a,b,c" como lista."""
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+def _env_dict(name: str, cast=str) -> dict:
+    """Lê uma variável de ambiente no formato "a=1,b=2" como dicionário."""
+    items = {}
+    for item in _env_list(name):
+        key, _, value = item.partition("=")
+        if key.strip() and value.strip():
+            items[key.strip()] = cast(value.strip())
+    return items
+
+
+# Registro de modelos residentes (services/model_registry.py)
+# Número máximo de modelos mantidos em memória por worker
+MODEL_CACHE_MAX_MODELS = int(os.getenv("MODEL_CACHE_MAX_MODELS", "7"))
+# Orçamento de memória para os modelos residentes em MB (0 = sem limite)
+MODEL_CACHE_MAX_MEMORY_MB = float(os.getenv("MODEL_CACHE_MAX_MEMORY_MB", "0"))
+# Modelos carregados e aquecidos na inicialização (ex: "ecg_signal,ecg_v3")
+MODEL_PRELOAD = _env_list("MODEL_PRELOAD")
+# Tamanho da imagem usada no passo de aquecimento dos modelos
+MODEL_WARMUP_IMAGE_SIZE = int(os.getenv("MODEL_WARMUP_IMAGE_SIZE", "640"))
+# Se a inicialização aguarda o aquecimento; com "0" (padrão) o worker sobe logo,
+# o aquecimento roda em segundo plano e o /ready responde 503 até ele terminar
+MODEL_PRELOAD_BLOCKING = os.getenv("MODEL_PRELOAD_BLOCKING", "0") == "1"
+# Importa o ultralytics/torch no aquecimento (em segundo plano, ver acima) mesmo
+# sem MODEL_PRELOAD; com "0" a importação acontece no primeiro carregamento de modelo
+INFERENCE_IMPORT_AT_STARTUP = os.getenv("INFERENCE_IMPORT_AT_STARTUP", "1") == "1"
+
+# Inferência em lote (services/ai_services.py)
+# Número máximo de imagens por chamada a model.predict; lotes maiores são divididos
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+
+# Motores de inferência em CPU (services/inference_engines.py)
+# Motor padrão dos modelos: "torch" (ultralytics), "onnxruntime" ou "openvino"
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "torch")
+# Motor por tipo de exame (ex: "ecg_signal=onnxruntime,ecg_v3=openvino")
+INFERENCE_ENGINES = _env_dict("INFERENCE_ENGINES")
+# Arquivo do modelo por tipo de exame
+# (ex: "ecg_signal=./AI/cardiac/ecg-signal-detec.int8.onnx"); o motor é escolhido
+# pela extensão (.pt, .onnx ou .xml). Padrão é o arquivo gerado por
+# tools/export_onnx.py ao lado do .pt
+INFERENCE_MODEL_PATHS = _env_dict("INFERENCE_MODEL_PATHS")
+# Threads de CPU de cada modelo ONNX Runtime/OpenVINO (0 = padrão do runtime)
+INFERENCE_CPU_THREADS = int(os.getenv("INFERENCE_CPU_THREADS", "0"))
+
+# Processos de inferência (services/inference_pool.py)
+# Processos que carregam os modelos e executam a inferência, fora do processo
+# da API (0 = inferência em threads do próprio processo)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+# Processos que atendem cada tipo de exame; cada um carrega a sua cópia do modelo
+INFERENCE_WORKER_REPLICAS = int(os.getenv("INFERENCE_WORKER_REPLICAS", "1"))
+# Fixa cada processo em um grupo exclusivo de núcleos da CPU
+INFERENCE_WORKER_PIN_CORES = os.getenv("INFERENCE_WORKER_PIN_CORES", "1") == "1"
+# Threads do torch/ONNX Runtime/OpenVINO em cada processo (0 = núcleos do processo)
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", "0"))
+# Memória compartilhada inicial de cada processo para as imagens, em MB
+# (cresce quando necessário)
+INFERENCE_WORKER_SHM_MB = float(os.getenv("INFERENCE_WORKER_SHM_MB", "32"))
+# Tempo máximo de um lote; acima dele o processo é reiniciado
+INFERENCE_WORKER_TIMEOUT_S = float(os.getenv("INFERENCE_WORKER_TIMEOUT_S", "120"))
+
+# Inferência em blocos (services/tiling.py)
+# Tamanho dos blocos em pixels por tipo de exame (ex: "ecg_signal=640"); a imagem
+# é analisada em resolução original, em blocos sobrepostos enviados ao modelo em
+# um único lote. Os tipos de exame fora da lista analisam a imagem inteira
+INFERENCE_TILE_SIZES = _env_dict("INFERENCE_TILE_SIZES", int)
+# Sobreposição mínima entre blocos vizinhos, como fração do bloco
+INFERENCE_TILE_OVERLAP = float(os.getenv("INFERENCE_TILE_OVERLAP", "0.2"))
+# Número máximo de blocos por imagem; imagens maiores são reduzidas antes da
+# divisão. Limitado a INFERENCE_MAX_BATCH_SIZE para caber em uma chamada ao modelo
+INFERENCE_TILE_MAX_TILES = int(os.getenv("INFERENCE_TILE_MAX_TILES", "12"))
+# Inclui a imagem inteira no lote dos blocos, para objetos maiores que um bloco
+INFERENCE_TILE_FULL_IMAGE = os.getenv("INFERENCE_TILE_FULL_IMAGE", "1") == "1"
+# Sobreposição (interseção sobre a menor caixa) a partir da qual detecções da
+# mesma classe em blocos vizinhos são juntadas
+INFERENCE_TILE_MERGE_THRESHOLD = float(
+    os.getenv("INFERENCE_TILE_MERGE_THRESHOLD", "0.5")
+)
+
+# Micro-batching entre requisições (services/batch_scheduler.py)
+# Agrupa imagens de requisições concorrentes do mesmo modelo em um único lote
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "1") == "1"
+# Tempo máximo que a primeira imagem de um lote espera por outras imagens
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+
+# Execução das etapas bloqueantes fora do event loop (services/executors.py)
+# Número de threads do pool compartilhado (0 = padrão do Python)
+EXECUTOR_MAX_WORKERS = int(os.getenv("EXECUTOR_MAX_WORKERS", "0"))
+# Limite de concorrência por etapa (ex: "decode=4,inference=2,annotate=4,encode=4")
+STAGE_CONCURRENCY = _env_dict("STAGE_CONCURRENCY", int)
+
+# Cache das interpretações clínicas (services/interpretation_cache.py)
+INTERPRETATION_CACHE_ENABLED = os.getenv("INTERPRETATION_CACHE_ENABLED", "1") == "1"
+INTERPRETATION_CACHE_MAX_ENTRIES = int(
+    os.getenv("INTERPRETATION_CACHE_MAX_ENTRIES", "10000")
+)
+INTERPRETATION_CACHE_TTL_S = float(os.getenv("INTERPRETATION_CACHE_TTL_S", "86400"))
+# Banco sqlite compartilhado entre os workers (vazio = apenas memória)
+INTERPRETATION_CACHE_DB = os.getenv("INTERPRETATION_CACHE_DB", "")
+# Precisão do arredondamento da confiança na chave do cache
+INTERPRETATION_CACHE_CONFIDENCE_PRECISION = float(
+    os.getenv("INTERPRETATION_CACHE_CONFIDENCE_PRECISION", "0.05")
+)
+
+# Cache das detecções por conteúdo do arquivo enviado (services/detection_cache.py)
+DETECTION_CACHE_ENABLED = os.getenv("DETECTION_CACHE_ENABLED", "1") == "1"
+DETECTION_CACHE_MAX_ENTRIES = int(os.getenv("DETECTION_CACHE_MAX_ENTRIES", "2048"))
+# Memória máxima estimada dos resultados em MB (0 = sem limite)
+DETECTION_CACHE_MAX_MB = float(os.getenv("DETECTION_CACHE_MAX_MB", "64"))
+
+# Jobs assíncronos de análise (services/jobs.py)
+# Banco sqlite com a fila, os arquivos enviados e os resultados dos jobs
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+# Jobs executados simultaneamente por worker (0 = o worker apenas enfileira)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs simultâneos por tipo de exame, somando todos os workers (ex: "ecg_signal=2")
+JOB_EXAM_TYPE_CONCURRENCY = _env_dict("JOB_EXAM_TYPE_CONCURRENCY", int)
+JOB_DEFAULT_EXAM_TYPE_CONCURRENCY = int(
+    os.getenv("JOB_DEFAULT_EXAM_TYPE_CONCURRENCY", "1")
+)
+# Arquivos de um job processados por lote de inferência
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "8"))
+# Intervalo do heartbeat e tempo sem heartbeat para retomar um job abandonado
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", "5"))
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "120"))
+# Tempo que os jobs encerrados e seus resultados ficam disponíveis
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "86400"))
+
+# Exames com vários quadros: vídeo, GIF/TIFF animado ou zip de quadros
+# (services/cine.py)
+# Analisa um a cada N quadros da fonte (1 = todos); padrão da query frame_stride
+CINE_FRAME_STRIDE = int(os.getenv("CINE_FRAME_STRIDE", "1"))
+# Quadros analisados pelo modelo por exame; padrão e máximo da query max_frames
+CINE_MAX_FRAMES = int(os.getenv("CINE_MAX_FRAMES", "64"))
+# Quadros decodificados por exame, incluindo os repetidos; o restante da fonte
+# é ignorado
+CINE_MAX_DECODED_FRAMES = int(os.getenv("CINE_MAX_DECODED_FRAMES", "3000"))
+# Distância de Hamming máxima entre os dHash (256 bits) de um quadro e do último
+# quadro analisado para que ele seja considerado repetido (-1 = desativa)
+CINE_DEDUPE_MAX_DISTANCE = int(os.getenv("CINE_DEDUPE_MAX_DISTANCE", "4"))
+# Tamanho do arquivo enviado a /result_cine (0 = sem limite)
+CINE_MAX_FILE_MB = float(os.getenv("CINE_MAX_FILE_MB", "128"))
+
+# Limites e leitura dos arquivos enviados (services/ingestion.py)
+# Tamanho do corpo de uma requisição; verificado pelo Content-Length antes da
+# leitura (0 = sem limite)
+UPLOAD_MAX_REQUEST_MB = float(os.getenv("UPLOAD_MAX_REQUEST_MB", "256"))
+# Tamanho de cada arquivo enviado às rotas de análise (0 = sem limite)
+UPLOAD_MAX_FILE_MB = float(os.getenv("UPLOAD_MAX_FILE_MB", "32"))
+# Pixels de cada imagem e de todas as imagens de uma requisição, lidos do
+# cabeçalho antes da decodificação (0 = sem limite)
+UPLOAD_MAX_FILE_MEGAPIXELS = float(os.getenv("UPLOAD_MAX_FILE_MEGAPIXELS", "64"))
+UPLOAD_MAX_REQUEST_MEGAPIXELS = float(
+    os.getenv("UPLOAD_MAX_REQUEST_MEGAPIXELS", "512")
+)
+# Arquivos lidos e detectados juntos; os bytes de um grupo são liberados antes
+# do próximo
+UPLOAD_CHUNK_FILES = int(os.getenv("UPLOAD_CHUNK_FILES", "16"))
+# Imagens em resolução original (anotação) simultâneas por requisição
+UPLOAD_MAX_DECODED_IMAGES = int(os.getenv("UPLOAD_MAX_DECODED_IMAGES", "4"))
+
+# Controle de admissão das rotas de análise (services/admission.py)
+# Imagens em processamento por worker; acima disso as requisições recebem 429
+# (0 = sem limite)
+ADMISSION_MAX_IMAGES = int(os.getenv("ADMISSION_MAX_IMAGES", "64"))
+# Limite por tipo de exame (ex: "ecg_signal=32"); sem valor, vale apenas o limite
+# do worker
+ADMISSION_MAX_IMAGES_PER_EXAM_TYPE = _env_dict(
+    "ADMISSION_MAX_IMAGES_PER_EXAM_TYPE", int
+)
+ADMISSION_DEFAULT_MAX_IMAGES_PER_EXAM_TYPE = int(
+    os.getenv("ADMISSION_DEFAULT_MAX_IMAGES_PER_EXAM_TYPE", "0")
+)
+# Valor do cabeçalho Retry-After das respostas 429/503
+ADMISSION_RETRY_AFTER_S = float(os.getenv("ADMISSION_RETRY_AFTER_S", "2"))
+# Imagens aguardando lote acima das quais o /ready responde 503
+READY_MAX_QUEUE_DEPTH = int(os.getenv("READY_MAX_QUEUE_DEPTH", "64"))
+
+# Logging (utils/logger.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Arquivo de log em JSON, uma linha por registro (vazio = desativado)
+LOG_FILE = os.getenv("LOG_FILE", "log.log")
+LOG_FILE_LEVEL = os.getenv("LOG_FILE_LEVEL", "DEBUG")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "50 MB")
+# Número de arquivos mantidos (ex: "10") ou duração (ex: "7 days")
+LOG_RETENTION = os.getenv("LOG_RETENTION", "10")
+LOG_COMPRESSION = os.getenv("LOG_COMPRESSION", "zip")
+# Formato do stderr: "text" (colorido) ou "json"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Fração dos payloads de resposta registrados, padrão e por rota
+# (ex: "/analise/{exam_type}/result_img=0.1,/chat=0")
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1"))
+LOG_PAYLOAD_SAMPLE_RATES = _env_dict("LOG_PAYLOAD_SAMPLE_RATES", float)
+# Limites do resumo dos payloads: tamanho dos textos e itens por lista
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "256"))
+LOG_PAYLOAD_MAX_ITEMS = int(os.getenv("LOG_PAYLOAD_MAX_ITEMS", "20"))
+
+# Perfilamento sob demanda (utils/profiling.py)
+# Token do cabeçalho X-Profile-Token, que perfila a requisição e dá acesso a
+# /admin/profiles (vazio = sem perfilamento por cabeçalho)
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+# Fração das requisições de /analise perfiladas sem o cabeçalho (0 = nenhuma)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+# Intervalo entre as amostras de pilha das threads do pool
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+# Perfis mantidos em memória por worker; com PROFILING_DIR também são gravados em disco
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "20"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "")
+
+# Inicialização do worker (main.py)
+# Gera o openapi.json a cada inicialização; normalmente ele é gerado no build
+# com `python tools/export_openapi.py`
+OPENAPI_EXPORT_ON_STARTUP = os.getenv("OPENAPI_EXPORT_ON_STARTUP", "0") == "1"
+OPENAPI_JSON_PATH = os.getenv("OPENAPI_JSON_PATH", "openapi.json")
+# Orçamento de tempo da inicialização; acima dele o relatório é um aviso
+# (0 = sem orçamento)
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "0"))
@@ -1,94 +1,361 @@
-import json
-from fastapi import APIRouter, File, HTTPException, UploadFile
-from typing import List
+import asyncio
+import base64
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from typing import Callable, List, Optional, Tuple
+from starlette.background import BackgroundTask
 from starlette.responses import JSONResponse
-from services.ai_services import detect_sample_model
-from services.image_processing import add_bboxs_on_img
-from utils.logger import get_logger
-from utils.uses_for_images import get_image_from_bytes, encode_image_to_base64
-from config import client
+from config import (
+    ADMISSION_RETRY_AFTER_S,
+    CINE_DEDUPE_MAX_DISTANCE,
+    CINE_FRAME_STRIDE,
+    CINE_MAX_DECODED_FRAMES,
+    CINE_MAX_FRAMES,
+    INFERENCE_MAX_BATCH_SIZE,
+    UPLOAD_MAX_DECODED_IMAGES,
+)
+from services.admission import AdmissionRejected, admission_controller
+from services.ai_services import ai_paths, is_model_ready
+from services.cine import CineFormatError, analyze_cine
+from services.gpt_services import (
+    SharedInterpretations,
+    get_clinical_interpretations,
+    stream_clinical_interpretation,
+)
+from services.image_processing import render_annotated_image
+from services.ingestion import (
+    UploadRejected,
+    check_cine_upload,
+    check_uploads,
+    detect_uploads,
+    load_upload_image,
+)
+from services.response_modes import (
+    IMAGE_FORMAT_PATTERN,
+    MULTIPART_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    RESPONSE_MODE_PATTERN,
+    SSE_HEADERS,
+    SSE_MEDIA_TYPE,
+    ImageOptions,
+    image_part,
+    iter_completed,
+    json_part,
+    merge_streams,
+    multipart_boundary,
+    multipart_stream,
+    ndjson_stream,
+    resolve_response_mode,
+    sse_stream,
+    wants_event_stream,
+)
+from utils.logger import get_logger, log_payload
+from utils.metrics import stage_timer
 
 router = APIRouter()
 logger = get_logger()
 
+STREAM_DESCRIPTION = (
+    "Envia as interpretações em Server-Sent Events (text/event-stream), trecho a "
+    "trecho, à medida que o GPT as gera. Também ativado pelo cabeçalho "
+    "Accept: text/event-stream."
+)
+
+RESPONSE_MODE_DESCRIPTION = (
+    "json: lista JSON com as imagens em base64 (padrão); "
+    "ndjson: uma linha JSON por arquivo, enviada assim que o arquivo termina; "
+    "multipart: multipart/mixed com uma parte JSON e a imagem binária por arquivo; "
+    "boxes: apenas as bounding boxes, sem imagem. "
+    "Sem o parâmetro, o modo é escolhido pelo cabeçalho Accept."
+)
+
+
+@asynccontextmanager
+async def _admission(exam_type: str, images: int):
+    """Reserva `images` vagas do controle de admissão até o fim do bloco."""
+    if exam_type in ai_paths and not is_model_ready(exam_type):
+        rejection = AdmissionRejected("Modelo em carregamento", ADMISSION_RETRY_AFTER_S)
+        raise HTTPException(
+            status_code=503,
+            detail=rejection.detail,
+            headers={"Retry-After": rejection.retry_after},
+        )
+    try:
+        admission_controller.acquire(exam_type, images)
+    except AdmissionRejected as e:
+        logger.warning("Requisição recusada ({} arquivos): {}", images, e.detail)
+        raise HTTPException(
+            status_code=429, detail=e.detail, headers={"Retry-After": e.retry_after}
+        )
+    try:
+        yield
+    finally:
+        admission_controller.release(exam_type, images)
+
+
+async def limit_uploads(files: List[UploadFile] = File(...)) -> List[Tuple[int, int]]:
+    """
+    Limites de tamanho e de pixels dos arquivos enviados (ver UPLOAD_MAX_*).
+
+    Verificados pelo cabeçalho de cada arquivo, antes da admissão e da
+    decodificação: 413 acima dos limites e 415 quando o arquivo não é uma
+    imagem. Retorna a largura e a altura de cada imagem.
+    """
+    try:
+        return await check_uploads(files)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+async def admit_images(exam_type: str, files: List[UploadFile] = File(...)):
+    """
+    Controle de admissão das rotas de análise.
+
+    Responde 503 enquanto o modelo está sendo carregado e 429 quando o
+    worker ou o tipo de exame já tem imagens demais em processamento, sempre
+    com Retry-After. As vagas ficam reservadas até a resposta terminar de ser
+    enviada, inclusive nas respostas em streaming.
+    """
+    async with _admission(exam_type, len(files)):
+        yield
+
+
+async def limit_cine_upload(file: UploadFile = File(...)):
+    """
+    Limite de tamanho do arquivo de /result_cine (CINE_MAX_FILE_MB), verificado
+    antes da admissão e da decodificação dos quadros: 413 acima do limite.
+    """
+    try:
+        await check_cine_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+async def admit_cine(
+    exam_type: str, max_frames: int = Query(CINE_MAX_FRAMES, ge=1, le=CINE_MAX_FRAMES)
+):
+    """
+    Controle de admissão da rota de exames com vários quadros.
+
+    Os quadros passam pelo modelo em lotes de até INFERENCE_MAX_BATCH_SIZE,
+    e o exame reserva as vagas de um lote.
+    """
+    async with _admission(exam_type, min(max_frames, INFERENCE_MAX_BATCH_SIZE)):
+        yield
+
+
+def _to_base64(image_bytes: bytes) -> str:
+    with stage_timer("base64"):
+        return base64.b64encode(image_bytes).decode("utf-8")
+
+
+def _boxes_result(size: Tuple[int, int], predict) -> dict:
+    """Monta o resultado do modo "boxes": tamanho da imagem e bounding boxes."""
+    width, height = size
+    return {
+        "width": width,
+        "height": height,
+        "detections": predict.to_records(with_boxes=True),
+    }
+
+
+def _annotation(files: List[UploadFile], predicts: list, options: ImageOptions):
+    """
+    Retorna a função que anota cada arquivo a partir do upload.
+
+    A imagem em resolução original é decodificada do upload só para a
+    anotação e liberada assim que a imagem anotada está codificada. No
+    máximo UPLOAD_MAX_DECODED_IMAGES imagens da requisição ficam decodificadas
+    ao mesmo tempo, independentemente do número de arquivos.
+    """
+    decoded_images = asyncio.Semaphore(UPLOAD_MAX_DECODED_IMAGES or len(files))
+
+    async def annotated_image(index: int) -> bytes:
+        async with decoded_images:
+            input_image = await load_upload_image(files[index])
+            return await render_annotated_image(input_image, predicts[index], options)
+
+    return annotated_image
+
+
+def _streaming_response(
+    mode: str,
+    filenames: List[str],
+    file_results: list,
+    options: ImageOptions,
+    on_close: Optional[Callable[[], None]] = None,
+) -> StreamingResponse:
+    """
+    Cria a resposta em streaming, enviando cada arquivo assim que termina.
+
+    Args:
+        mode (str): "ndjson" ou "multipart".
+        filenames (List[str]): O nome de cada arquivo enviado.
+        file_results (list): Uma corrotina por arquivo que retorna
+            (payload JSON, bytes da imagem anotada ou None).
+        options (ImageOptions): As opções de codificação das imagens.
+        on_close (Callable, opcional): Chamada ao fim da resposta, inclusive
+            quando o cliente desconecta.
+    """
+
+    async def items():
+        try:
+            async for index, task in iter_completed(file_results):
+                header = {"index": index, "filename": filenames[index]}
+                try:
+                    payload, image_bytes = task.result()
+                except Exception as e:
+                    logger.error(
+                        "Failed to process file {}: {}", filenames[index], str(e)
+                    )
+                    yield {**header, "error": str(e)}, None
+                    continue
+                yield {**header, **payload}, image_bytes
+        finally:
+            if on_close is not None:
+                on_close()
+
+    # Se o cliente desconecta enquanto a resposta aguarda o envio, o gerador
+    # fica suspenso no yield; a tarefa de fundo roda ao fim da resposta em
+    # qualquer caso
+    background = BackgroundTask(on_close) if on_close is not None else None
+
+    if mode == "ndjson":
+
+        async def lines():
+            async for payload, image_bytes in items():
+                if image_bytes is not None:
+                    payload["annotated_image"] = _to_base64(image_bytes)
+                    payload["media_type"] = options.media_type
+                yield payload
+
+        return StreamingResponse(
+            ndjson_stream(lines()), media_type=NDJSON_MEDIA_TYPE, background=background
+        )
+
+    boundary = multipart_boundary()
+
+    async def parts():
+        async for payload, image_bytes in items():
+            yield json_part(payload)
+            if image_bytes is not None:
+                yield image_part(
+                    image_bytes, options, payload["index"], payload["filename"]
+                )
+
+    return StreamingResponse(
+        multipart_stream(parts(), boundary),
+        media_type=f"{MULTIPART_MEDIA_TYPE}; boundary={boundary}",
+        background=background,
+    )
+
+
 @router.post(
     "/{exam_type}/result_full",
     tags=["Analise"],
+    dependencies=[Depends(limit_uploads), Depends(admit_images)],
     summary="Retorna dados da análise, interpretação clínica e imagem com as detecções.",
 )
-async def complete_analysis(exam_type: str, files: List[UploadFile] = File(...)):
+async def complete_analysis(
+    exam_type: str,
+    files: List[UploadFile] = File(...),
+    image_sizes: List[Tuple[int, int]] = Depends(limit_uploads),
+    response_mode: Optional[str] = Query(
+        None, regex=RESPONSE_MODE_PATTERN, description=RESPONSE_MODE_DESCRIPTION
+    ),
+    image_format: str = Query("jpeg", regex=IMAGE_FORMAT_PATTERN),
+    quality: int = Query(85, ge=1, le=100),
+    preview_size: Optional[int] = Query(None, ge=16),
+    accept: Optional[str] = Header(None),
+):
     """
     Object Detection, Clinical Interpretation and Annotated Image for multiple files.
 
     Args:
         exam_type (str): The type of exam being analyzed (ex: "ecg_signal").
         files (List[UploadFile]): List of image files in bytes format.
+        response_mode (str, optional): "json", "ndjson", "multipart" or "boxes".
+        image_format (str, optional): Annotated image format: "jpeg", "webp" or "png".
+        quality (int, optional): Annotated image quality for lossy formats.
+        preview_size (int, optional): Maximum dimension of the annotated image.
 
     Returns:
         list: List of JSON objects containing the Objects Detections, Clinical Interpretation, and Annotated Image for each file.
     """
-    results = []
+    mode = resolve_response_mode(response_mode, accept)
+    options = ImageOptions(image_format, quality, preview_size)
+    interpretations, streaming = None, False
     try:
-        for file in files:
-            # Inicializa o dicionário de resultados
-            result = {"data": None, "clinical_interpretation": None, "annotated_image": None}
-
-            # Converte o arquivo de imagem para um objeto de imagem
-            input_image = get_image_from_bytes(await file.read())
-
-            # Predição do modelo
-            predict = detect_sample_model(input_image, exam_type)
-
-            # Seleciona as informações de detecção de objetos
-            detect_res = predict[["name", "confidence"]]
-            detect_objects_json = json.loads(detect_res.to_json(orient="records"))
-            result["data"] = {
-                "exam_type": exam_type,
-                "analysis_results": detect_objects_json
+        # Converte os arquivos de imagem e faz a predição do modelo em lotes
+        # (ver UPLOAD_CHUNK_FILES); apenas as detecções ficam em memória
+        predicts = await detect_uploads(files, exam_type)
+        annotated_image = _annotation(files, predicts, options)
+
+        records = [predict.to_records() for predict in predicts]
+        # As interpretações de todos os arquivos são obtidas juntas (ver
+        # INTERPRETATION_BATCH_ENABLED) e compartilhadas entre os arquivos
+        interpretations = SharedInterpretations(records, exam_type)
+
+        async def file_result(index: int):
+            predict = predicts[index]
+            detect_objects_json = records[index]
+            payload = {
+                "data": {
+                    "exam_type": exam_type,
+                    "analysis_results": detect_objects_json,
+                },
+                "clinical_interpretation": None,
             }
-
-            # Obtem a interpretação clínica do GPT
-            prompt = (
-                "Descreva em um único parágrafo simples a interpretação clínica dos dados fornecidos. "
-                "Faça isso em português. "
-                "O retorno deve ser um único parágrafo. "
-                "Dados: " + str(detect_objects_json)
+            interpretation = interpretations.get(index)
+            if mode == "boxes":
+                payload["clinical_interpretation"] = await interpretation
+                payload["boxes"] = _boxes_result(image_sizes[index], predict)
+                return payload, None
+
+            # Obtem a interpretação clínica do GPT enquanto a imagem é anotada
+            payload["clinical_interpretation"], image_bytes = await asyncio.gather(
+                interpretation, annotated_image(index)
             )
-
-            response = client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": "Output the response as a single, simple paragraph in Portuguese."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5,
+            return payload, image_bytes
+
+        if mode in ("ndjson", "multipart"):
+            # A resposta encerra as interpretações ao terminar de ser enviada
+            streaming = True
+            return _streaming_response(
+                mode,
+                [file.filename for file in files],
+                [file_result(index) for index in range(len(files))],
+                options,
+                on_close=interpretations.close,
             )
 
-            message_content = response.choices[0].message.content
-            result["clinical_interpretation"] = message_content
-
-            # Adiciona as bounding boxes na imagem
-            final_image = add_bboxs_on_img(image=input_image, predict=predict)
-
-            # Codifica a imagem em base64
-            image_base64 = encode_image_to_base64(final_image)
-            result["annotated_image"] = image_base64
+        results = []
+        for payload, image_bytes in await asyncio.gather(
+            *(file_result(index) for index in range(len(files)))
+        ):
+            if image_bytes is not None:
+                payload["annotated_image"] = _to_base64(image_bytes)
 
             # Adiciona o resultado à lista de resultados
-            results.append(result)
+            results.append(payload)
 
         # Log dos resultados e retorno
-        logger.info("results: %s", results)
+        log_payload("results", results)
 
         return results
 
     except Exception as e:
-        logger.error("Failed to process complete analysis: %s", str(e))
+        logger.error("Failed to process complete analysis: {}", str(e))
         raise HTTPException(status_code=500, detail=f"Error processing the complete analysis: {str(e)}")
+    finally:
+        if interpretations is not None and not streaming:
+            interpretations.close()
 
 @router.post(
     "/{exam_type}/result_object",
     tags=["Analise"],
+    dependencies=[Depends(limit_uploads), Depends(admit_images)],
     summary="Retorna os dados da análise",
 )
 async def img_object_detection_to_json(exam_type: str, files: List[UploadFile] = File(...)):
@@ -104,130 +371,265 @@ async def img_object_detection_to_json(exam_type: str, files: List[UploadFile] =
     """
     results = []
     try:
-        for file in files:
+        # Converte os arquivos de imagem e faz a predição do modelo em lotes
+        predicts = await detect_uploads(files, exam_type)
+
+        for predict in predicts:
             # Inicializa o dicionário de resultados
             result = {"detect_objects": None}
 
-            # Converte o arquivo de imagem para um objeto de imagem
-            input_image = get_image_from_bytes(await file.read())
-
-            # Predição do modelo
-            predict = detect_sample_model(input_image, exam_type)
-
             # Seleciona as informações de detecção de objetos
-            detect_res = predict[["name", "confidence"]]
-            objects = detect_res["name"].values
-
-            result["detect_objects_names"] = ", ".join(objects)
-            result["detect_objects"] = json.loads(detect_res.to_json(orient="records"))
+            result["detect_objects_names"] = ", ".join(predict.labels)
+            result["detect_objects"] = predict.to_records()
 
             # Adiciona o resultado à lista de resultados
             results.append(result)
 
         # Log dos resultados e retorno
-        logger.info("results: %s", results)
+        log_payload("results", results)
 
         return results
 
     except Exception as e:
-        logger.error("Failed to process image for object detection: %s", str(e))
+        logger.error("Failed to process image for object detection: {}", str(e))
         raise HTTPException(status_code=500, detail="Error processing the image")
 
 @router.post(
     "/{exam_type}/result_img",
     tags=["Analise"],
+    dependencies=[Depends(limit_uploads), Depends(admit_images)],
     summary="Gera uma imagem com objetos detectados anotados.",
 )
-async def img_object_detection_to_img(exam_type: str, files: List[UploadFile] = File(...)):
+async def img_object_detection_to_img(
+    exam_type: str,
+    files: List[UploadFile] = File(...),
+    image_sizes: List[Tuple[int, int]] = Depends(limit_uploads),
+    response_mode: Optional[str] = Query(
+        None, regex=RESPONSE_MODE_PATTERN, description=RESPONSE_MODE_DESCRIPTION
+    ),
+    image_format: str = Query("jpeg", regex=IMAGE_FORMAT_PATTERN),
+    quality: int = Query(85, ge=1, le=100),
+    preview_size: Optional[int] = Query(None, ge=16),
+    accept: Optional[str] = Header(None),
+):
     """
     Object Detection from multiple images and plot bbox on images.
 
     Args:
         exam_type (str): The type of exam being analyzed (ex: "ecg_signal").
         files (List[UploadFile]): List of image files in bytes format.
+        response_mode (str, optional): "json", "ndjson", "multipart" or "boxes".
+        image_format (str, optional): Annotated image format: "jpeg", "webp" or "png".
+        quality (int, optional): Annotated image quality for lossy formats.
+        preview_size (int, optional): Maximum dimension of the annotated image.
 
     Returns:
         list: List of images in bytes with bbox annotations.
     """
+    mode = resolve_response_mode(response_mode, accept)
+    options = ImageOptions(image_format, quality, preview_size)
     try:
-        result_images = []
-
         for file in files:
-            try:
-                # Converte o arquivo de imagem para um objeto de imagem
-                logger.info(f"Processing file: {file.filename}")
-                input_image = get_image_from_bytes(await file.read())
-
-                # Predição do modelo
-                predict = detect_sample_model(input_image, exam_type)
-                logger.info(f"Prediction for {file.filename}: {predict}")
-
-                # Adiciona as bounding boxes na imagem
-                final_image = add_bboxs_on_img(image=input_image, predict=predict)
-
-                # Codifica a imagem em base64
-                image_base64 = encode_image_to_base64(final_image)
-                result_images.append(image_base64)
+            logger.info(f"Processing file: {file.filename}")
+
+        # Converte os arquivos de imagem e faz a predição do modelo em lotes
+        predicts = await detect_uploads(files, exam_type)
+
+        if mode == "boxes":
+            # Apenas as detecções; o cliente desenha as bounding boxes
+            results = [
+                {"filename": file.filename, **_boxes_result(size, predict)}
+                for file, size, predict in zip(files, image_sizes, predicts)
+            ]
+            log_payload("results", results)
+            return results
+
+        annotated_image = _annotation(files, predicts, options)
+
+        async def file_result(index: int):
+            logger.info(f"Prediction for {files[index].filename}: {predicts[index]}")
+            # Adiciona as bounding boxes na imagem e codifica no formato pedido
+            return {}, await annotated_image(index)
+
+        if mode in ("ndjson", "multipart"):
+            return _streaming_response(
+                mode,
+                [file.filename for file in files],
+                [file_result(index) for index in range(len(files))],
+                options,
+            )
 
-            except Exception as file_error:
-                logger.error(f"Failed to process file {file.filename}: {str(file_error)}")
+        result_images = []
+        outcomes = await asyncio.gather(
+            *(file_result(index) for index in range(len(files))),
+            return_exceptions=True,
+        )
+        for file, outcome in zip(files, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Failed to process file {file.filename}: {str(outcome)}")
                 raise HTTPException(status_code=500, detail=f"Error processing file {file.filename}")
+            _, image_bytes = outcome
+            result_images.append(_to_base64(image_bytes))
 
         # Log dos resultados e retorno
-        logger.info("results: %s", result_images)
+        log_payload("results", result_images)
         return JSONResponse(content=result_images)
 
     except Exception as e:
-        logger.error("Failed to annotate images with bounding boxes: %s", str(e))
+        logger.error("Failed to annotate images with bounding boxes: {}", str(e))
         raise HTTPException(status_code=500, detail="Error annotating the images")
 
+@router.post(
+    "/{exam_type}/result_cine",
+    tags=["Analise"],
+    dependencies=[Depends(limit_cine_upload), Depends(admit_cine)],
+    summary="Retorna as detecções de cada quadro de um cine e o resumo do exame.",
+)
+async def cine_analysis(
+    exam_type: str,
+    file: UploadFile = File(...),
+    frame_stride: int = Query(
+        CINE_FRAME_STRIDE, ge=1, description="Analisa um a cada N quadros"
+    ),
+    max_frames: int = Query(CINE_MAX_FRAMES, ge=1, le=CINE_MAX_FRAMES),
+    dedupe_distance: int = Query(
+        CINE_DEDUPE_MAX_DISTANCE,
+        ge=-1,
+        le=256,
+        description=(
+            "Bits de diferença no dHash até os quais um quadro é repetido"
+            " (-1 = desativa)"
+        ),
+    ),
+):
+    """
+    Object Detection for a multi-frame study (cine loop).
+
+    Args:
+        exam_type (str): The type of exam being analyzed (ex: "ecg_signal").
+        file (UploadFile): A video, a multi-frame image (GIF, TIFF, WebP) or a zip
+            of frames.
+        frame_stride (int, optional): Analyze one of every N frames.
+        max_frames (int, optional): Maximum number of frames sent to the model.
+        dedupe_distance (int, optional): Frames whose perceptual hash differs
+            from the last analyzed frame by at most this many bits are skipped.
+
+    Returns:
+        dict: The detections of each analyzed frame and the study summary per class.
+    """
+    try:
+        # O arquivo é lido do upload em disco, quadro a quadro
+        result = await analyze_cine(
+            file.file,
+            file.filename,
+            exam_type,
+            frame_stride,
+            max_frames,
+            CINE_MAX_DECODED_FRAMES,
+            dedupe_distance,
+            INFERENCE_MAX_BATCH_SIZE,
+        )
+        log_payload("results", result)
+        return result
+
+    except CineFormatError as e:
+        logger.error("Unsupported multi-frame file {}: {}", file.filename, str(e))
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to process multi-frame study: {}", str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing the multi-frame study: {str(e)}",
+        )
+
+
+def _interpretation_events(
+    exam_type: str, filenames: List[str], detections: List[List[dict]]
+):
+    """
+    Eventos SSE das interpretações de todos os arquivos, gerados em paralelo.
+
+    Cada trecho gera um evento "token" ({"index", "text"}); cada arquivo
+    termina com "interpretation" (o mesmo objeto da resposta JSON, com
+    "index" e "filename") ou "error", e a resposta termina com "done".
+    """
+
+    async def events():
+        results = [None] * len(filenames)
+        parts = [[] for _ in filenames]
+        streams = [
+            stream_clinical_interpretation(records, exam_type) for records in detections
+        ]
+        async for index, text, error in merge_streams(streams):
+            header = {"index": index, "filename": filenames[index]}
+            if text is not None:
+                parts[index].append(text)
+                yield "token", {"index": index, "text": text}
+            elif error is not None:
+                logger.error(
+                    "Failed to process file {}: {}", filenames[index], str(error)
+                )
+                yield "error", {**header, "detail": str(error)}
+            else:
+                results[index] = {
+                    "exam_type": exam_type,
+                    "clinical_interpretation": "".join(parts[index]),
+                }
+                yield "interpretation", {**header, **results[index]}
+        log_payload("results", results)
+        yield "done", {"files": len(filenames)}
+
+    return events()
+
+
 @router.post(
     "/{exam_type}/result_interpretation",
     tags=["Analise"],
+    dependencies=[Depends(limit_uploads), Depends(admit_images)],
     summary="Retorna apenas a interpretação clínica dos dados fornecidos.",
 )
-async def clinical_interpretation(exam_type: str, files: List[UploadFile] = File(...)):
+async def clinical_interpretation(
+    exam_type: str,
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(False, description=STREAM_DESCRIPTION),
+    accept: Optional[str] = Header(None),
+):
     """
     Clinical Interpretation for multiple files.
 
     Args:
         exam_type (str): The type of exam being analyzed (ex: "ecg_signal").
         files (List[UploadFile]): List of image files in bytes format.
+        stream (bool, optional): Stream the interpretations as Server-Sent Events.
 
     Returns:
         list: List of JSON objects containing the Clinical Interpretation for each file.
     """
     results = []
     try:
-        for file in files:
-            # Converte o arquivo de imagem para um objeto de imagem
-            input_image = get_image_from_bytes(await file.read())
-
-            # Predição do modelo
-            predict = detect_sample_model(input_image, exam_type)
-
-            # Seleciona as informações de detecção de objetos
-            detect_res = predict[["name", "confidence"]]
-            detect_objects_json = json.loads(detect_res.to_json(orient="records"))
-
-            # Obtem a interpretação clínica do GPT
-            prompt = (
-                "Descreva em um único parágrafo simples a interpretação clínica dos dados fornecidos. "
-                "Faça isso em português. "
-                "O retorno deve ser um único parágrafo. "
-                "Dados: " + str(detect_objects_json)
+        # Converte os arquivos de imagem e faz a predição do modelo em lotes
+        predicts = await detect_uploads(files, exam_type)
+
+        # Seleciona as informações de detecção de objetos
+        detections = [predict.to_records() for predict in predicts]
+
+        if wants_event_stream(stream, accept):
+            # Uma chamada por arquivo, para que cada interpretação chegue trecho
+            # a trecho
+            return StreamingResponse(
+                sse_stream(
+                    _interpretation_events(
+                        exam_type, [file.filename for file in files], detections
+                    )
+                ),
+                media_type=SSE_MEDIA_TYPE,
+                headers=SSE_HEADERS,
             )
 
-            response = client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": "Output the response as a single, simple paragraph in Portuguese."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5,
-            )
+        # Obtem as interpretações clínicas do GPT de todos os arquivos (em lote)
+        interpretations = await get_clinical_interpretations(detections, exam_type)
 
-            message_content = response.choices[0].message.content
+        for message_content in interpretations:
             result = {
                 "exam_type": exam_type,
                 "clinical_interpretation": message_content
@@ -237,10 +639,10 @@ async def clinical_interpretation(exam_type: str, files: List[UploadFile] = File
             results.append(result)
 
         # Log dos resultados e retorno
-        logger.info("results: %s", results)
+        log_payload("results", results)
 
         return results
 
     except Exception as e:
-        logger.error("Failed to process clinical interpretation: %s", str(e))
+        logger.error("Failed to process clinical interpretation: {}", str(e))
         raise HTTPException(status_code=500, detail=f"Error processing the clinical interpretation: {str(e)}")
@@ -1,50 +1,65 @@
-from fastapi import APIRouter, HTTPException
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from services.gpt_services import get_chat_interpretation, stream_chat_interpretation
+from services.response_modes import (
+    SSE_HEADERS,
+    SSE_MEDIA_TYPE,
+    sse_stream,
+    wants_event_stream,
+)
+from utils.logger import get_logger
 
 router = APIRouter()
+logger = get_logger()
+
+STREAM_DESCRIPTION = (
+    "Envia a resposta em Server-Sent Events (text/event-stream), trecho a trecho, "
+    "à medida que o GPT a gera. Também ativado pelo cabeçalho "
+    "Accept: text/event-stream."
+)
 
-# Carrega as variáveis de ambiente
-load_dotenv()
 
-# Recupera a chave da API de um arquivo .env
-api_key = os.getenv("OPENAI_API_KEY")
+async def _chat_events(detection_results: dict):
+    # Eventos "token" com cada trecho, seguidos de "done" com a resposta completa
+    parts = []
+    try:
+        async for text in stream_chat_interpretation(detection_results):
+            parts.append(text)
+            yield "token", {"text": text}
+    except Exception as e:
+        logger.error("Failed to stream ChatGPT response: {}", str(e))
+        yield "error", {"detail": f"Failed to communicate with ChatGPT API: {str(e)}"}
+        return
+    yield "done", {"response": "".join(parts)}
 
-# Inicializa o cliente com a chave da API
-client = OpenAI(api_key=api_key)
 
 @router.post("/chat", tags=["Chat Genius"], summary="Converse com Genius")
-async def chat_with_gpt(detection_results: dict):
+async def chat_with_gpt(
+    detection_results: dict,
+    stream: bool = Query(False, description=STREAM_DESCRIPTION),
+    accept: Optional[str] = Header(None),
+):
     """
     Recebe um prompt de texto e retorna uma resposta do modelo GPT-4 Turbo.
 
     Args:
         detection_results (dict): JSON object containing detection results.
+        stream (bool, optional): Stream the response as Server-Sent Events.
 
     Returns:
         dict: Resposta do ChatGPT em formato JSON.
     """
-    prompt = (
-        "descreva em um único parágrafo simples a interpretação clínica dos dados de ECG fornecidos, "
-        "Faça isso em português. "
-        "o retorno deve ser um unico paragrafo"
-        "Dados de ECG: " + str(detection_results)
-    )
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "Output the response as a single, simple paragraph in Portuguese."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,  # Menor temperatura para maior coerência e precisão
-            #max_tokens=150  # Reduzindo o número de tokens para limitar a extensão da resposta
+    if wants_event_stream(stream, accept):
+        return StreamingResponse(
+            sse_stream(_chat_events(detection_results)),
+            media_type=SSE_MEDIA_TYPE,
+            headers=SSE_HEADERS,
         )
-
-        message_content = response.choices[0].message.content
-        #print('resposta GPT:', message_content)
+    try:
+        message_content = await get_chat_interpretation(detection_results)
         return {"response": message_content}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to communicate with ChatGPT API: {str(e)}")
@@ -1,4 +1,20 @@
+import math
+
 from fastapi import APIRouter, HTTPException
+from starlette.responses import JSONResponse
+
+from config import ADMISSION_RETRY_AFTER_S, READY_MAX_QUEUE_DEPTH
+from services.admission import admission_controller
+from services.ai_services import (
+    detection_cache,
+    inference_pool,
+    inference_scheduler,
+    is_model_warm,
+    preload_exam_types,
+    preload_finished,
+)
+from services.gpt_services import interpretation_cache
+from utils.startup import startup_timer
 
 router = APIRouter()
 
@@ -27,3 +43,116 @@ async def health_check():
         return {"status": "alive", "database": "online", "third_party_api": "reachable"}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Service Unavailable: {str(e)}")
+
+
+@router.get("/ready", tags=["Healthcheck"], summary="Readiness do worker")
+async def readiness():
+    """
+    Indica se o worker deve receber tráfego do balanceador.
+
+    O worker não está pronto enquanto os modelos de MODEL_PRELOAD não foram
+    aquecidos, quando atingiu o limite de imagens em processamento ou quando
+    a fila do micro-batching passa de READY_MAX_QUEUE_DEPTH imagens. Nesses
+    casos a resposta é 503 com Retry-After.
+
+    Returns:
+        dict: O estado de cada verificação.
+    """
+    queue_depth = sum(
+        stats["queue_depth"] for stats in inference_scheduler.stats()["models"].values()
+    )
+    admission = admission_controller.stats()
+    checks = {
+        "models_warm": preload_finished.is_set(),
+        "not_saturated": not admission_controller.saturated(),
+        "queue_below_limit": queue_depth <= READY_MAX_QUEUE_DEPTH,
+    }
+    ready = all(checks.values())
+    content = {
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "models": {
+            exam_type: is_model_warm(exam_type)
+            for exam_type in preload_exam_types()
+        },
+        "in_flight_images": admission["in_flight_images"],
+        "max_in_flight_images": admission["max_images"],
+        "queue_depth": queue_depth,
+    }
+    if ready:
+        return content
+    return JSONResponse(
+        status_code=503,
+        content=content,
+        headers={"Retry-After": str(max(1, math.ceil(ADMISSION_RETRY_AFTER_S)))},
+    )
+
+
+@router.get(
+    "/health/admission",
+    tags=["Healthcheck"],
+    summary="Estatísticas do controle de admissão",
+)
+async def admission_stats():
+    """
+    Retorna as imagens em processamento e os contadores de requisições
+    aceitas e recusadas pelo controle de admissão neste worker.
+    """
+    return admission_controller.stats()
+
+
+@router.get(
+    "/health/startup",
+    tags=["Healthcheck"],
+    summary="Tempo de inicialização do worker",
+)
+async def startup_stats():
+    """
+    Retorna o tempo até o worker aceitar requisições e a duração de cada
+    fase da inicialização (importações, geração do OpenAPI, aquecimento dos
+    modelos e workers de jobs), em milissegundos.
+    """
+    return startup_timer.report()
+
+
+@router.get(
+    "/health/batching", tags=["Healthcheck"], summary="Estatísticas do micro-batching"
+)
+async def batching_stats():
+    """
+    Retorna a profundidade das filas e as estatísticas de tamanho de lote do
+    agendador de micro-batching, por modelo, para ajuste de
+    INFERENCE_MAX_BATCH_SIZE e MICRO_BATCH_MAX_WAIT_MS.
+
+    Returns:
+        dict: Estatísticas do agendador neste worker.
+    """
+    return inference_scheduler.stats()
+
+
+@router.get(
+    "/health/inference-workers", tags=["Healthcheck"], summary="Processos de inferência"
+)
+async def inference_worker_stats():
+    """
+    Retorna o estado dos processos de inferência (INFERENCE_WORKERS): núcleos,
+    tipos de exame atendidos, modelos residentes, lotes e reinícios.
+    """
+    if not inference_pool.enabled:
+        return {"enabled": False, "workers": []}
+    return {"enabled": True, **inference_pool.stats()}
+
+
+@router.get("/health/cache", tags=["Healthcheck"], summary="Estatísticas dos caches")
+async def cache_stats():
+    """
+    Retorna os contadores de acerto e falha dos caches de detecção e de
+    interpretações clínicas neste worker.
+
+    Returns:
+        dict: Estatísticas de cada cache.
+    """
+    return {
+        "detections": detection_cache.stats(),
+        "interpretations": interpretation_cache.stats(),
+    }
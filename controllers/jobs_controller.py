@@ -0,0 +1,147 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from starlette.responses import JSONResponse
+
+from services.ai_services import ai_paths
+from services.executors import run_in_stage
+from services.ingestion import UploadRejected, check_uploads
+from services.job_store import FINISHED_STATUSES
+from services.jobs import ANALYSIS_PATTERN, job_runner, job_store
+from services.response_modes import IMAGE_FORMAT_PATTERN
+from utils.logger import get_logger
+
+router = APIRouter()
+logger = get_logger()
+
+
+def _job_summary(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "exam_type": job["exam_type"],
+        "analysis": job["analysis"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "failed": job["failed"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+async def _get_job(job_id: str) -> dict:
+    job = await run_in_stage("jobs", job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@router.post(
+    "/analise/{exam_type}/jobs",
+    tags=["Jobs"],
+    summary=(
+        "Enfileira uma análise de vários arquivos e retorna o identificador do job."
+    ),
+    status_code=202,
+)
+async def submit_job(
+    exam_type: str,
+    files: List[UploadFile] = File(...),
+    analysis: str = Query(
+        "full",
+        regex=ANALYSIS_PATTERN,
+        description=(
+            "full, object, img ou interpretation (equivalentes às rotas result_*)"
+        ),
+    ),
+    image_format: str = Query("jpeg", regex=IMAGE_FORMAT_PATTERN),
+    quality: int = Query(85, ge=1, le=100),
+    preview_size: Optional[int] = Query(None, ge=16),
+):
+    """
+    Submit an asynchronous analysis job.
+
+    Args:
+        exam_type (str): The type of exam being analyzed (ex: "ecg_signal").
+        files (List[UploadFile]): List of image files in bytes format.
+        analysis (str, optional): "full", "object", "img" or "interpretation".
+        image_format (str, optional): Annotated image format: "jpeg", "webp" or "png".
+        quality (int, optional): Annotated image quality for lossy formats.
+        preview_size (int, optional): Maximum dimension of the annotated image.
+
+    Returns:
+        dict: The job identifier and the URLs to poll its status and results.
+    """
+    if exam_type not in ai_paths:
+        raise HTTPException(status_code=400, detail="Modelo não suportado")
+    try:
+        await check_uploads(files)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # Os arquivos são copiados dos uploads em disco para o banco, um de cada vez
+    uploads = [(file.filename, file.file) for file in files]
+    options = {
+        "image_format": image_format,
+        "quality": quality,
+        "preview_size": preview_size,
+    }
+    job_id = await run_in_stage(
+        "jobs", job_store.create, exam_type, analysis, options, uploads
+    )
+    job_runner.notify()
+    logger.info(
+        "Job {} enfileirado: {} arquivos de {}", job_id, len(uploads), exam_type
+    )
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "results_url": f"/jobs/{job_id}/results",
+        },
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+
+@router.get(
+    "/jobs/{job_id}", tags=["Jobs"], summary="Retorna o estado e o progresso de um job."
+)
+async def get_job(job_id: str):
+    return _job_summary(await _get_job(job_id))
+
+
+@router.get(
+    "/jobs/{job_id}/results",
+    tags=["Jobs"],
+    summary=(
+        "Retorna os resultados dos arquivos já processados, "
+        "inclusive durante a execução."
+    ),
+)
+async def get_job_results(job_id: str):
+    job = await _get_job(job_id)
+    results = await run_in_stage("jobs", job_store.results, job_id)
+    return {**_job_summary(job), "results": results}
+
+
+@router.post(
+    "/jobs/{job_id}/cancel",
+    tags=["Jobs"],
+    summary="Cancela um job na fila ou em execução.",
+)
+async def cancel_job(job_id: str):
+    job = await _get_job(job_id)
+    if job["status"] in FINISHED_STATUSES:
+        raise HTTPException(
+            status_code=409, detail=f"Job já encerrado ({job['status']})"
+        )
+
+    await run_in_stage("jobs", job_store.cancel, job_id)
+    # Se o job estiver em outro processo, o heartbeat dele percebe o cancelamento
+    job_runner.cancel(job_id)
+    return _job_summary(await _get_job(job_id))
@@ -0,0 +1,107 @@
+from typing import List
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from services.admission import admission_controller
+from services.ai_services import (
+    ai_paths,
+    detection_cache,
+    inference_pool,
+    inference_scheduler,
+    model_registry,
+)
+from services.gpt_services import interpretation_cache
+from utils.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge
+
+router = APIRouter()
+
+
+def _collect_caches() -> List[Counter]:
+    lookups = Counter(
+        "app_cache_lookups_total",
+        "Consultas aos caches por resultado.",
+        ("cache", "result"),
+    )
+    entries = Gauge(
+        "app_cache_entries", "Entradas armazenadas em cada cache.", ("cache",)
+    )
+
+    detections = detection_cache.stats()
+    for result in ("hits", "misses", "coalesced"):
+        lookups.labels(cache="detections", result=result).set(detections[result])
+    entries.labels(cache="detections").set(detections["entries"])
+
+    interpretations = interpretation_cache.stats()
+    for result in ("hits_memory", "hits_disk", "misses"):
+        lookups.labels(cache="interpretations", result=result).set(
+            interpretations[result]
+        )
+    entries.labels(cache="interpretations").set(interpretations["entries"])
+    return [lookups, entries]
+
+
+def _collect_models() -> List[Gauge]:
+    resident = Gauge(
+        "app_model_resident",
+        "1 se o modelo está carregado neste worker.",
+        ("exam_type",),
+    )
+    # Com processos de inferência, os modelos ficam nos processos do pool
+    registry = inference_pool if inference_pool.enabled else model_registry
+    loaded = set(registry.resident())
+    for exam_type in ai_paths:
+        resident.labels(exam_type=exam_type).set(int(exam_type in loaded))
+    memory = Gauge(
+        "app_models_memory_bytes", "Memória estimada dos modelos residentes."
+    )
+    memory.labels().set(registry.memory_bytes())
+    return [resident, memory]
+
+
+def _collect_batching() -> List[Gauge]:
+    depth = Gauge(
+        "app_batch_queue_depth",
+        "Imagens aguardando lote no micro-batching.",
+        ("exam_type",),
+    )
+    batches = Counter("app_batches_total", "Lotes enviados ao modelo.", ("exam_type",))
+    for exam_type, stats in inference_scheduler.stats()["models"].items():
+        depth.labels(exam_type=exam_type).set(stats["queue_depth"])
+        batches.labels(exam_type=exam_type).set(stats["batches"])
+    return [depth, batches]
+
+
+def _collect_admission() -> List[Counter]:
+    stats = admission_controller.stats()
+    in_flight = Gauge(
+        "app_admission_in_flight_images",
+        "Imagens admitidas e ainda em processamento.",
+    )
+    in_flight.labels().set(stats["in_flight_images"])
+    rejected = Counter(
+        "app_admission_rejected_total",
+        "Requisições recusadas com 429 por limite do worker ou do tipo de exame.",
+        ("reason",),
+    )
+    for reason in ("worker", "exam_type"):
+        rejected.labels(reason=reason).set(stats["rejected"].get(reason, 0))
+    return [in_flight, rejected]
+
+
+REGISTRY.add_collector(_collect_caches)
+REGISTRY.add_collector(_collect_models)
+REGISTRY.add_collector(_collect_batching)
+REGISTRY.add_collector(_collect_admission)
+
+
+@router.get(
+    "/metrics", tags=["Healthcheck"], summary="Métricas no formato do Prometheus"
+)
+async def metrics():
+    """
+    Retorna as métricas deste worker no formato de texto do Prometheus:
+    latência por etapa, endpoint e exam_type, requisições em andamento,
+    imagens processadas, erros, caches, modelos residentes e micro-batching.
+    """
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,60 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from starlette.responses import JSONResponse
+
+from config import PROFILING_DIR, PROFILING_MAX_PROFILES, PROFILING_TOKEN
+from utils.profiling import ProfileStore
+
+router = APIRouter()
+
+# Perfis das requisições de /analise (ver ProfilingMiddleware no main.py)
+profile_store = ProfileStore(PROFILING_MAX_PROFILES, PROFILING_DIR)
+
+
+def require_profiling_token(x_profile_token: Optional[str] = Header(None)):
+    """Exige o cabeçalho X-Profile-Token com o PROFILING_TOKEN configurado."""
+    if not PROFILING_TOKEN or not hmac.compare_digest(
+        (x_profile_token or "").encode(), PROFILING_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Token de perfilamento inválido")
+
+
+@router.get(
+    "/admin/profiles",
+    tags=["Admin"],
+    summary="Lista os perfis de requisições deste worker",
+    dependencies=[Depends(require_profiling_token)],
+)
+async def list_profiles():
+    """
+    Retorna o resumo dos últimos perfis, do mais recente para o mais antigo:
+    rota, status, duração e o tempo total de cada etapa.
+    """
+    return {"profiles": profile_store.list()}
+
+
+@router.get(
+    "/admin/profiles/{profile_id}",
+    tags=["Admin"],
+    summary="Retorna um perfil no formato do speedscope",
+    dependencies=[Depends(require_profiling_token)],
+)
+async def get_profile(profile_id: str):
+    """
+    Retorna o perfil da requisição com o X-Profile-Id informado, para abrir
+    em https://www.speedscope.app: a linha do tempo das etapas por thread e
+    as pilhas amostradas das threads do pool.
+    """
+    document = profile_store.get(profile_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return JSONResponse(
+        document,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="profile-{profile_id}.speedscope.json"'
+            )
+        },
+    )
@@ -1,4 +1,8 @@
+# Marca o início da importação do main, antes das importações pesadas
+from utils.startup import startup_timer
+
 import json
+import threading
 from loguru import logger
 
 from fastapi import FastAPI, File, status
@@ -8,6 +12,27 @@ from fastapi.middleware.cors import CORSMiddleware
 from controllers.detection_controller import router as detection_router
 from controllers.healthcheck_controller import router as healthcheck_router
 from controllers.gpt_controller import router as gpt_router
+from controllers.jobs_controller import router as jobs_router
+from controllers.metrics_controller import router as metrics_router
+from controllers.profiling_controller import profile_store, router as profiling_router
+from services import executors, gpt_services
+from config import (
+    MODEL_PRELOAD_BLOCKING,
+    OPENAPI_EXPORT_ON_STARTUP,
+    OPENAPI_JSON_PATH,
+    PROFILING_INTERVAL_MS,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_TOKEN,
+    STARTUP_BUDGET_MS,
+    UPLOAD_MAX_REQUEST_MB,
+)
+from services.ai_services import ai_paths, inference_pool, preload_models
+from services.ingestion import UploadLimitMiddleware
+from services.jobs import job_runner
+from utils.metrics import MetricsMiddleware
+from utils.profiling import ProfilingMiddleware
+
+startup_timer.mark("imports")
 
 
 ###################### FastAPI Setup #############################
@@ -20,6 +45,9 @@ app = FastAPI(
     version="2024.5.01",
 )
 
+# Recusa com 413 as requisições acima de UPLOAD_MAX_REQUEST_MB, antes de ler o corpo
+app.add_middleware(UploadLimitMiddleware, max_bytes=int(UPLOAD_MAX_REQUEST_MB * 2**20))
+
 # This function is needed if you want to allow client requests
 # from specific domains (specified in the origins argument)
 # to access resources from the FastAPI server,
@@ -34,6 +62,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latência por etapa, requisições em andamento e demais métricas em /metrics
+app.add_middleware(MetricsMiddleware, exam_types=ai_paths)
+
+# Perfilamento das requisições de /analise com X-Profile-Token ou por sorteio;
+# sem PROFILING_TOKEN e PROFILING_SAMPLE_RATE o middleware não é instalado
+if PROFILING_TOKEN or PROFILING_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        token=PROFILING_TOKEN,
+        sample_rate=PROFILING_SAMPLE_RATE,
+        interval_s=PROFILING_INTERVAL_MS / 1000,
+    )
+
 
 @app.on_event("startup")
 def save_openapi_json():
@@ -43,11 +85,76 @@ def save_openapi_json():
     a permanent and offline record of the API specification,
     which can be used for documentation purposes or
     to generate client libraries. It is not necessarily needed,
-    but can be helpful in certain scenarios."""
-    openapi_data = app.openapi()
-    # Change "openapi.json" to desired filename
-    with open("openapi.json", "w") as file:
-        json.dump(openapi_data, file)
+    but can be helpful in certain scenarios.
+
+    O arquivo é gerado no build com `python tools/export_openapi.py`; gerar o
+    schema a cada inicialização só acontece com OPENAPI_EXPORT_ON_STARTUP=1."""
+    if not OPENAPI_EXPORT_ON_STARTUP:
+        return
+    with startup_timer.phase("openapi"):
+        openapi_data = app.openapi()
+        with open(OPENAPI_JSON_PATH, "w") as file:
+            json.dump(openapi_data, file)
+
+
+@app.on_event("startup")
+def start_inference_pool():
+    """Inicia os processos de inferência (INFERENCE_WORKERS), que carregam os
+    modelos fora do processo da API."""
+    if inference_pool.enabled:
+        with startup_timer.phase("inference_pool"):
+            inference_pool.start()
+
+
+def _warm_up():
+    with startup_timer.phase("warm_up"):
+        preload_models()
+        gpt_services.import_client_stack()
+
+
+@app.on_event("startup")
+def warm_up_models():
+    """Carrega e aquece os modelos configurados em MODEL_PRELOAD. Por padrão
+    (MODEL_PRELOAD_BLOCKING=0) o aquecimento roda em segundo plano e o /ready
+    responde 503 até terminar; com MODEL_PRELOAD_BLOCKING=1 o worker só começa
+    a receber requisições depois do aquecimento."""
+    if MODEL_PRELOAD_BLOCKING:
+        _warm_up()
+    else:
+        threading.Thread(target=_warm_up, name="model-preload", daemon=True).start()
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Inicia os workers que drenam a fila de jobs assíncronos."""
+    with startup_timer.phase("job_workers"):
+        job_runner.start()
+
+
+@app.on_event("startup")
+async def report_startup():
+    """Registra o tempo de inicialização do worker e de cada fase."""
+    startup_timer.mark_ready()
+    report = startup_timer.report()
+    if STARTUP_BUDGET_MS and report["ready_ms"] > STARTUP_BUDGET_MS:
+        logger.warning(
+            "Inicialização levou {} ms (orçamento {} ms): {}",
+            report["ready_ms"], STARTUP_BUDGET_MS, report["phases"],
+        )
+    else:
+        logger.info(
+            "Inicialização levou {} ms: {}", report["ready_ms"], report["phases"]
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    await job_runner.stop()
+    inference_pool.stop()
+    await gpt_services.close_client()
+    executors.shutdown()
+    # Aguarda a thread de logging gravar os registros pendentes
+    await logger.complete()
 
 
 # redirect
@@ -59,3 +166,6 @@ async def redirect():
 app.include_router(detection_router, prefix="/analise")
 app.include_router(healthcheck_router)
 app.include_router(gpt_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
+app.include_router(profiling_router)
@@ -0,0 +1,129 @@
+import math
+from collections import Counter
+from typing import Dict
+
+from config import (
+    ADMISSION_DEFAULT_MAX_IMAGES_PER_EXAM_TYPE,
+    ADMISSION_MAX_IMAGES,
+    ADMISSION_MAX_IMAGES_PER_EXAM_TYPE,
+    ADMISSION_RETRY_AFTER_S,
+)
+
+
+class AdmissionRejected(Exception):
+    """
+    Requisição recusada pelo controle de admissão.
+
+    Args:
+        detail (str): O motivo da recusa.
+        retry_after_s (float): Tempo sugerido antes de uma nova tentativa.
+    """
+
+    def __init__(self, detail: str, retry_after_s: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after_s = retry_after_s
+
+    @property
+    def retry_after(self) -> str:
+        """Valor do cabeçalho Retry-After, em segundos inteiros."""
+        return str(max(1, math.ceil(self.retry_after_s)))
+
+
+class AdmissionController:
+    """
+    Limita o número de imagens em processamento no worker.
+
+    Cada requisição reserva uma vaga por arquivo enviado antes de começar e a
+    libera ao terminar. Requisições que ultrapassariam o limite do worker ou
+    do tipo de exame são recusadas imediatamente, em vez de esperarem na
+    fila até o tempo limite do cliente. Uma requisição sozinha é sempre
+    aceita, mesmo que tenha mais arquivos que o limite.
+
+    Os contadores só são alterados no event loop e não precisam de lock.
+
+    Args:
+        max_images (int): Imagens em processamento no worker (0 = sem limite).
+        max_images_per_exam_type (dict): Limite por tipo de exame.
+        default_max_images_per_exam_type (int): Limite dos tipos de exame sem
+            valor próprio (0 = apenas o limite do worker).
+        retry_after_s (float): Tempo sugerido no Retry-After das recusas.
+    """
+
+    def __init__(
+        self,
+        max_images: int,
+        max_images_per_exam_type: Dict[str, int],
+        default_max_images_per_exam_type: int,
+        retry_after_s: float,
+    ):
+        self._max_images = max_images
+        self._per_exam_type = max_images_per_exam_type
+        self._default_per_exam_type = default_max_images_per_exam_type
+        self._retry_after_s = retry_after_s
+        self._in_flight = 0
+        self._in_flight_by_exam_type: Counter = Counter()
+        self.admitted = 0
+        self.rejected: Counter = Counter()
+
+    def limit_for(self, exam_type: str) -> int:
+        return self._per_exam_type.get(exam_type, self._default_per_exam_type)
+
+    def acquire(self, exam_type: str, images: int):
+        """
+        Reserva vagas para as imagens de uma requisição.
+
+        Raises:
+            AdmissionRejected: Se o worker ou o tipo de exame estiver no limite.
+        """
+        in_flight_exam_type = self._in_flight_by_exam_type[exam_type]
+        limit = self.limit_for(exam_type)
+        if limit and in_flight_exam_type and in_flight_exam_type + images > limit:
+            self.rejected["exam_type"] += 1
+            raise AdmissionRejected(
+                f"Limite de imagens em processamento para {exam_type} atingido",
+                self._retry_after_s,
+            )
+        if (
+            self._max_images
+            and self._in_flight
+            and self._in_flight + images > self._max_images
+        ):
+            self.rejected["worker"] += 1
+            raise AdmissionRejected(
+                "Limite de imagens em processamento no worker atingido",
+                self._retry_after_s,
+            )
+        self._in_flight += images
+        self._in_flight_by_exam_type[exam_type] += images
+        self.admitted += 1
+
+    def release(self, exam_type: str, images: int):
+        """Libera as vagas reservadas por `acquire`."""
+        self._in_flight -= images
+        self._in_flight_by_exam_type[exam_type] -= images
+        if self._in_flight_by_exam_type[exam_type] <= 0:
+            del self._in_flight_by_exam_type[exam_type]
+
+    def saturated(self) -> bool:
+        """Indica se o worker atingiu o limite de imagens em processamento."""
+        return bool(self._max_images) and self._in_flight >= self._max_images
+
+    def stats(self) -> dict:
+        """Retorna a ocupação atual e os contadores de recusa."""
+        return {
+            "in_flight_images": self._in_flight,
+            "max_images": self._max_images,
+            "in_flight_by_exam_type": dict(self._in_flight_by_exam_type),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+# Ocupação do worker, compartilhada pelas rotas de análise
+admission_controller = AdmissionController(
+    max_images=ADMISSION_MAX_IMAGES,
+    max_images_per_exam_type=ADMISSION_MAX_IMAGES_PER_EXAM_TYPE,
+    default_max_images_per_exam_type=ADMISSION_DEFAULT_MAX_IMAGES_PER_EXAM_TYPE,
+    retry_after_s=ADMISSION_RETRY_AFTER_S,
+)
@@ -1,11 +1,55 @@
 from PIL import Image
+import asyncio
 import io
-import pandas as pd
-
-
-from ultralytics import YOLO
+import threading
+import numpy as np
+from typing import List, Optional, Tuple
 
+from config import (
+    DETECTION_CACHE_ENABLED,
+    DETECTION_CACHE_MAX_ENTRIES,
+    DETECTION_CACHE_MAX_MB,
+    INFERENCE_CPU_THREADS,
+    INFERENCE_ENGINE,
+    INFERENCE_ENGINES,
+    INFERENCE_IMPORT_AT_STARTUP,
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MODEL_PATHS,
+    INFERENCE_TILE_FULL_IMAGE,
+    INFERENCE_TILE_MAX_TILES,
+    INFERENCE_TILE_MERGE_THRESHOLD,
+    INFERENCE_TILE_OVERLAP,
+    INFERENCE_TILE_SIZES,
+    INFERENCE_WORKER_PIN_CORES,
+    INFERENCE_WORKER_REPLICAS,
+    INFERENCE_WORKER_SHM_MB,
+    INFERENCE_WORKER_THREADS,
+    INFERENCE_WORKER_TIMEOUT_S,
+    INFERENCE_WORKERS,
+    MICRO_BATCH_ENABLED,
+    MICRO_BATCH_MAX_WAIT_MS,
+    MODEL_CACHE_MAX_MEMORY_MB,
+    MODEL_CACHE_MAX_MODELS,
+    MODEL_PRELOAD,
+    MODEL_WARMUP_IMAGE_SIZE,
+)
+from services.batch_scheduler import MicroBatchScheduler
+from services.detection_cache import DetectionCache, detection_key
+from services.detections import Detections
+from services.executors import run_in_stage
+from services.inference_engines import (
+    InferenceEngine,
+    engine_for_path,
+    engine_model_path,
+    import_inference_stack,
+    load_engine,
+)
+from services.inference_pool import InferencePool
+from services.model_registry import ModelRegistry
+from services.tiling import TilePlan
 from utils.logger import get_logger
+from utils.metrics import IMAGES_PROCESSED, current_labels
+from utils.uses_for_images import get_array_from_bytes
 
 logger = get_logger()
 
@@ -19,93 +63,387 @@ ai_paths = {
     "ecg_labeled_marzo": "./AI/cardiac/ecg_labeled_marzo.pt",
 }
 
+# Parâmetros de inferência usados pelos endpoints de análise
+DETECTION_IMAGE_SIZE = 640
+DETECTION_CONF = 0.5
+DETECTION_AUGMENT = False
+
+
+def engine_for(exam_type: str) -> str:
+    """Motor de inferência configurado para o tipo de exame (INFERENCE_ENGINES)."""
+    return INFERENCE_ENGINES.get(exam_type, INFERENCE_ENGINE)
+
+
+# Arquivo carregado para cada tipo de exame: o .pt no ultralytics ou o modelo
+# exportado para o ONNX Runtime/OpenVINO (ver tools/export_onnx.py)
+model_paths = {
+    exam_type: INFERENCE_MODEL_PATHS.get(exam_type)
+    or engine_model_path(engine_for(exam_type), weights_path)
+    for exam_type, weights_path in ai_paths.items()
+}
+
+
+def _load_model(model_path: str) -> InferenceEngine:
+    return load_engine(model_path, INFERENCE_CPU_THREADS)
+
+
+# Modelos residentes do worker, compartilhados entre as requisições
+model_registry = ModelRegistry(
+    model_paths,
+    loader=_load_model,
+    max_models=MODEL_CACHE_MAX_MODELS,
+    max_memory_bytes=int(MODEL_CACHE_MAX_MEMORY_MB * 2**20),
+)
+
+
+# Processos de inferência (INFERENCE_WORKERS > 0): os modelos ficam nos
+# processos do pool e o model_registry deste processo não é usado
+inference_pool = InferencePool(
+    model_paths,
+    workers=INFERENCE_WORKERS,
+    replicas=INFERENCE_WORKER_REPLICAS,
+    pin_cores=INFERENCE_WORKER_PIN_CORES,
+    threads=INFERENCE_WORKER_THREADS,
+    shm_bytes=int(INFERENCE_WORKER_SHM_MB * 2**20),
+    timeout_s=INFERENCE_WORKER_TIMEOUT_S,
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    registry_limits={
+        "max_models": MODEL_CACHE_MAX_MODELS,
+        "max_memory_bytes": int(MODEL_CACHE_MAX_MEMORY_MB * 2**20),
+    },
+)
+
 
 # Função para carregar modelos dinamicamente
 def load_model(exam_type: str):
-    if exam_type in ai_paths:
-        model_path = ai_paths[exam_type]
-        model = YOLO(model_path)
-        logger.info("Modelo carregado: {}", model_path)
-        return model
-    else:
-        logger.error("Tipo de exame/modelo não suportado: {}", exam_type)
-        raise ValueError("Modelo não suportado")
+    return model_registry.get(exam_type)
+
+
+def _warm_up_model(exam_type: str, image_size: int = MODEL_WARMUP_IMAGE_SIZE):
+    # Inferência com uma imagem vazia para inicializar o predictor e os pesos
+    dummy_image = np.zeros((image_size, image_size, 3), dtype=np.uint8)
+    with model_registry.inference_lock(exam_type):
+        load_model(exam_type).detect([dummy_image], image_size, DETECTION_CONF)
+
+
+# Sinalizado quando o pré-carregamento da inicialização termina
+preload_finished = threading.Event()
+
 
+def preload_exam_types() -> list:
+    """Tipos de exame configurados em MODEL_PRELOAD ("all" = todos)."""
+    return list(ai_paths) if "all" in MODEL_PRELOAD else list(MODEL_PRELOAD)
 
-def transform_predict_to_df(results: list, labeles_dict: dict) -> pd.DataFrame:
+
+def preload_models(exam_types: list = None):
     """
-    Transforma a previsão do YOLOv8 (torch.Tensor) em um DataFrame do pandas.
+    Carrega e aquece os modelos na inicialização do worker.
 
     Args:
-        results (list): Uma lista contendo a saída da previsão do YOLOv8 na forma de um torch.Tensor.
-        labeles_dict (dict): Um dicionário contendo os nomes dos rótulos, onde as chaves são os IDs das classes e os valores são os nomes dos rótulos.
+        exam_types (list, opcional): Tipos de exame a pré-carregar. Padrão é
+            a lista configurada em MODEL_PRELOAD ("all" carrega todos).
+    """
+    exam_types = preload_exam_types() if exam_types is None else exam_types
+    if "all" in exam_types:
+        exam_types = list(ai_paths)
+    try:
+        if inference_pool.enabled:
+            inference_pool.start()
+            inference_pool.warm_up(exam_types, MODEL_WARMUP_IMAGE_SIZE)
+            return
+        # O ultralytics só é necessário para os modelos servidos pelo torch
+        uses_torch = any(
+            engine_for_path(path) == "torch" for path in model_paths.values()
+        )
+        if INFERENCE_IMPORT_AT_STARTUP and uses_torch:
+            import_inference_stack()
+        model_registry.warm_up(exam_types, _warm_up_model)
+    finally:
+        preload_finished.set()
 
-    Returns:
-        predict_bbox (pd.DataFrame): Um DataFrame contendo as coordenadas da bounding box, os escores de confiança e os rótulos das classes.
+
+def is_model_ready(exam_type: str) -> bool:
     """
-    # Transforma o Tensor para um array numpy
-    predict_bbox = pd.DataFrame(
-        results[0].to("cpu").numpy().boxes.xyxy,
-        columns=["xmin", "ymin", "xmax", "ymax"],
-    )
-    # Adiciona a confiança da previsão ao DataFrame
-    predict_bbox["confidence"] = results[0].to("cpu").numpy().boxes.conf
-    # Adiciona a classe da previsão ao DataFrame
-    predict_bbox["class"] = (results[0].to("cpu").numpy().boxes.cls).astype(int)
-    # Substitui o número da classe pelo nome da classe a partir do labeles_dict
-    predict_bbox["name"] = predict_bbox["class"].replace(labeles_dict)
-    return predict_bbox
+    Indica se o modelo pode atender requisições sem esperar carregamento.
+
+    Retorna False enquanto o modelo está sendo carregado ou, durante o
+    pré-carregamento da inicialização, enquanto ainda não foi aquecido.
+    """
+    if model_registry.is_loading(exam_type):
+        return False
+    if not preload_finished.is_set() and exam_type in preload_exam_types():
+        return is_model_warm(exam_type)
+    return True
+
+
+def is_model_warm(exam_type: str) -> bool:
+    """Indica se o modelo está residente e aquecido (no pool, quando ativo)."""
+    if inference_pool.enabled:
+        return inference_pool.is_warm(exam_type)
+    return model_registry.is_warm(exam_type)
 
 
 def get_model_predict(
-    model: YOLO,
-    input_image: Image,
+    model: InferenceEngine,
+    input_images: List[np.ndarray],
     save: bool = False,
     image_size: int = 1248,
     conf: float = 0.5,
     augment: bool = False,
-) -> pd.DataFrame:
+    max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+) -> List[Detections]:
     """
-    Obtém as previsões de um modelo em uma imagem de entrada.
+    Obtém as previsões de um modelo para um lote de imagens de entrada.
+
+    As imagens são enviadas ao modelo em lotes de até `max_batch_size`
+    imagens e as previsões são separadas de volta por imagem.
 
     Args:
-        model (YOLO): O modelo YOLO treinado.
-        input_image (Image): A imagem na qual o modelo fará previsões.
+        model (InferenceEngine): O modelo carregado (ver `services.inference_engines`).
+        input_images (List[np.ndarray]): As imagens nas quais o modelo fará previsões
+            (arrays BGR ou imagens PIL).
         save (bool, opcional): Se deve salvar a imagem com as previsões. Padrão é False.
-        image_size (int, opcional): O tamanho da imagem que o modelo receberá. Padrão é 1248.
+        image_size (int, opcional): O tamanho da imagem que o modelo receberá.
+            Padrão é 1248.
         conf (float, opcional): O limiar de confiança para as previsões. Padrão é 0.5.
-        augment (bool, opcional): Se deve aplicar aumento de dados na imagem de entrada. Padrão é False.
+        augment (bool, opcional): Se deve aplicar aumento de dados na imagem de
+            entrada. Padrão é False.
+        max_batch_size (int, opcional): Número máximo de imagens por chamada ao modelo.
 
     Returns:
-        pd.DataFrame: Um DataFrame contendo as previsões.
+        List[Detections]: As previsões de cada imagem, na mesma ordem da entrada.
     """
     # Faz as previsões
     logger.info(
-        "Parâmetros de entrada para predict: image_size={}, conf={}, save={}, augment={}",
+        "Parâmetros de entrada para predict: image_size={}, conf={}, save={}, "
+        "augment={}, imagens={}",
         image_size,
         conf,
         save,
         augment,
+        len(input_images),
     )
-    predictions = model.predict(
-        imgsz=image_size,
-        source=input_image,
-        conf=conf,
-        save=save,
-        augment=augment,
-        flipud=0.0,
-        fliplr=0.0,
-        mosaic=0.0,
-    )
-
-    # Transforma as previsões em um dataframe do pandas
-    logger.info("Previsões brutas retornadas do modelo: {}", predictions)
-    return transform_predict_to_df(predictions, model.model.names)
+    max_batch_size = max(1, max_batch_size)
+    predicts = []
+    for start in range(0, len(input_images), max_batch_size):
+        predicts.extend(
+            model.detect(
+                input_images[start : start + max_batch_size],
+                image_size,
+                conf,
+                augment=augment,
+                save=save,
+            )
+        )
+    return predicts
 
 
-def detect_sample_model(input_image: Image, exam_type: str) -> pd.DataFrame:
+def detect_batch_model(
+    input_images: List[np.ndarray], exam_type: str
+) -> List[Detections]:
+    if inference_pool.enabled:
+        return inference_pool.detect(
+            exam_type,
+            input_images,
+            DETECTION_IMAGE_SIZE,
+            DETECTION_CONF,
+            DETECTION_AUGMENT,
+        )
     model = load_model(exam_type)  # Carrega o modelo com base no tipo de exame
     # Chama get_model_predict com parâmetros específicos
-    return get_model_predict(
-        model, input_image, save=False, image_size=640, conf=0.5, augment=False
+    with model_registry.inference_lock(exam_type):
+        return get_model_predict(
+            model,
+            input_images,
+            save=False,
+            image_size=DETECTION_IMAGE_SIZE,
+            conf=DETECTION_CONF,
+            augment=DETECTION_AUGMENT,
+        )
+
+
+def detect_sample_model(input_image: Image, exam_type: str) -> Detections:
+    return detect_batch_model([input_image], exam_type)[0]
+
+
+# Agrupa as imagens de requisições concorrentes antes de chamar o modelo
+inference_scheduler = MicroBatchScheduler(
+    lambda exam_type, input_images: detect_batch_model(input_images, exam_type),
+    max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+    # Com o pool, cada réplica do modelo pode processar um lote ao mesmo tempo
+    max_concurrent_batches=inference_pool.replicas or 1,
+)
+
+
+async def detect_images(
+    input_images: List[np.ndarray], exam_type: str
+) -> List[Detections]:
+    """
+    Executa a detecção em um conjunto de imagens.
+
+    A inferência roda fora do event loop. Com MICRO_BATCH_ENABLED as imagens
+    passam pelo agendador de micro-batching e podem ser agrupadas com imagens
+    de outras requisições do mesmo modelo.
+
+    Args:
+        input_images (List[np.ndarray]): As imagens de entrada (arrays BGR ou
+            imagens PIL).
+        exam_type (str): O tipo de exame (modelo) a ser usado.
+
+    Returns:
+        List[Detections]: As previsões de cada imagem, na mesma ordem da entrada.
+    """
+    if exam_type not in ai_paths:
+        logger.error("Tipo de exame/modelo não suportado: {}", exam_type)
+        raise ValueError("Modelo não suportado")
+    if MICRO_BATCH_ENABLED:
+        return await inference_scheduler.detect(exam_type, input_images)
+    return await run_in_stage("inference", detect_batch_model, input_images, exam_type)
+
+
+def _tile_plan(exam_type: str, shape: Tuple[int, int]) -> Optional[TilePlan]:
+    """Divisão em blocos da imagem, para os tipos de exame de INFERENCE_TILE_SIZES."""
+    tile_size = INFERENCE_TILE_SIZES.get(exam_type)
+    if not tile_size:
+        return None
+    # Os blocos de uma imagem (e a imagem inteira) cabem em uma chamada ao modelo
+    max_tiles = min(
+        INFERENCE_TILE_MAX_TILES, INFERENCE_MAX_BATCH_SIZE - INFERENCE_TILE_FULL_IMAGE
     )
+    return TilePlan(
+        shape, tile_size, INFERENCE_TILE_OVERLAP, max_tiles, INFERENCE_TILE_FULL_IMAGE
+    )
+
+
+def _decode_size(exam_type: str) -> Optional[int]:
+    # Tamanho alvo da decodificação reduzida; os blocos precisam da resolução original
+    return None if exam_type in INFERENCE_TILE_SIZES else DETECTION_IMAGE_SIZE
+
+
+def _tiling_key(exam_type: str) -> str:
+    # Parâmetros da inferência em blocos que mudam o resultado (chave do cache)
+    tile_size = INFERENCE_TILE_SIZES.get(exam_type)
+    if not tile_size:
+        return ""
+    return (
+        f"tiles={tile_size}/{INFERENCE_TILE_OVERLAP}/{INFERENCE_TILE_MAX_TILES}/"
+        f"{int(INFERENCE_TILE_FULL_IMAGE)}/{INFERENCE_TILE_MERGE_THRESHOLD}"
+    )
+
+
+def _decode_for_inference(
+    binary_image: bytes, exam_type: str
+) -> Tuple[List[np.ndarray], Tuple[float, float], Optional[TilePlan]]:
+    """
+    Decodifica um arquivo para a inferência.
+
+    JPEGs grandes são decodificados em escala reduzida próxima de
+    DETECTION_IMAGE_SIZE; a resolução original só é decodificada depois,
+    para a anotação. Nos tipos de exame com inferência em blocos, a imagem
+    é decodificada em resolução original e dividida em blocos.
+
+    Returns:
+        Tuple[List[np.ndarray], Tuple[float, float], TilePlan]: As entradas
+            BGR do modelo (a imagem, ou os seus blocos), os fatores de escala
+            (x, y) das coordenadas para a resolução original e a divisão em
+            blocos (ou None).
+    """
+    pixels, scale = get_array_from_bytes(binary_image, _decode_size(exam_type))
+    plan = _tile_plan(exam_type, pixels.shape[:2])
+    if plan is None:
+        return [pixels], scale, None
+    return plan.split(pixels), scale, plan
+
+
+def _merge_tiles(
+    plans: List[Optional[TilePlan]], predicts: List[Detections]
+) -> List[Detections]:
+    # Junta as detecções dos blocos de cada imagem, na ordem de `plans`
+    merged, start = [], 0
+    for plan in plans:
+        if plan is None:
+            merged.append(predicts[start])
+            start += 1
+            continue
+        tiles = predicts[start : start + len(plan)]
+        merged.append(plan.merge(tiles, INFERENCE_TILE_MERGE_THRESHOLD))
+        start += len(plan)
+    return merged
+
+
+# Resultados de detecção por conteúdo do arquivo enviado
+detection_cache = DetectionCache(
+    max_entries=DETECTION_CACHE_MAX_ENTRIES,
+    max_bytes=int(DETECTION_CACHE_MAX_MB * 2**20),
+    size_fn=lambda predict: predict.nbytes,
+)
+
+
+async def detect_binary_images(
+    binary_images: List[bytes], exam_type: str
+) -> List[Detections]:
+    """
+    Decodifica e executa a detecção nos arquivos enviados.
+
+    Com DETECTION_CACHE_ENABLED, arquivos já analisados com os mesmos
+    parâmetros não são decodificados nem passam pelo modelo, e envios
+    concorrentes do mesmo arquivo aguardam uma única inferência. Os demais
+    arquivos são decodificados em escala reduzida (ver
+    `_decode_for_inference`) e enviados ao modelo em um único lote. Quem
+    precisa da imagem em resolução original, para anotação, a decodifica
+    à parte.
+
+    Args:
+        binary_images (List[bytes]): Os bytes de cada arquivo enviado.
+        exam_type (str): O tipo de exame (modelo) a ser usado.
+
+    Returns:
+        List[Detections]: As previsões de cada arquivo, na mesma ordem da
+            entrada, em coordenadas da resolução original.
+    """
+    if exam_type not in ai_paths:
+        logger.error("Tipo de exame/modelo não suportado: {}", exam_type)
+        raise ValueError("Modelo não suportado")
+
+    IMAGES_PROCESSED.labels(**current_labels(exam_type=exam_type)).inc(
+        len(binary_images)
+    )
+
+    async def compute(indexes: List[int]) -> List[Detections]:
+        decoded = await asyncio.gather(
+            *(
+                run_in_stage(
+                    "decode", _decode_for_inference, binary_images[index], exam_type
+                )
+                for index in indexes
+            )
+        )
+        # Os blocos de todas as imagens seguem juntos para o modelo
+        predicts = await detect_images(
+            [pixels for inputs, _, _ in decoded for pixels in inputs], exam_type
+        )
+        if exam_type in INFERENCE_TILE_SIZES:
+            predicts = await run_in_stage(
+                "tiling", _merge_tiles, [plan for _, _, plan in decoded], predicts
+            )
+        # As coordenadas sempre se referem à resolução original do arquivo
+        return [
+            predict.scaled(scale) for predict, (_, scale, _) in zip(predicts, decoded)
+        ]
+
+    if DETECTION_CACHE_ENABLED:
+        keys = [
+            detection_key(
+                binary_image,
+                exam_type,
+                DETECTION_IMAGE_SIZE,
+                DETECTION_CONF,
+                DETECTION_AUGMENT,
+                _decode_size(exam_type),
+                _tiling_key(exam_type),
+            )
+            for binary_image in binary_images
+        ]
+        return await detection_cache.get_many(keys, compute)
+    return await compute(list(range(len(binary_images))))
@@ -0,0 +1,211 @@
+import asyncio
+from collections import Counter
+from typing import Any, Callable, Dict, List
+
+from services.executors import run_in_stage
+from utils.logger import get_logger
+from utils.metrics import set_labels
+from utils.profiling import active_profiles, attach_profiles
+
+logger = get_logger()
+
+
+class _ModelQueue:
+    """Fila de imagens pendentes e estatísticas de um modelo."""
+
+    def __init__(self, max_concurrent_batches: int):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.worker: asyncio.Task = None
+        self.slots = asyncio.Semaphore(max_concurrent_batches)
+        self.running = set()
+        self.batches = 0
+        self.images = 0
+        self.errors = 0
+        self.flushed_full = 0
+        self.flushed_timeout = 0
+        self.batch_sizes: Counter = Counter()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "running_batches": len(self.running),
+            "batches": self.batches,
+            "images": self.images,
+            "errors": self.errors,
+            "avg_batch_size": self.images / self.batches if self.batches else 0.0,
+            "max_batch_size": max(self.batch_sizes, default=0),
+            "flushed_full": self.flushed_full,
+            "flushed_timeout": self.flushed_timeout,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+
+class MicroBatchScheduler:
+    """
+    Agrupa imagens de requisições concorrentes em lotes por modelo.
+
+    Cada imagem submetida entra na fila do seu tipo de exame. Um worker por
+    fila envia o lote ao modelo quando ele atinge `max_batch_size` imagens ou
+    quando a imagem mais antiga espera `max_wait_ms`, o que ocorrer primeiro.
+    A inferência roda fora do event loop e cada chamador recebe apenas o
+    resultado da sua imagem através de um future. Cada modelo processa até
+    `max_concurrent_batches` lotes ao mesmo tempo; o próximo lote só começa
+    a ser montado quando há vaga, e acumula as imagens que chegam enquanto
+    isso.
+
+    Args:
+        infer_fn (Callable): Função síncrona (exam_type, imagens) -> resultados,
+            um resultado por imagem e na mesma ordem.
+        max_batch_size (int): Número máximo de imagens por lote.
+        max_wait_ms (float): Tempo máximo de espera para completar um lote.
+        max_concurrent_batches (int): Lotes simultâneos por modelo (ex: o
+            número de processos de inferência que atendem o modelo).
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[str, List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 1,
+    ):
+        self._infer_fn = infer_fn
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._max_concurrent_batches = max(1, max_concurrent_batches)
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    def submit(self, exam_type: str, image: Any) -> asyncio.Future:
+        """
+        Coloca uma imagem na fila do modelo.
+
+        Args:
+            exam_type (str): O tipo de exame (modelo) da imagem.
+            image: A imagem de entrada.
+
+        Returns:
+            asyncio.Future: Future com o resultado da inferência da imagem.
+        """
+        loop = asyncio.get_running_loop()
+        model_queue = self._queues.get(exam_type)
+        if model_queue is None:
+            model_queue = self._queues[exam_type] = _ModelQueue(
+                self._max_concurrent_batches
+            )
+        if model_queue.worker is None or model_queue.worker.done():
+            model_queue.worker = loop.create_task(self._worker(exam_type, model_queue))
+
+        future = loop.create_future()
+        # Perfis da requisição que submeteu a imagem (ver utils/profiling.py)
+        model_queue.queue.put_nowait((image, future, active_profiles()))
+        return future
+
+    async def detect(self, exam_type: str, images: List[Any]) -> List[Any]:
+        """
+        Submete um conjunto de imagens e aguarda os resultados.
+
+        Args:
+            exam_type (str): O tipo de exame (modelo) das imagens.
+            images (list): As imagens de entrada.
+
+        Returns:
+            list: Um resultado por imagem, na mesma ordem da entrada.
+        """
+        futures = [self.submit(exam_type, image) for image in images]
+        return list(await asyncio.gather(*futures))
+
+    async def _worker(self, exam_type: str, model_queue: _ModelQueue):
+        # Os lotes misturam imagens de vários endpoints
+        set_labels(endpoint="micro_batch", exam_type=exam_type)
+        loop = asyncio.get_running_loop()
+        while True:
+            await model_queue.slots.acquire()
+            try:
+                batch = await self._collect_batch(model_queue)
+            except BaseException:
+                model_queue.slots.release()
+                raise
+            task = loop.create_task(self._run_batch(exam_type, model_queue, batch))
+            model_queue.running.add(task)
+            task.add_done_callback(model_queue.running.discard)
+
+    async def _collect_batch(self, model_queue: _ModelQueue) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await model_queue.queue.get()]
+        deadline = loop.time() + self._max_wait
+
+        while len(batch) < self._max_batch_size:
+            # Imagens já enfileiradas entram no lote sem esperar
+            if not model_queue.queue.empty():
+                batch.append(model_queue.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(model_queue.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        if len(batch) >= self._max_batch_size:
+            model_queue.flushed_full += 1
+        else:
+            model_queue.flushed_timeout += 1
+        return batch
+
+    async def _run_batch(self, exam_type: str, model_queue: _ModelQueue, batch: list):
+        try:
+            await self._infer_batch(exam_type, model_queue, batch)
+        finally:
+            model_queue.slots.release()
+
+    async def _infer_batch(self, exam_type: str, model_queue: _ModelQueue, batch: list):
+        # Ignora imagens cujos chamadores já desistiram da requisição
+        batch = [
+            (image, future, profiles)
+            for image, future, profiles in batch
+            if not future.done()
+        ]
+        if not batch:
+            return
+
+        model_queue.batches += 1
+        model_queue.images += len(batch)
+        model_queue.batch_sizes[len(batch)] += 1
+
+        images = [image for image, _, _ in batch]
+        # As etapas do lote entram no perfil de cada requisição perfilada do lote
+        profiles = tuple(
+            {
+                profile
+                for _, _, request_profiles in batch
+                for profile in request_profiles
+            }
+        )
+        try:
+            with attach_profiles(profiles):
+                results = await run_in_stage(
+                    "inference", self._infer_fn, exam_type, images
+                )
+        except Exception as e:
+            model_queue.errors += 1
+            logger.error("Falha no lote de inferência de {}: {}", exam_type, str(e))
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Retorna a profundidade das filas e as estatísticas de lote por modelo."""
+        return {
+            "max_batch_size": self._max_batch_size,
+            "max_wait_ms": self._max_wait * 1000,
+            "models": {
+                exam_type: model_queue.stats()
+                for exam_type, model_queue in self._queues.items()
+            },
+        }
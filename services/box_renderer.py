@@ -0,0 +1,224 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from services.detections import Detections
+from utils.uses_for_images import resize_to_preview
+
+# Mesma paleta do Annotator do ultralytics. O código original passava a cor em
+# BGR para um buffer RGB; os canais são invertidos aqui para manter as cores
+# das imagens anotadas iguais às de antes.
+_PALETTE_HEX = (
+    "FF3838",
+    "FF9D97",
+    "FF701F",
+    "FFB21D",
+    "CFD231",
+    "48F90A",
+    "92CC17",
+    "3DDB86",
+    "1A9334",
+    "00D4BB",
+    "2C99A8",
+    "00C2FF",
+    "344593",
+    "6473FF",
+    "0018EC",
+    "8438FF",
+    "520085",
+    "CB38FF",
+    "FF95C8",
+    "FF37C7",
+)
+PALETTE = np.array(
+    [[int(h[i : i + 2], 16) for i in (4, 2, 0)] for h in _PALETTE_HEX], dtype=np.uint8
+)
+TEXT_COLOR = 255
+
+# Limites dos caches de estilos por modelo e de rótulos por estilo
+MAX_STYLES = 32
+MAX_LABELS_PER_STYLE = 4096
+
+
+def line_width_for(width: int, height: int) -> int:
+    """Espessura das linhas para o tamanho da imagem (mesma regra do Annotator)."""
+    return max(round((width + height + 3) / 2 * 0.003), 2)
+
+
+def font_size_for(width: int, height: int) -> int:
+    """Tamanho da fonte dos rótulos para o tamanho da imagem."""
+    return max(round((width + height) / 2 * 0.035), 12)
+
+
+def _load_font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 não tem fonte padrão escalável
+        return ImageFont.load_default()
+
+
+class _ModelStyle:
+    """
+    Cores e rótulos já renderizados das classes de um modelo.
+
+    Args:
+        names (np.ndarray): Tabela de nomes das classes do modelo.
+    """
+
+    def __init__(self, names: np.ndarray):
+        self.names = names
+        self.colors = PALETTE[np.arange(len(names)) % len(PALETTE)]
+        self._labels: "OrderedDict[Tuple[int, int, int], np.ndarray]" = OrderedDict()
+        self._fonts: Dict[int, ImageFont.ImageFont] = {}
+        self._lock = threading.Lock()
+
+    def color(self, class_id: int) -> np.ndarray:
+        if class_id < len(self.colors):
+            return self.colors[class_id]
+        return PALETTE[class_id % len(PALETTE)]
+
+    def label(self, class_id: int, percent: int, font_size: int) -> np.ndarray:
+        """
+        Retorna o rótulo "<classe>: <confiança>%" já renderizado em RGB.
+
+        O rótulo tem o fundo na cor da classe e é reaproveitado para todas as
+        detecções da mesma classe, faixa de confiança e tamanho de fonte.
+        """
+        key = (class_id, percent, font_size)
+        with self._lock:
+            patch = self._labels.get(key)
+            if patch is not None:
+                self._labels.move_to_end(key)
+                return patch
+
+        name = self.names[class_id] if class_id < len(self.names) else str(class_id)
+        patch = self._render_label(
+            f"{name}: {percent}%", self.color(class_id), font_size
+        )
+
+        with self._lock:
+            self._labels[key] = patch
+            if len(self._labels) > MAX_LABELS_PER_STYLE:
+                self._labels.popitem(last=False)
+        return patch
+
+    def _font(self, font_size: int) -> ImageFont.ImageFont:
+        font = self._fonts.get(font_size)
+        if font is None:
+            font = self._fonts[font_size] = _load_font(font_size)
+        return font
+
+    def _render_label(self, text: str, color: np.ndarray, font_size: int) -> np.ndarray:
+        font = self._font(font_size)
+        left, top, right, bottom = font.getbbox(text)
+        pad = max(font_size // 8, 1)
+        width, height = right - left + 2 * pad, bottom - top + 2 * pad
+        mask = Image.new("L", (width, height), 0)
+        ImageDraw.Draw(mask).text((pad - left, pad - top), text, fill=255, font=font)
+        alpha = np.asarray(mask, dtype=np.float32)[:, :, None] / 255
+        patch = color.astype(np.float32) * (1 - alpha) + TEXT_COLOR * alpha
+        patch = patch.round().astype(np.uint8)
+        patch.flags.writeable = False
+        return patch
+
+
+class BoxRenderer:
+    """
+    Desenha bounding boxes e rótulos diretamente em um único buffer NumPy.
+
+    A imagem é convertida para array uma única vez, todas as caixas e rótulos
+    são escritos nesse buffer e o resultado volta para PIL uma única vez. Os
+    rótulos renderizados e a tabela de cores ficam em cache por modelo.
+    """
+
+    def __init__(self, max_styles: int = MAX_STYLES):
+        self._max_styles = max_styles
+        self._styles: "OrderedDict[int, _ModelStyle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def style(self, names: np.ndarray) -> _ModelStyle:
+        """Retorna o estilo (cores e rótulos) do modelo dono da tabela `names`."""
+        key = id(names)
+        with self._lock:
+            style = self._styles.get(key)
+            # O id pode ser reaproveitado depois que um modelo é descarregado
+            if style is not None and style.names is names:
+                self._styles.move_to_end(key)
+                return style
+            style = self._styles[key] = _ModelStyle(names)
+            if len(self._styles) > self._max_styles:
+                self._styles.popitem(last=False)
+            return style
+
+    def render(self, image: Image, predict: Detections, max_size: int = None) -> Image:
+        """
+        Desenha as detecções na imagem.
+
+        Args:
+            image (Image): A imagem de entrada (não é alterada).
+            predict (Detections): As detecções, em coordenadas da imagem.
+            max_size (int, opcional): Maior dimensão da saída. Quando a imagem
+                é maior, o desenho é feito em uma cópia reduzida.
+
+        Returns:
+            Image: A imagem anotada.
+        """
+        original_width, original_height = image.size
+        image = resize_to_preview(image, max_size)
+        if image.size != (original_width, original_height):
+            predict = predict.scaled(
+                (image.size[0] / original_width, image.size[1] / original_height)
+            )
+        canvas = np.array(image.convert("RGB"))
+        self.draw(canvas, predict)
+        return Image.fromarray(canvas)
+
+    def draw(self, canvas: np.ndarray, predict: Detections):
+        """
+        Desenha as detecções em um array RGB (H, W, 3), no próprio array.
+
+        As detecções são desenhadas em ordem de xmin, cada caixa seguida do
+        seu rótulo, como no Annotator.
+        """
+        if not len(predict):
+            return
+        height, width = canvas.shape[:2]
+        line_width = line_width_for(width, height)
+        font_size = font_size_for(width, height)
+        style = self.style(predict.names)
+
+        predict = predict.sorted_by_xmin()
+        boxes = np.rint(predict.boxes).astype(np.int64)
+        boxes[:, 0::2] = boxes[:, 0::2].clip(0, width - 1)
+        boxes[:, 1::2] = boxes[:, 1::2].clip(0, height - 1)
+        percents = (predict.confidence * 100).astype(np.int64)
+
+        for (x1, y1, x2, y2), percent, class_id in zip(
+            boxes.tolist(), percents.tolist(), predict.class_id.tolist()
+        ):
+            color = style.color(class_id)
+            half = line_width // 2
+            top, bottom = max(y1 - half, 0), min(y2 + line_width - half, height)
+            left, right = max(x1 - half, 0), min(x2 + line_width - half, width)
+            canvas[top : min(top + line_width, bottom), left:right] = color
+            canvas[max(bottom - line_width, top) : bottom, left:right] = color
+            canvas[top:bottom, left : min(left + line_width, right)] = color
+            canvas[top:bottom, max(right - line_width, left) : right] = color
+
+            patch = style.label(class_id, percent, font_size)
+            self._paste_label(canvas, patch, left, top)
+
+    @staticmethod
+    def _paste_label(canvas: np.ndarray, patch: np.ndarray, left: int, top: int):
+        # Acima da caixa quando há espaço, senão dentro dela
+        height, width = canvas.shape[:2]
+        patch_height, patch_width = patch.shape[:2]
+        y = top - patch_height if top - patch_height >= 3 else top
+        y_end, x_end = min(y + patch_height, height), min(left + patch_width, width)
+        if y_end <= y or x_end <= left:
+            return
+        canvas[y:y_end, left:x_end] = patch[: y_end - y, : x_end - left]
@@ -0,0 +1,368 @@
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageSequence, UnidentifiedImageError
+
+from services.ai_services import DETECTION_IMAGE_SIZE, detect_images
+from services.detections import Detections
+from services.executors import run_in_stage
+from utils.logger import get_logger
+from utils.metrics import IMAGES_PROCESSED, current_labels
+from utils.uses_for_images import get_array_from_bytes, get_array_from_image
+
+logger = get_logger()
+
+FRAME_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+# Quadro decodificado: (índice na fonte, pixels BGR, escala (x, y) para a
+# resolução original)
+Frame = Tuple[int, np.ndarray, Tuple[float, float]]
+
+
+class CineFormatError(ValueError):
+    """O arquivo não é uma fonte de quadros suportada."""
+
+
+def _natural_key(name: str) -> list:
+    # "frame_2.jpg" antes de "frame_10.jpg"
+    return [
+        int(part) if part.isdigit() else part.lower()
+        for part in re.split(r"(\d+)", name)
+    ]
+
+
+def _fit(
+    pixels: np.ndarray, target_size: int
+) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """Reduz o quadro até a maior dimensão ser `target_size`, como o modelo faria."""
+    height, width = pixels.shape[:2]
+    if max(height, width) <= target_size:
+        return pixels, (1.0, 1.0)
+    ratio = target_size / max(height, width)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    reduced = np.asarray(Image.fromarray(pixels).resize(size, Image.BILINEAR))
+    return reduced, (width / size[0], height / size[1])
+
+
+def _zip_frames(file: BinaryIO, stride: int, target_size: int) -> Iterator[Frame]:
+    with zipfile.ZipFile(file) as archive:
+        names = sorted(
+            (
+                name
+                for name in archive.namelist()
+                if name.lower().endswith(FRAME_EXTENSIONS)
+                and not name.startswith("__MACOSX/")
+            ),
+            key=_natural_key,
+        )
+        # Os quadros fora da amostragem nem são lidos do zip
+        for index in range(0, len(names), stride):
+            pixels, scale = get_array_from_bytes(
+                archive.read(names[index]), target_size
+            )
+            yield index, pixels, scale
+
+
+def _image_frames(image: Image.Image, stride: int, target_size: int) -> Iterator[Frame]:
+    # GIF/TIFF/WebP animados são decodificados quadro a quadro, em sequência
+    with image:
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            if index % stride == 0:
+                yield (
+                    index,
+                    *_fit(get_array_from_image(frame.convert("RGB")), target_size),
+                )
+
+
+def _video_frames(
+    file: BinaryIO, suffix: str, stride: int, target_size: int
+) -> Iterator[Frame]:
+    try:
+        import cv2
+    except ImportError:
+        raise CineFormatError("Leitura de vídeo indisponível (opencv não instalado)")
+    # O OpenCV só lê vídeos de arquivos; a cópia é feita em blocos, sem carregar o vídeo
+    with tempfile.NamedTemporaryFile(suffix=suffix) as video:
+        file.seek(0)
+        shutil.copyfileobj(file, video, 1 << 20)
+        video.flush()
+        capture = cv2.VideoCapture(video.name)
+        if not capture.isOpened():
+            raise CineFormatError("Formato de arquivo não suportado")
+        try:
+            index = 0
+            while True:
+                if index % stride:
+                    # grab() avança sem decodificar o quadro
+                    if not capture.grab():
+                        break
+                else:
+                    ok, pixels = capture.read()
+                    if not ok:
+                        break
+                    yield (index, *_fit(pixels, target_size))
+                index += 1
+        finally:
+            capture.release()
+
+
+def open_frames(
+    file: BinaryIO,
+    filename: str,
+    stride: int = 1,
+    target_size: int = DETECTION_IMAGE_SIZE,
+) -> Iterator[Frame]:
+    """
+    Abre uma fonte de quadros e retorna um iterador que os decodifica sob demanda.
+
+    Aceita zip de imagens (em ordem natural dos nomes), imagens com vários
+    quadros (GIF, TIFF, WebP) ou uma imagem simples, e vídeos legíveis pelo
+    OpenCV. Apenas um a cada `stride` quadros é decodificado, e quadros
+    maiores que `target_size` são reduzidos, como na entrada do modelo.
+
+    Args:
+        file (BinaryIO): O arquivo enviado (com seek).
+        filename (str): O nome do arquivo, usado para a extensão dos vídeos.
+        stride (int, opcional): Intervalo de amostragem dos quadros.
+        target_size (int, opcional): A maior dimensão dos quadros decodificados.
+
+    Returns:
+        Iterator[Frame]: Os quadros amostrados, em ordem.
+
+    Raises:
+        CineFormatError: Se o arquivo não for uma fonte de quadros suportada.
+    """
+    stride = max(1, stride)
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        return _zip_frames(file, stride, target_size)
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except UnidentifiedImageError:
+        return _video_frames(
+            file, os.path.splitext(filename or "")[1], stride, target_size
+        )
+    return _image_frames(image, stride, target_size)
+
+
+def dhash(pixels: np.ndarray, size: int = 16) -> int:
+    """
+    Hash perceptual por diferença (dHash) de um quadro BGR.
+
+    Quadros quase idênticos têm hashes com poucos bits diferentes.
+
+    Returns:
+        int: O hash de `size` * `size` bits.
+    """
+    gray = (
+        Image.fromarray(pixels[..., ::-1])
+        .convert("L")
+        .resize((size + 1, size), Image.BILINEAR)
+    )
+    values = np.asarray(gray, dtype=np.int16)
+    bits = np.packbits(values[:, 1:] > values[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+class FrameSampler:
+    """
+    Lê os quadros de uma fonte em lotes, sem os quadros repetidos.
+
+    Um quadro cujo dHash está a até `max_distance` bits do último quadro
+    mantido é descartado, e contado nas repetições desse quadro. A leitura
+    para em `max_frames` quadros mantidos ou `max_decoded` quadros lidos, de
+    forma que o custo e a memória não dependem da duração da fonte.
+
+    Args:
+        frames (Iterator[Frame]): Os quadros da fonte (ver `open_frames`).
+        max_frames (int): Número máximo de quadros mantidos.
+        max_decoded (int): Número máximo de quadros lidos.
+        max_distance (int): Distância de Hamming dos quadros repetidos (-1 = sem
+            descarte).
+    """
+
+    def __init__(
+        self,
+        frames: Iterator[Frame],
+        max_frames: int,
+        max_decoded: int,
+        max_distance: int,
+    ):
+        self._frames = frames
+        self._max_frames = max_frames
+        self._max_decoded = max_decoded
+        self._max_distance = max_distance
+        self._last_hash = None
+        self._last_index = None
+        self.decoded = 0
+        self.duplicates = 0
+        self.repeats: Dict[int, int] = {}
+        self.exhausted = False
+
+    @property
+    def kept(self) -> int:
+        return len(self.repeats)
+
+    def next_batch(self, size: int) -> List[Frame]:
+        """Lê os próximos `size` quadros mantidos (menos no fim da fonte ou limites)."""
+        batch = []
+        while (
+            len(batch) < size
+            and self.kept < self._max_frames
+            and self.decoded < self._max_decoded
+        ):
+            frame = next(self._frames, None)
+            if frame is None:
+                self.exhausted = True
+                break
+            self.decoded += 1
+            index, pixels, _ = frame
+            if self._max_distance >= 0:
+                frame_hash = dhash(pixels)
+                if (
+                    self._last_hash is not None
+                    and (frame_hash ^ self._last_hash).bit_count() <= self._max_distance
+                ):
+                    self.duplicates += 1
+                    self.repeats[self._last_index] += 1
+                    continue
+                self._last_hash = frame_hash
+            self._last_index = index
+            self.repeats[index] = 0
+            batch.append(frame)
+        return batch
+
+
+class StudySummary:
+    """Acumula as detecções dos quadros de um exame por classe."""
+
+    def __init__(self):
+        self._frames: Dict[str, int] = {}
+        self._max_confidence: Dict[str, float] = {}
+        self._confidence_sum: Dict[str, float] = {}
+        self._detections: Dict[str, int] = {}
+
+    def add(self, predict: Detections):
+        for name in set(predict.labels):
+            self._frames[name] = self._frames.get(name, 0) + 1
+        for name, confidence in zip(predict.labels, predict.confidence.tolist()):
+            self._max_confidence[name] = max(
+                self._max_confidence.get(name, 0.0), confidence
+            )
+            self._confidence_sum[name] = (
+                self._confidence_sum.get(name, 0.0) + confidence
+            )
+            self._detections[name] = self._detections.get(name, 0) + 1
+
+    def to_records(self, frames_analyzed: int) -> List[dict]:
+        """Uma entrada por classe, da mais frequente para a menos frequente."""
+        return [
+            {
+                "name": name,
+                "frames": frames,
+                "frame_ratio": round(frames / max(1, frames_analyzed), 4),
+                "detections": self._detections[name],
+                "max_confidence": round(self._max_confidence[name], 4),
+                "mean_confidence": round(
+                    self._confidence_sum[name] / self._detections[name], 4
+                ),
+            }
+            for name, frames in sorted(
+                self._frames.items(), key=lambda item: (-item[1], item[0])
+            )
+        ]
+
+
+async def analyze_cine(
+    file: BinaryIO,
+    filename: str,
+    exam_type: str,
+    frame_stride: int,
+    max_frames: int,
+    max_decoded: int,
+    max_distance: int,
+    batch_size: int,
+) -> dict:
+    """
+    Detecta os objetos nos quadros de um exame com vários quadros.
+
+    Os quadros são decodificados em lotes de `batch_size` quadros mantidos,
+    e o lote seguinte é decodificado enquanto o atual passa pelo modelo;
+    apenas as detecções ficam em memória.
+
+    Args:
+        file (BinaryIO): O arquivo enviado (vídeo, imagem com vários quadros ou zip).
+        filename (str): O nome do arquivo enviado.
+        exam_type (str): O tipo de exame (modelo) a ser usado.
+        frame_stride (int): Analisa um a cada `frame_stride` quadros.
+        max_frames (int): Quadros analisados pelo modelo.
+        max_decoded (int): Quadros lidos da fonte, incluindo os repetidos.
+        max_distance (int): Distância de Hamming dos quadros repetidos (-1 = sem
+            descarte).
+        batch_size (int): Quadros por lote de inferência.
+
+    Returns:
+        dict: As detecções de cada quadro analisado ("frame" é o índice na
+            fonte e "repeats" o número de quadros seguintes descartados como
+            repetidos) e o resumo do exame.
+    """
+    frames = await run_in_stage("decode", open_frames, file, filename, frame_stride)
+    sampler = FrameSampler(frames, max_frames, max_decoded, max_distance)
+    summary = StudySummary()
+    results, size = [], None
+
+    batch = await run_in_stage("decode", sampler.next_batch, batch_size)
+    if not batch:
+        raise CineFormatError("Nenhum quadro encontrado no arquivo")
+    while batch:
+        upcoming = asyncio.ensure_future(
+            run_in_stage("decode", sampler.next_batch, batch_size)
+        )
+        try:
+            predicts = await detect_images(
+                [pixels for _, pixels, _ in batch], exam_type
+            )
+        except BaseException:
+            upcoming.cancel()
+            raise
+        IMAGES_PROCESSED.labels(**current_labels(exam_type=exam_type)).inc(len(batch))
+        for (index, pixels, scale), predict in zip(batch, predicts):
+            if size is None:
+                height, width = pixels.shape[:2]
+                size = (round(width * scale[0]), round(height * scale[1]))
+            predict = predict.scaled(scale)
+            summary.add(predict)
+            results.append(
+                {"frame": index, "detections": predict.to_records(with_boxes=True)}
+            )
+        batch = await upcoming
+
+    for result in results:
+        result["repeats"] = sampler.repeats[result["frame"]]
+    logger.info(
+        "Exame com vários quadros: {} lidos, {} analisados, {} repetidos",
+        sampler.decoded,
+        sampler.kept,
+        sampler.duplicates,
+    )
+    return {
+        "exam_type": exam_type,
+        "width": size[0],
+        "height": size[1],
+        "frames": results,
+        "summary": {
+            "frames_decoded": sampler.decoded,
+            "frames_analyzed": sampler.kept,
+            "frames_skipped_duplicate": sampler.duplicates,
+            "frame_stride": max(1, frame_stride),
+            "complete": sampler.exhausted,
+            "detections": summary.to_records(sampler.kept),
+        },
+    }
@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+def detection_key(
+    binary_image: bytes,
+    exam_type: str,
+    image_size: int,
+    conf: float,
+    augment: bool,
+    decode_size: Optional[int],
+    tiling: str = "",
+) -> str:
+    """
+    Gera a chave de cache da detecção de um arquivo enviado.
+
+    Args:
+        binary_image (bytes): Os bytes do arquivo enviado.
+        exam_type (str): O tipo de exame (modelo).
+        image_size (int): O tamanho da imagem usado na inferência.
+        conf (float): O limiar de confiança usado na inferência.
+        augment (bool): Se a inferência usa aumento de dados.
+        decode_size (int): O tamanho alvo da decodificação em escala reduzida
+            do arquivo, ou None quando ele é decodificado em resolução
+            original; as duas decodificações geram caixas ligeiramente diferentes.
+        tiling (str, opcional): Parâmetros da inferência em blocos, se usada.
+
+    Returns:
+        str: Hash do conteúdo do arquivo combinado com os parâmetros.
+    """
+    digest = hashlib.blake2b(binary_image, digest_size=16).hexdigest()
+    decode = f"decode={decode_size or 'full'}"
+    if tiling:
+        return (
+            f"{exam_type}:{image_size}:{conf}:{int(augment)}:{decode}:{tiling}:{digest}"
+        )
+    return f"{exam_type}:{image_size}:{conf}:{int(augment)}:{decode}:{digest}"
+
+
+class DetectionCache:
+    """
+    Cache dos resultados de detecção por conteúdo do arquivo enviado.
+
+    Os resultados ficam em um LRU limitado por número de entradas e por
+    memória estimada. Chamadas concorrentes para a mesma chave são
+    coalescidas (single-flight): apenas a primeira executa a inferência e as
+    demais aguardam o mesmo resultado.
+
+    Os resultados armazenados são compartilhados e não devem ser alterados
+    pelos chamadores.
+
+    Args:
+        max_entries (int): Número máximo de resultados armazenados.
+        max_bytes (int): Memória máxima estimada dos resultados (0 = sem limite).
+        size_fn (Callable): Função que estima o tamanho de um resultado em bytes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int = 0,
+        size_fn: Callable[[Any], int] = lambda result: 0,
+    ):
+        self._max_entries = max(1, max_entries)
+        self._max_bytes = max_bytes or None
+        self._size_fn = size_fn
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key: str, result: Any):
+        size = self._size_fn(result)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > 1 and (
+                len(self._entries) > self._max_entries
+                or (self._max_bytes and self._bytes > self._max_bytes)
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    async def get_many(
+        self,
+        keys: List[str],
+        compute_many: Callable[[List[int]], Awaitable[List[Any]]],
+    ) -> List[Any]:
+        """
+        Retorna o resultado de cada chave, calculando apenas os que faltam.
+
+        Args:
+            keys (List[str]): As chaves geradas por `detection_key`.
+            compute_many (Callable): Corrotina que recebe os índices das chaves
+                sem resultado e retorna um resultado por índice, na mesma ordem.
+                Os índices ausentes são calculados juntos, em um único lote.
+
+        Returns:
+            List: Um resultado por chave, na mesma ordem da entrada.
+        """
+        loop = asyncio.get_running_loop()
+        results = [None] * len(keys)
+        owned: List[int] = []
+        waiting: Dict[int, asyncio.Future] = {}
+
+        for index, key in enumerate(keys):
+            cached = self._get(key)
+            if cached is not None:
+                self.hits += 1
+                results[index] = cached
+            elif key in self._inflight:
+                # Mesmo arquivo já em processamento, nesta ou em outra requisição
+                self.coalesced += 1
+                waiting[index] = self._inflight[key]
+            else:
+                self.misses += 1
+                self._inflight[key] = loop.create_future()
+                owned.append(index)
+
+        if owned:
+            try:
+                computed = await compute_many(owned)
+            except BaseException as e:
+                error = (
+                    e
+                    if isinstance(e, Exception)
+                    else RuntimeError("Inferência compartilhada interrompida")
+                )
+                for index in owned:
+                    future = self._inflight.pop(keys[index], None)
+                    if future is not None and not future.done():
+                        future.set_exception(error)
+                        # Evita o aviso de exceção não lida quando não há espera
+                        future.exception()
+                raise
+
+            for index, result in zip(owned, computed):
+                results[index] = result
+                self._put(keys[index], result)
+                future = self._inflight.pop(keys[index], None)
+                if future is not None and not future.done():
+                    future.set_result(result)
+
+        for index, future in waiting.items():
+            results[index] = await asyncio.shield(future)
+        return results
+
+    def stats(self) -> dict:
+        """Retorna o tamanho e os contadores do cache."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes or 0,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+def build_name_table(names: Dict[int, str]) -> np.ndarray:
+    """
+    Monta a tabela de nomes das classes indexada pelo ID da classe.
+
+    Args:
+        names (dict): Mapeamento ID da classe -> nome (ex: `model.model.names`).
+
+    Returns:
+        np.ndarray: Array de nomes em que a posição i contém o nome da classe i.
+    """
+    size = max(names, default=-1) + 1
+    table = np.array([str(i) for i in range(size)], dtype=object)
+    for class_id, name in names.items():
+        table[class_id] = name
+    return table
+
+
+class Detections:
+    """
+    Resultado de detecção de uma imagem em arrays NumPy contíguos.
+
+    Args:
+        boxes (np.ndarray): Bounding boxes (N, 4) no formato xyxy em pixels.
+        confidence (np.ndarray): Confiança de cada detecção (N,).
+        class_id (np.ndarray): ID da classe de cada detecção (N,).
+        names (np.ndarray): Tabela de nomes das classes (ver `build_name_table`).
+    """
+
+    __slots__ = ("boxes", "confidence", "class_id", "names")
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        confidence: np.ndarray,
+        class_id: np.ndarray,
+        names: np.ndarray,
+    ):
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidence = np.ascontiguousarray(confidence, dtype=np.float32).reshape(-1)
+        self.class_id = np.ascontiguousarray(class_id, dtype=np.int32).reshape(-1)
+        self.names = names
+
+    @classmethod
+    def empty(cls, names: np.ndarray) -> "Detections":
+        """Cria um resultado sem detecções."""
+        return cls(
+            np.empty((0, 4), np.float32),
+            np.empty(0, np.float32),
+            np.empty(0, np.int32),
+            names,
+        )
+
+    @classmethod
+    def from_result(cls, result, names: np.ndarray) -> "Detections":
+        """
+        Converte a saída de uma imagem do YOLOv8 (`Results`) em Detections.
+
+        Args:
+            result: A previsão do YOLOv8 para uma imagem.
+            names (np.ndarray): Tabela de nomes das classes do modelo.
+
+        Returns:
+            Detections: As detecções da imagem.
+        """
+        # Uma única cópia dos tensores para a CPU/NumPy
+        boxes = result.boxes.cpu().numpy()
+        return cls(boxes.xyxy, boxes.conf, boxes.cls, names)
+
+    def __len__(self) -> int:
+        return len(self.confidence)
+
+    def __repr__(self) -> str:
+        return f"Detections({', '.join(self.labels)})"
+
+    @property
+    def labels(self) -> List[str]:
+        """Nome da classe de cada detecção."""
+        return self.names[self.class_id].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelos arrays do resultado."""
+        return self.boxes.nbytes + self.confidence.nbytes + self.class_id.nbytes
+
+    def select(self, index) -> "Detections":
+        """Retorna as detecções selecionadas por uma máscara ou índices."""
+        return Detections(
+            self.boxes[index], self.confidence[index], self.class_id[index], self.names
+        )
+
+    def scaled(self, factor: Union[float, Tuple[float, float]]) -> "Detections":
+        """
+        Retorna as detecções com as coordenadas multiplicadas por `factor`.
+
+        Args:
+            factor (float | Tuple[float, float]): O fator dos dois eixos, ou
+                (fator de x, fator de y) quando os eixos têm escalas diferentes.
+        """
+        x_factor, y_factor = factor if isinstance(factor, tuple) else (factor, factor)
+        if x_factor == 1 and y_factor == 1:
+            return self
+        factors = np.array(
+            [x_factor, y_factor, x_factor, y_factor], dtype=self.boxes.dtype
+        )
+        return Detections(
+            self.boxes * factors, self.confidence, self.class_id, self.names
+        )
+
+    def sorted_by_xmin(self) -> "Detections":
+        """Retorna as detecções ordenadas pela coordenada xmin."""
+        return self.select(np.argsort(self.boxes[:, 0], kind="stable"))
+
+    def best(self, name: str) -> Optional[int]:
+        """Retorna o índice da detecção de maior confiança da classe `name`."""
+        matches = np.flatnonzero(self.names[self.class_id] == name)
+        if not len(matches):
+            return None
+        return int(matches[np.argmax(self.confidence[matches])])
+
+    def to_records(self, with_boxes: bool = False) -> List[dict]:
+        """
+        Serializa as detecções no formato de resposta da API.
+
+        Args:
+            with_boxes (bool, opcional): Se deve incluir "class_id" e "box"
+                (xmin, ymin, xmax, ymax em pixels). Padrão é False.
+
+        Returns:
+            List[dict]: Lista de {"name": str, "confidence": float}.
+        """
+        confidences = np.round(self.confidence.astype(np.float64), 10).tolist()
+        records = [
+            {"name": name, "confidence": confidence}
+            for name, confidence in zip(self.labels, confidences)
+        ]
+        if with_boxes:
+            boxes = np.round(self.boxes.astype(np.float64), 2).tolist()
+            for record, class_id, box in zip(records, self.class_id.tolist(), boxes):
+                record["class_id"] = class_id
+                record["box"] = box
+        return records
@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from config import EXECUTOR_MAX_WORKERS, INFERENCE_WORKERS, STAGE_CONCURRENCY
+from utils.logger import get_logger
+from utils.metrics import STAGE_WAIT, stage_timer
+
+logger = get_logger()
+
+# Limite padrão de execuções simultâneas por etapa do processamento
+DEFAULT_STAGE_CONCURRENCY = {
+    "ingest": 4,
+    "decode": 4,
+    # Com processos de inferência, um lote por processo
+    "inference": max(2, INFERENCE_WORKERS),
+    "tiling": 4,
+    "annotate": 4,
+    "encode": 4,
+    "cache": 4,
+    "jobs": 2,
+}
+
+# Pool de threads compartilhado pelas etapas bloqueantes
+_executor = ThreadPoolExecutor(
+    max_workers=EXECUTOR_MAX_WORKERS or None, thread_name_prefix="stage"
+)
+
+_stage_limits: Dict[str, int] = {**DEFAULT_STAGE_CONCURRENCY, **STAGE_CONCURRENCY}
+_stage_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _get_semaphore(stage: str) -> asyncio.Semaphore:
+    semaphore = _stage_semaphores.get(stage)
+    if semaphore is None:
+        limit = _stage_limits.get(stage, 4)
+        semaphore = _stage_semaphores[stage] = asyncio.Semaphore(limit)
+    return semaphore
+
+
+async def run_in_stage(stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Executa uma função bloqueante fora do event loop, respeitando o limite
+    de concorrência da etapa.
+
+    A espera pelo limite e a duração da execução são registradas nas
+    métricas da etapa, com os rótulos da requisição que a originou.
+
+    Args:
+        stage (str): Nome da etapa (ex: "decode", "inference", "annotate").
+        fn (Callable): A função síncrona a ser executada.
+        *args: Argumentos posicionais de `fn`.
+        **kwargs: Argumentos nomeados de `fn`.
+
+    Returns:
+        O retorno de `fn`.
+    """
+    loop = asyncio.get_running_loop()
+    # A thread herda o contexto (rótulos de métricas) da tarefa que a chamou
+    context = contextvars.copy_context()
+    queued_at = time.perf_counter()
+    async with _get_semaphore(stage):
+        return await loop.run_in_executor(
+            _executor,
+            functools.partial(
+                context.run, _timed, stage, queued_at, fn, *args, **kwargs
+            ),
+        )
+
+
+def _timed(
+    stage: str, queued_at: float, fn: Callable[..., Any], *args, **kwargs
+) -> Any:
+    STAGE_WAIT.labels(stage=stage).observe(time.perf_counter() - queued_at)
+    with stage_timer(stage):
+        return fn(*args, **kwargs)
+
+
+def stage_limits() -> Dict[str, int]:
+    """Retorna o limite de concorrência configurado para cada etapa."""
+    return dict(_stage_limits)
+
+
+def shutdown():
+    """Encerra o pool de threads aguardando as tarefas em andamento."""
+    _executor.shutdown(wait=True)
@@ -0,0 +1,550 @@
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+import anyio
+
+from config import (
+    GPT_MAX_CONCURRENCY,
+    GPT_MAX_CONNECTIONS,
+    GPT_MAX_RETRIES,
+    GPT_MODEL,
+    GPT_TEMPERATURE,
+    GPT_TIMEOUT_S,
+    INTERPRETATION_CACHE_CONFIDENCE_PRECISION,
+    INTERPRETATION_CACHE_DB,
+    INTERPRETATION_CACHE_ENABLED,
+    INTERPRETATION_CACHE_MAX_ENTRIES,
+    INTERPRETATION_CACHE_TTL_S,
+    INTERPRETATION_BATCH_ENABLED,
+    INTERPRETATION_BATCH_MAX_FILES,
+    INTERPRETATION_BATCH_RESPONSE_FORMAT,
+    OPENAI_BASE_URL,
+    api_key,
+)
+from services.interpretation_cache import InterpretationCache, interpretation_key
+from utils.logger import get_logger
+from utils.metrics import (
+    INTERPRETATION_BATCHES,
+    STAGE_DURATION,
+    STAGE_ERRORS,
+    current_labels,
+    stage_timer,
+)
+from utils.profiling import record_span
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = get_logger()
+
+SYSTEM_MESSAGE = "Output the response as a single, simple paragraph in Portuguese."
+BATCH_SYSTEM_MESSAGE = (
+    'Output a JSON object with the key "interpretations": a list with one item per '
+    'file, in the same order, each with the keys "file" (the file index) and '
+    '"interpretation" (a single, simple paragraph in Portuguese).'
+)
+# Esquema da resposta em lote com INTERPRETATION_BATCH_RESPONSE_FORMAT=json_schema
+BATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "interpretations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "file": {"type": "integer"},
+                    "interpretation": {"type": "string"},
+                },
+                "required": ["file", "interpretation"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["interpretations"],
+    "additionalProperties": False,
+}
+
+_client: Optional["AsyncOpenAI"] = None
+_semaphore = asyncio.Semaphore(GPT_MAX_CONCURRENCY)
+
+# Interpretações já obtidas para o mesmo conjunto normalizado de achados
+interpretation_cache = InterpretationCache(
+    max_entries=INTERPRETATION_CACHE_MAX_ENTRIES,
+    ttl_s=INTERPRETATION_CACHE_TTL_S,
+    db_path=INTERPRETATION_CACHE_DB,
+)
+
+
+def import_client_stack():
+    """
+    Importa o cliente da OpenAI (e o httpx) fora do caminho das requisições.
+
+    Chamado no aquecimento do worker; sem ele, a importação acontece na
+    primeira chamada ao GPT.
+    """
+    with stage_timer("import"):
+        import httpx  # noqa: F401
+        import openai  # noqa: F401
+
+
+def get_client() -> "AsyncOpenAI":
+    """
+    Retorna o cliente assíncrono da OpenAI compartilhado pelo worker.
+
+    O cliente mantém um pool de conexões HTTP reaproveitadas entre as
+    requisições e repete automaticamente, com backoff exponencial, as chamadas
+    que falham com 408/409/429/5xx ou erro de conexão.
+
+    Returns:
+        AsyncOpenAI: O cliente compartilhado.
+    """
+    global _client
+    if _client is None:
+        # Importados no primeiro uso para não atrasar a inicialização do worker
+        import httpx
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=OPENAI_BASE_URL or None,
+            timeout=GPT_TIMEOUT_S,
+            max_retries=GPT_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=GPT_MAX_CONNECTIONS,
+                    max_keepalive_connections=GPT_MAX_CONNECTIONS,
+                ),
+                timeout=GPT_TIMEOUT_S,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Fecha o pool de conexões do cliente compartilhado."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def create_chat_completion(
+    prompt: str, system_message: str = SYSTEM_MESSAGE, response_format: dict = None
+) -> str:
+    """
+    Envia um prompt ao modelo GPT e retorna o texto da resposta.
+
+    O número de chamadas simultâneas por worker é limitado por
+    GPT_MAX_CONCURRENCY.
+
+    Args:
+        prompt (str): O prompt do usuário.
+        system_message (str, opcional): A mensagem de sistema.
+        response_format (dict, opcional): O formato da resposta (ex: JSON).
+
+    Returns:
+        str: O conteúdo da resposta do modelo.
+    """
+    options = {"response_format": response_format} if response_format else {}
+    async with _semaphore:
+        with stage_timer("gpt"):
+            response = await get_client().chat.completions.create(
+                model=GPT_MODEL,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=GPT_TEMPERATURE,
+                **options,
+            )
+    return response.choices[0].message.content
+
+
+async def stream_chat_completion(
+    prompt: str, system_message: str = SYSTEM_MESSAGE
+) -> AsyncIterator[str]:
+    """
+    Envia um prompt ao modelo GPT e retorna os trechos da resposta à medida
+    que chegam.
+
+    A vaga de GPT_MAX_CONCURRENCY fica reservada até o fim da resposta. Se o
+    consumidor parar a iteração (por exemplo, porque o cliente desconectou),
+    a conexão com a OpenAI é encerrada e a vaga é liberada. O tempo até o
+    primeiro trecho é registrado na etapa "gpt_first_token".
+
+    Args:
+        prompt (str): O prompt do usuário.
+        system_message (str, opcional): A mensagem de sistema.
+
+    Yields:
+        str: Os trechos de texto da resposta.
+    """
+    labels = current_labels()
+    async with _semaphore:
+        started = time.perf_counter()
+        first_token = True
+        try:
+            stream = await get_client().chat.completions.create(
+                model=GPT_MODEL,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=GPT_TEMPERATURE,
+                stream=True,
+            )
+            try:
+                async for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if not text:
+                        continue
+                    if first_token:
+                        first_token = False
+                        STAGE_DURATION.labels(
+                            stage="gpt_first_token", **labels
+                        ).observe(time.perf_counter() - started)
+                        record_span("gpt_first_token", started)
+                    yield text
+            finally:
+                # Com a iteração cancelada, o fechamento da conexão é protegido
+                # do cancelamento
+                with anyio.CancelScope(shield=True):
+                    await stream.close()
+        except Exception:
+            STAGE_ERRORS.labels(stage="gpt", **labels).inc()
+            raise
+        finally:
+            STAGE_DURATION.labels(stage="gpt", **labels).observe(
+                time.perf_counter() - started
+            )
+            record_span("gpt", started)
+
+
+def build_interpretation_prompt(detections: List[dict]) -> str:
+    """Monta o prompt de interpretação clínica a partir das detecções de uma imagem."""
+    return (
+        "Descreva em um único parágrafo simples a interpretação clínica "
+        "dos dados fornecidos. "
+        "Faça isso em português. "
+        "O retorno deve ser um único parágrafo. "
+        "Dados: " + str(detections)
+    )
+
+
+def build_batch_interpretation_prompt(detections_per_file: List[List[dict]]) -> str:
+    """Monta um único prompt de interpretação com as detecções de vários arquivos."""
+    files = [
+        {"file": index, "dados": detections}
+        for index, detections in enumerate(detections_per_file)
+    ]
+    return (
+        "Para cada arquivo, descreva em um único parágrafo simples a interpretação "
+        "clínica dos dados fornecidos, considerando apenas os dados do "
+        "próprio arquivo. "
+        "Faça isso em português. "
+        "Arquivos: " + json.dumps(files, ensure_ascii=False)
+    )
+
+
+def parse_batch_interpretations(content: str, count: int) -> List[str]:
+    """
+    Separa a resposta em lote em uma interpretação por arquivo.
+
+    Args:
+        content (str): O JSON retornado pelo modelo (ver BATCH_SYSTEM_MESSAGE).
+        count (int): O número de arquivos enviados.
+
+    Returns:
+        List[str]: As interpretações, na ordem dos arquivos.
+
+    Raises:
+        ValueError: Se a resposta não tiver exatamente uma interpretação por arquivo.
+    """
+    items = json.loads(content)
+    if isinstance(items, dict):
+        items = items.get("interpretations")
+    if not isinstance(items, list) or len(items) != count:
+        raise ValueError(f"esperadas {count} interpretações")
+    interpretations = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError("item da resposta não é um objeto")
+        text = item.get("interpretation")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("interpretação vazia")
+        interpretations[int(item.get("file", position))] = text.strip()
+    if set(interpretations) != set(range(count)):
+        raise ValueError("índices de arquivo inválidos")
+    return [interpretations[index] for index in range(count)]
+
+
+def _batch_response_format() -> dict:
+    if INTERPRETATION_BATCH_RESPONSE_FORMAT == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "clinical_interpretations",
+                "strict": True,
+                "schema": BATCH_RESPONSE_SCHEMA,
+            },
+        }
+    return {"type": "json_object"}
+
+
+def build_chat_prompt(detection_results: dict) -> str:
+    """Monta o prompt do endpoint /chat a partir dos resultados de detecção."""
+    return (
+        "descreva em um único parágrafo simples a interpretação clínica "
+        "dos dados de ECG fornecidos, "
+        "Faça isso em português. "
+        "o retorno deve ser um unico paragrafo"
+        "Dados de ECG: " + str(detection_results)
+    )
+
+
+async def _stream_cached_completion(
+    kind: str, detections, exam_type: str, prompt: str
+) -> AsyncIterator[str]:
+    """
+    Como `_cached_completion`, mas com a resposta em trechos (ver
+    `stream_chat_completion`).
+    """
+    key = None
+    if INTERPRETATION_CACHE_ENABLED:
+        key = _interpretation_key(kind, detections, exam_type)
+        message_content = await interpretation_cache.get(key)
+        if message_content is not None:
+            yield message_content
+            return
+    parts = []
+    async for text in stream_chat_completion(prompt):
+        parts.append(text)
+        yield text
+    # Apenas respostas completas vão para o cache
+    if key is not None:
+        await interpretation_cache.set(key, "".join(parts))
+
+
+def _interpretation_key(kind: str, detections, exam_type: str) -> str:
+    return interpretation_key(
+        kind,
+        detections,
+        exam_type,
+        GPT_MODEL,
+        GPT_TEMPERATURE,
+        INTERPRETATION_CACHE_CONFIDENCE_PRECISION,
+    )
+
+
+async def _cached_completion(kind: str, detections, exam_type: str, prompt: str) -> str:
+    """Retorna a interpretação em cache ou chama o GPT e armazena a resposta."""
+    if not INTERPRETATION_CACHE_ENABLED:
+        return await create_chat_completion(prompt)
+
+    key = _interpretation_key(kind, detections, exam_type)
+    message_content = await interpretation_cache.get(key)
+    if message_content is None:
+        message_content = await create_chat_completion(prompt)
+        await interpretation_cache.set(key, message_content)
+    return message_content
+
+
+async def get_clinical_interpretation(detections: List[dict], exam_type: str) -> str:
+    """
+    Obtém a interpretação clínica das detecções de uma imagem.
+
+    Args:
+        detections (List[dict]): Lista de detecções com "name" e "confidence".
+        exam_type (str): O tipo de exame analisado.
+
+    Returns:
+        str: A interpretação clínica em um único parágrafo.
+    """
+    return await _cached_completion(
+        "interpretation", detections, exam_type, build_interpretation_prompt(detections)
+    )
+
+
+async def _batch_completion(detections_per_file: List[List[dict]]) -> List[str]:
+    """
+    Interpreta vários arquivos em uma única chamada ao GPT.
+
+    Se a resposta não puder ser separada por arquivo, ou o modelo recusar o
+    formato de resposta, cada arquivo é interpretado em uma chamada própria.
+    """
+    if len(detections_per_file) == 1:
+        return [
+            await create_chat_completion(
+                build_interpretation_prompt(detections_per_file[0])
+            )
+        ]
+    from openai import BadRequestError
+
+    try:
+        content = await create_chat_completion(
+            build_batch_interpretation_prompt(detections_per_file),
+            BATCH_SYSTEM_MESSAGE,
+            _batch_response_format(),
+        )
+        interpretations = parse_batch_interpretations(content, len(detections_per_file))
+        INTERPRETATION_BATCHES.labels(result="ok").inc()
+        return interpretations
+    except (ValueError, TypeError, BadRequestError) as e:
+        INTERPRETATION_BATCHES.labels(result="fallback").inc()
+        logger.warning(
+            "Interpretação em lote de {} arquivos falhou, "
+            "interpretando por arquivo: {}",
+            len(detections_per_file),
+            str(e),
+        )
+    return list(
+        await asyncio.gather(
+            *(
+                create_chat_completion(build_interpretation_prompt(detections))
+                for detections in detections_per_file
+            )
+        )
+    )
+
+
+async def get_clinical_interpretations(
+    detections_per_file: List[List[dict]], exam_type: str
+) -> List[str]:
+    """
+    Obtém as interpretações clínicas de vários arquivos.
+
+    Com INTERPRETATION_BATCH_ENABLED, os arquivos sem interpretação em cache
+    são enviados juntos, em chamadas de até INTERPRETATION_BATCH_MAX_FILES
+    arquivos com resposta em JSON, e arquivos com achados equivalentes são
+    interpretados uma única vez. Sem ele, cada arquivo tem a sua chamada,
+    feitas de forma concorrente.
+
+    Args:
+        detections_per_file (List[List[dict]]): As detecções de cada arquivo.
+        exam_type (str): O tipo de exame analisado.
+
+    Returns:
+        List[str]: Uma interpretação por arquivo, na mesma ordem da entrada.
+    """
+    if not INTERPRETATION_BATCH_ENABLED or len(detections_per_file) < 2:
+        return list(
+            await asyncio.gather(
+                *(
+                    get_clinical_interpretation(detections, exam_type)
+                    for detections in detections_per_file
+                )
+            )
+        )
+
+    # Arquivos por chave de interpretação, na ordem da primeira ocorrência; sem
+    # o cache, apenas arquivos com detecções idênticas compartilham a chamada
+    pending: Dict[str, List[int]] = {}
+    for index, detections in enumerate(detections_per_file):
+        if INTERPRETATION_CACHE_ENABLED:
+            key = _interpretation_key("interpretation", detections, exam_type)
+        else:
+            key = json.dumps(detections, sort_keys=True, default=str)
+        pending.setdefault(key, []).append(index)
+
+    interpretations = [None] * len(detections_per_file)
+    if INTERPRETATION_CACHE_ENABLED:
+        for key in list(pending):
+            message_content = await interpretation_cache.get(key)
+            if message_content is not None:
+                for index in pending.pop(key):
+                    interpretations[index] = message_content
+
+    keys = list(pending)
+    batch_size = max(1, INTERPRETATION_BATCH_MAX_FILES)
+    batches = [
+        keys[start : start + batch_size] for start in range(0, len(keys), batch_size)
+    ]
+    answers = await asyncio.gather(
+        *(
+            _batch_completion([detections_per_file[pending[key][0]] for key in batch])
+            for batch in batches
+        )
+    )
+    for batch, messages in zip(batches, answers):
+        for key, message_content in zip(batch, messages):
+            if INTERPRETATION_CACHE_ENABLED:
+                await interpretation_cache.set(key, message_content)
+            for index in pending[key]:
+                interpretations[index] = message_content
+    return interpretations
+
+
+class SharedInterpretations:
+    """
+    Interpretações de vários arquivos obtidas em uma única tarefa (ver
+    `get_clinical_interpretations`), compartilhada pelos resultados de cada arquivo.
+
+    A tarefa começa na criação. `close` deve ser chamado quando os arquivos
+    terminam ou falham: a tarefa em andamento é cancelada, para que a
+    chamada ao GPT não continue sem ninguém aguardando, e a exceção de uma
+    tarefa encerrada é recuperada.
+
+    Args:
+        detections_per_file (List[List[dict]]): As detecções de cada arquivo.
+        exam_type (str): O tipo de exame analisado.
+    """
+
+    def __init__(self, detections_per_file: List[List[dict]], exam_type: str):
+        self._task = asyncio.ensure_future(
+            get_clinical_interpretations(detections_per_file, exam_type)
+        )
+
+    async def get(self, index: int) -> str:
+        """A interpretação do arquivo `index`."""
+        # O cancelamento de um arquivo não cancela a chamada dos demais
+        return (await asyncio.shield(self._task))[index]
+
+    def close(self):
+        if not self._task.done():
+            self._task.cancel()
+        elif not self._task.cancelled():
+            # Evita o aviso "Task exception was never retrieved"
+            self._task.exception()
+
+
+def stream_clinical_interpretation(
+    detections: List[dict], exam_type: str
+) -> AsyncIterator[str]:
+    """
+    Obtém a interpretação clínica das detecções de uma imagem em trechos.
+
+    Args:
+        detections (List[dict]): Lista de detecções com "name" e "confidence".
+        exam_type (str): O tipo de exame analisado.
+
+    Returns:
+        AsyncIterator[str]: Os trechos da interpretação, na ordem; uma
+            interpretação em cache chega em um único trecho.
+    """
+    return _stream_cached_completion(
+        "interpretation", detections, exam_type, build_interpretation_prompt(detections)
+    )
+
+
+def stream_chat_interpretation(detection_results: dict) -> AsyncIterator[str]:
+    """Como `get_chat_interpretation`, mas com a resposta em trechos."""
+    return _stream_cached_completion(
+        "chat", detection_results, "chat", build_chat_prompt(detection_results)
+    )
+
+
+async def get_chat_interpretation(detection_results: dict) -> str:
+    """
+    Obtém a interpretação clínica para o endpoint /chat.
+
+    Args:
+        detection_results (dict): Os resultados de detecção enviados pelo cliente.
+
+    Returns:
+        str: A interpretação clínica em um único parágrafo.
+    """
+    return await _cached_completion(
+        "chat", detection_results, "chat", build_chat_prompt(detection_results)
+    )
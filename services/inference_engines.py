@@ -0,0 +1,448 @@
+import ast
+import functools
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from services.detections import Detections, build_name_table
+from services.model_registry import estimate_model_bytes
+from utils.metrics import stage_timer
+from utils.uses_for_images import get_array_from_image
+
+ENGINES = ("torch", "onnxruntime", "openvino")
+
+# Parâmetros do NMS, iguais aos padrões do ultralytics
+NMS_IOU = 0.7
+NMS_MAX_DETECTIONS = 300
+NMS_MAX_CANDIDATES = 30000
+# Deslocamento das caixas por classe, para um único NMS separar as classes
+_MAX_WH = 7680
+# Múltiplo do tamanho de entrada dos modelos exportados com tamanho dinâmico
+_STRIDE = 32
+_PAD_COLOR = 114
+
+
+def import_inference_stack():
+    """
+    Importa o ultralytics (e o torch) na primeira vez que for necessário.
+
+    A importação leva segundos e fica fora da inicialização do worker: ela
+    acontece no pré-carregamento dos modelos ou no primeiro carregamento de
+    modelo de uma requisição.
+    """
+    with stage_timer("import"):
+        from ultralytics import YOLO
+    return YOLO
+
+
+def engine_model_path(engine: str, weights_path: str) -> str:
+    """
+    Retorna o arquivo do modelo usado por um motor de inferência.
+
+    Os caminhos seguem os nomes gerados pelo export do ultralytics
+    (ver tools/export_onnx.py): `modelo.onnx` e
+    `modelo_openvino_model/modelo.xml` ao lado de `modelo.pt`.
+
+    Args:
+        engine (str): O motor ("torch", "onnxruntime" ou "openvino").
+        weights_path (str): O caminho dos pesos .pt do modelo.
+
+    Raises:
+        ValueError: Se o motor não for suportado.
+    """
+    stem = os.path.splitext(weights_path)[0]
+    if engine == "torch":
+        return weights_path
+    if engine == "onnxruntime":
+        return stem + ".onnx"
+    if engine == "openvino":
+        return os.path.join(stem + "_openvino_model", os.path.basename(stem) + ".xml")
+    raise ValueError(f"Motor de inferência não suportado: {engine}")
+
+
+def engine_for_path(model_path: str) -> str:
+    """Motor de inferência que carrega o arquivo, pela extensão."""
+    suffix = os.path.splitext(model_path)[1].lower()
+    if suffix == ".onnx":
+        return "onnxruntime"
+    if suffix == ".xml":
+        return "openvino"
+    return "torch"
+
+
+@functools.lru_cache(maxsize=None)
+def _cv2():
+    # O opencv vem com o ultralytics; sem ele, o redimensionamento usa o Pillow
+    try:
+        import cv2
+    except ImportError:
+        return None
+    return cv2
+
+
+def _resize(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    cv2 = _cv2()
+    if cv2 is None:
+        return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+    return cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+
+
+def letterbox(
+    image: np.ndarray, shape: Tuple[int, int]
+) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Redimensiona a imagem mantendo a proporção e completa o restante com cinza,
+    como o pré-processamento do ultralytics.
+
+    Args:
+        image (np.ndarray): A imagem (H, W, 3).
+        shape (Tuple[int, int]): Altura e largura de entrada do modelo.
+
+    Returns:
+        Tuple[np.ndarray, float, Tuple[int, int]]: A imagem com borda, o fator
+            de escala aplicado e o deslocamento (x, y) da imagem na borda.
+    """
+    height, width = image.shape[:2]
+    new_height, new_width = shape
+    gain = min(new_height / height, new_width / width)
+    resized_width, resized_height = int(round(width * gain)), int(round(height * gain))
+    if (resized_width, resized_height) != (width, height):
+        image = _resize(image, (resized_width, resized_height))
+    left = int(round((new_width - resized_width) / 2 - 0.1))
+    top = int(round((new_height - resized_height) / 2 - 0.1))
+    canvas = np.full((new_height, new_width, 3), _PAD_COLOR, dtype=np.uint8)
+    canvas[top : top + resized_height, left : left + resized_width] = image
+    return canvas, gain, (left, top)
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU entre uma caixa xyxy (4,) e um conjunto de caixas (N, 4)."""
+    inter_w = np.clip(
+        np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None
+    )
+    inter_h = np.clip(
+        np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None
+    )
+    intersection = inter_w * inter_h
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def _nms(
+    boxes: np.ndarray, scores: np.ndarray, iou: float, max_detections: int
+) -> np.ndarray:
+    # NMS guloso; retorna os índices mantidos em ordem decrescente de confiança
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order) and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        order = order[1:][box_iou(boxes[best], boxes[order[1:]]) <= iou]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def non_max_suppression(
+    prediction: np.ndarray,
+    conf: float,
+    iou: float = NMS_IOU,
+    max_detections: int = NMS_MAX_DETECTIONS,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Filtra a saída bruta do YOLOv8 de uma imagem, como o NMS do ultralytics.
+
+    Args:
+        prediction (np.ndarray): Saída (4 + classes, âncoras), com as caixas
+            em xywh no espaço de entrada do modelo e o escore de cada classe.
+        conf (float): O limiar de confiança.
+        iou (float, opcional): O limiar de IoU do NMS, aplicado por classe.
+        max_detections (int, opcional): Número máximo de detecções.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Caixas xyxy (N, 4),
+            confiança (N,) e ID da classe (N,).
+    """
+    candidates = prediction.T
+    class_scores = candidates[:, 4:]
+    class_id = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(candidates)), class_id]
+    mask = scores > conf
+    xywh, scores, class_id = candidates[mask, :4], scores[mask], class_id[mask]
+
+    order = np.argsort(-scores, kind="stable")[:NMS_MAX_CANDIDATES]
+    xywh, scores, class_id = xywh[order], scores[order], class_id[order]
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+    keep = _nms(boxes + class_id[:, None] * _MAX_WH, scores, iou, max_detections)
+    return boxes[keep], scores[keep], class_id[keep]
+
+
+class InferenceEngine:
+    """
+    Modelo carregado por um motor de inferência.
+
+    Todos os motores recebem imagens BGR (ou PIL) e retornam `Detections`
+    com as coordenadas na resolução da imagem recebida.
+
+    Args:
+        names (dict): Mapeamento ID da classe -> nome.
+        size_bytes (int): Memória estimada do modelo.
+    """
+
+    engine = ""
+
+    def __init__(self, names: Dict[int, str], size_bytes: int):
+        self.names = build_name_table(names)
+        self.size_bytes = size_bytes
+
+    def detect(
+        self,
+        images: List[np.ndarray],
+        image_size: int,
+        conf: float,
+        augment: bool = False,
+        save: bool = False,
+    ) -> List[Detections]:
+        """
+        Executa a detecção em um lote de imagens.
+
+        Args:
+            images (List[np.ndarray]): As imagens (arrays BGR ou imagens PIL).
+            image_size (int): O tamanho da imagem que o modelo receberá.
+            conf (float): O limiar de confiança.
+            augment (bool, opcional): Aumento de dados na inferência (apenas torch).
+            save (bool, opcional): Salva as imagens anotadas (apenas torch).
+
+        Returns:
+            List[Detections]: As detecções de cada imagem, na ordem da entrada.
+        """
+        raise NotImplementedError
+
+
+class UltralyticsEngine(InferenceEngine):
+    """Modelo .pt executado pelo ultralytics (PyTorch)."""
+
+    engine = "torch"
+
+    def __init__(self, model_path: str):
+        YOLO = import_inference_stack()
+        with stage_timer("model_load"):
+            self.model = YOLO(model_path)
+        super().__init__(
+            self.model.model.names, estimate_model_bytes(self.model, model_path)
+        )
+
+    def detect(self, images, image_size, conf, augment=False, save=False):
+        with stage_timer("predict"):
+            predictions = self.model.predict(
+                imgsz=image_size,
+                source=images,
+                conf=conf,
+                save=save,
+                augment=augment,
+                flipud=0.0,
+                fliplr=0.0,
+                mosaic=0.0,
+            )
+        # Transforma as previsões de cada imagem em arrays NumPy
+        with stage_timer("postprocess"):
+            return [
+                Detections.from_result(prediction, self.names)
+                for prediction in predictions
+            ]
+
+
+def _parse_names(names, model_path: str) -> Dict[int, str]:
+    # O export do ultralytics grava os nomes como o repr de um dict
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    if not isinstance(names, dict):
+        raise ValueError(
+            f"Nomes das classes não encontrados nos metadados de {model_path}"
+        )
+    return {int(class_id): str(name) for class_id, name in names.items()}
+
+
+def _static_dim(dim) -> Optional[int]:
+    return dim if isinstance(dim, int) and dim > 0 else None
+
+
+class _ExportedEngine(InferenceEngine):
+    """
+    Base dos modelos exportados do YOLOv8, com pré e pós-processamento
+    próprios (letterbox e NMS em NumPy), sem depender do torch.
+
+    As subclasses definem `_batch`, `_shape` (None nas dimensões dinâmicas) e
+    `_run`, que executa o modelo em um tensor (N, 3, H, W).
+    """
+
+    _batch: Optional[int] = None
+    _shape: Tuple[Optional[int], Optional[int]] = (None, None)
+
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _input_shape(self, image_size: int) -> Tuple[int, int]:
+        size = math.ceil(image_size / _STRIDE) * _STRIDE
+        height, width = self._shape
+        return height or size, width or size
+
+    def _preprocess(self, images, shape):
+        blob = np.empty((len(images), 3, *shape), dtype=np.float32)
+        frames = []
+        for index, image in enumerate(images):
+            if isinstance(image, Image.Image):
+                image = get_array_from_image(image)
+            canvas, gain, pad = letterbox(image, shape)
+            # BGR -> RGB, HWC -> CHW e escala para [0, 1] em uma única passada
+            np.multiply(
+                canvas[:, :, ::-1].transpose(2, 0, 1),
+                np.float32(1 / 255),
+                out=blob[index],
+            )
+            frames.append((image.shape[:2], gain, pad))
+        return blob, frames
+
+    def detect(self, images, image_size, conf, augment=False, save=False):
+        if not len(images):
+            return []
+        with stage_timer("preprocess"):
+            blob, frames = self._preprocess(images, self._input_shape(image_size))
+        with stage_timer("predict"):
+            if self._batch:
+                outputs = np.concatenate(
+                    [
+                        self._run(blob[start : start + self._batch])
+                        for start in range(0, len(blob), self._batch)
+                    ]
+                )
+            else:
+                outputs = self._run(blob)
+        with stage_timer("postprocess"):
+            return [
+                self._postprocess(output, frame, conf)
+                for output, frame in zip(outputs, frames)
+            ]
+
+    def _postprocess(self, output: np.ndarray, frame, conf: float) -> Detections:
+        (height, width), gain, (left, top) = frame
+        boxes, scores, class_id = non_max_suppression(output, conf)
+        # Coordenadas de volta para a resolução da imagem recebida
+        boxes -= np.array([left, top, left, top], dtype=boxes.dtype)
+        boxes /= gain
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+        return Detections(boxes, scores, class_id, self.names)
+
+
+class OnnxRuntimeEngine(_ExportedEngine):
+    """
+    Modelo .onnx (inclusive quantizado em INT8) executado pelo ONNX Runtime na CPU.
+
+    Args:
+        model_path (str): O arquivo .onnx exportado pelo ultralytics.
+        cpu_threads (int, opcional): Threads de CPU da sessão (0 = padrão).
+    """
+
+    engine = "onnxruntime"
+
+    def __init__(self, model_path: str, cpu_threads: int = 0):
+        with stage_timer("import"):
+            import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if cpu_threads:
+            options.intra_op_num_threads = cpu_threads
+        with stage_timer("model_load"):
+            self._session = onnxruntime.InferenceSession(
+                model_path, options, providers=["CPUExecutionProvider"]
+            )
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._batch = _static_dim(model_input.shape[0])
+        self._shape = (
+            _static_dim(model_input.shape[2]),
+            _static_dim(model_input.shape[3]),
+        )
+        names = self._session.get_modelmeta().custom_metadata_map.get("names")
+        super().__init__(_parse_names(names, model_path), os.path.getsize(model_path))
+
+    def _run(self, blob):
+        return self._session.run(None, {self._input_name: blob})[0]
+
+
+class OpenVinoEngine(_ExportedEngine):
+    """
+    Modelo OpenVINO IR (.xml e .bin) executado pelo OpenVINO na CPU.
+
+    Args:
+        model_path (str): O arquivo .xml exportado pelo ultralytics; os nomes
+            das classes vêm do metadata.yaml do mesmo diretório.
+        cpu_threads (int, opcional): Threads de CPU do modelo (0 = padrão).
+    """
+
+    engine = "openvino"
+
+    def __init__(self, model_path: str, cpu_threads: int = 0):
+        with stage_timer("import"):
+            import openvino
+            import yaml
+
+        core = openvino.Core()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if cpu_threads:
+            config["INFERENCE_NUM_THREADS"] = cpu_threads
+        with stage_timer("model_load"):
+            self._compiled = core.compile_model(
+                core.read_model(model_path), "CPU", config
+            )
+        self._output = self._compiled.output(0)
+        dims = [
+            dim.get_length() if dim.is_static else None
+            for dim in self._compiled.input(0).get_partial_shape()
+        ]
+        self._batch = _static_dim(dims[0])
+        self._shape = (_static_dim(dims[2]), _static_dim(dims[3]))
+
+        metadata_path = os.path.join(os.path.dirname(model_path), "metadata.yaml")
+        names = None
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                names = (yaml.safe_load(file) or {}).get("names")
+        weights_path = os.path.splitext(model_path)[0] + ".bin"
+        size_bytes = os.path.getsize(model_path) + (
+            os.path.getsize(weights_path) if os.path.exists(weights_path) else 0
+        )
+        super().__init__(_parse_names(names, model_path), size_bytes)
+
+    def _run(self, blob):
+        return self._compiled(blob)[self._output]
+
+
+def load_engine(model_path: str, cpu_threads: int = 0) -> InferenceEngine:
+    """
+    Carrega um modelo no motor correspondente à extensão do arquivo:
+    .onnx no ONNX Runtime, .xml no OpenVINO e os demais (.pt) no ultralytics.
+
+    Args:
+        model_path (str): O arquivo do modelo.
+        cpu_threads (int, opcional): Threads de CPU dos motores ONNX Runtime e
+            OpenVINO (0 = padrão do runtime).
+
+    Returns:
+        InferenceEngine: O modelo carregado.
+    """
+    engine = engine_for_path(model_path)
+    if engine == "onnxruntime":
+        return OnnxRuntimeEngine(model_path, cpu_threads)
+    if engine == "openvino":
+        return OpenVinoEngine(model_path, cpu_threads)
+    return UltralyticsEngine(model_path)
@@ -0,0 +1,543 @@
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from services.detections import Detections, build_name_table
+from utils.logger import get_logger
+from utils.metrics import STAGE_DURATION, current_labels, stage_timer
+from utils.profiling import record_span
+from utils.uses_for_images import get_array_from_image
+
+logger = get_logger()
+
+# Alinhamento de cada imagem dentro da memória compartilhada
+_ALIGN = 64
+# Tempo máximo para um processo novo importar os módulos e ficar pronto
+_START_TIMEOUT_S = 60
+
+
+def _close_segments(
+    segments: List[shared_memory.SharedMemory],
+) -> List[shared_memory.SharedMemory]:
+    """Fecha os segmentos e retorna os que ainda não puderam ser fechados."""
+    still_open = []
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # O predictor ainda referencia as imagens do último lote do
+            # segmento; o fechamento é tentado de novo depois do próximo lote
+            still_open.append(segment)
+    return still_open
+
+
+class InferenceWorkerError(RuntimeError):
+    """Falha de um processo de inferência (erro no lote, encerramento ou timeout)."""
+
+
+def split_cores(cores: List[int], workers: int) -> List[List[int]]:
+    """
+    Divide os núcleos disponíveis em grupos contíguos, um por processo.
+
+    Com mais processos que núcleos, os grupos se repetem.
+    """
+    if not cores:
+        return [[] for _ in range(workers)]
+    if workers >= len(cores):
+        return [[cores[index % len(cores)]] for index in range(workers)]
+    size, extra = divmod(len(cores), workers)
+    groups, start = [], 0
+    for index in range(workers):
+        end = start + size + (index < extra)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def _worker_main(conn, model_paths, cores, threads, max_batch_size, registry_limits):
+    """
+    Laço de um processo de inferência.
+
+    Recebe comandos pelo pipe, lê as imagens da memória compartilhada do
+    processo e responde com as detecções em um único array float32
+    (x1, y1, x2, y2, confiança, classe) e a quantidade por imagem.
+    """
+    from services.inference_engines import engine_for_path, load_engine
+    from services.model_registry import ModelRegistry
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    threads = threads or len(cores) or os.cpu_count() or 1
+
+    def load(model_path: str):
+        if engine_for_path(model_path) == "torch":
+            import torch
+
+            torch.set_num_threads(threads)
+        return load_engine(model_path, threads)
+
+    registry = ModelRegistry(model_paths, loader=load, **registry_limits)
+    segment: Optional[shared_memory.SharedMemory] = None
+    # Segmentos substituídos (o processo da API os recria ao crescer) ainda não fechados
+    retired: List[shared_memory.SharedMemory] = []
+    conn.send(("ready", os.getpid()))
+
+    def state() -> dict:
+        return {
+            "resident": registry.resident(),
+            "memory_bytes": registry.memory_bytes(),
+        }
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        command = message[0]
+        if command == "stop":
+            break
+        try:
+            if command == "warm_up":
+                _, exam_type, image_size = message
+                engine = registry.get(exam_type)
+                dummy_image = np.zeros((image_size, image_size, 3), dtype=np.uint8)
+                engine.detect([dummy_image], image_size, 0.5)
+                conn.send(("ok", state()))
+                continue
+
+            (
+                _,
+                exam_type,
+                segment_name,
+                layout,
+                image_size,
+                conf,
+                augment,
+                with_names,
+            ) = message
+            if segment is None or segment.name != segment_name:
+                if segment is not None:
+                    retired.append(segment)
+                segment = shared_memory.SharedMemory(name=segment_name)
+            images = [
+                np.ndarray(shape, dtype=np.uint8, buffer=segment.buf, offset=offset)
+                for offset, shape in layout
+            ]
+            start = time.perf_counter()
+            engine = registry.get(exam_type)
+            predicts = []
+            for index in range(0, len(images), max_batch_size):
+                predicts.extend(
+                    engine.detect(
+                        images[index : index + max_batch_size],
+                        image_size,
+                        conf,
+                        augment=augment,
+                    )
+                )
+            detect_s = time.perf_counter() - start
+            del images
+            if retired:
+                # Depois de um lote do segmento novo, o predictor não referencia
+                # mais os antigos
+                retired = _close_segments(retired)
+
+            values = np.empty(
+                (sum(len(predict) for predict in predicts), 6), dtype=np.float32
+            )
+            row = 0
+            for predict in predicts:
+                values[row : row + len(predict), :4] = predict.boxes
+                values[row : row + len(predict), 4] = predict.confidence
+                values[row : row + len(predict), 5] = predict.class_id
+                row += len(predict)
+            names = None
+            if with_names:
+                names = {
+                    index: str(name) for index, name in enumerate(engine.names.tolist())
+                }
+            conn.send(
+                (
+                    "ok",
+                    {
+                        **state(),
+                        "counts": [len(predict) for predict in predicts],
+                        "values": values,
+                        "names": names,
+                        "detect_s": detect_s,
+                    },
+                )
+            )
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    if segment is not None:
+        retired.append(segment)
+    _close_segments(retired)
+
+
+class _Worker:
+    """Estado de um processo de inferência no processo da API."""
+
+    def __init__(self, index: int, cores: List[int]):
+        self.index = index
+        self.cores = cores
+        self.process = None
+        self.conn = None
+        self.pid = None
+        self.segment: Optional[shared_memory.SharedMemory] = None
+        self.busy = False
+        self.resident: List[str] = []
+        self.memory_bytes = 0
+        self.warm = set()
+        self.batches = 0
+        self.restarts = 0
+
+    def write_images(
+        self, images: List[np.ndarray], min_bytes: int
+    ) -> List[Tuple[int, tuple]]:
+        """Copia as imagens para a memória compartilhada, aumentando-a se necessário."""
+        layout, offset = [], 0
+        for image in images:
+            layout.append((offset, image.shape))
+            offset += -(-image.nbytes // _ALIGN) * _ALIGN
+        if self.segment is None or self.segment.size < offset:
+            self.close_segment()
+            size = max(min_bytes, 1 << max(offset - 1, 1).bit_length())
+            self.segment = shared_memory.SharedMemory(create=True, size=size)
+        for image, (start, shape) in zip(images, layout):
+            np.ndarray(shape, dtype=np.uint8, buffer=self.segment.buf, offset=start)[
+                ...
+            ] = image
+        return layout
+
+    def close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+
+    def call(self, message: tuple, timeout_s: float):
+        self.conn.send(message)
+        if not self.conn.poll(timeout_s):
+            raise TimeoutError(
+                f"Processo de inferência {self.index} sem resposta em {timeout_s:.0f} s"
+            )
+        status, payload = self.conn.recv()
+        if status == "error":
+            raise InferenceWorkerError(payload)
+        self.resident = payload.get("resident", self.resident)
+        self.memory_bytes = payload.get("memory_bytes", self.memory_bytes)
+        return payload
+
+
+class InferencePool:
+    """
+    Processos de inferência que carregam os modelos fora do processo da API.
+
+    Cada tipo de exame é atendido por `replicas` processos fixos, de forma que
+    um modelo só é carregado nesses processos e os demais tipos de exame
+    rodam em paralelo nos outros núcleos. As imagens decodificadas são
+    copiadas para a memória compartilhada do processo escolhido (sem pickle)
+    e a resposta traz apenas os arrays das detecções. Cada processo pode ser
+    fixado em um grupo exclusivo de núcleos, com as threads do torch (ou do
+    ONNX Runtime/OpenVINO) limitadas a esses núcleos.
+
+    Os métodos são bloqueantes e chamados das threads da etapa "inference".
+    Um processo que encerra ou passa do tempo limite é reiniciado; se isso
+    acontece durante um lote, o lote falha com InferenceWorkerError.
+
+    Args:
+        model_paths (dict): Tipo de exame -> arquivo do modelo.
+        workers (int): Número de processos (0 = desativado).
+        replicas (int): Processos que atendem cada tipo de exame.
+        pin_cores (bool): Fixa cada processo em um grupo de núcleos.
+        threads (int): Threads de inferência por processo (0 = núcleos do grupo).
+        shm_bytes (int): Tamanho inicial da memória compartilhada de cada processo.
+        timeout_s (float): Tempo máximo de um lote.
+        max_batch_size (int): Imagens por chamada ao modelo dentro do processo.
+        registry_limits (dict): Limites do ModelRegistry de cada processo.
+    """
+
+    def __init__(
+        self,
+        model_paths: Dict[str, str],
+        workers: int,
+        replicas: int = 1,
+        pin_cores: bool = True,
+        threads: int = 0,
+        shm_bytes: int = 32 * 2**20,
+        timeout_s: float = 120.0,
+        max_batch_size: int = 16,
+        registry_limits: dict = None,
+    ):
+        self._model_paths = dict(model_paths)
+        self._replicas = max(1, min(replicas, workers)) if workers else 0
+        self._pin_cores = pin_cores
+        self._threads = threads
+        self._shm_bytes = shm_bytes
+        self._timeout_s = timeout_s
+        self._max_batch_size = max(1, max_batch_size)
+        self._registry_limits = registry_limits or {}
+        self._workers: List[_Worker] = []
+        self._names: Dict[str, np.ndarray] = {}
+        self._condition = threading.Condition()
+        self._context = multiprocessing.get_context("spawn")
+        self._size = workers
+        self._started = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    @property
+    def replicas(self) -> int:
+        return self._replicas
+
+    def start(self):
+        """Inicia os processos e aguarda que todos estejam prontos."""
+        with self._condition:
+            if not self.enabled or self._started:
+                return
+            self._start()
+
+    def _start(self):
+        available = (
+            sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        )
+        groups = split_cores(available if self._pin_cores else [], self._size)
+        self._workers = [_Worker(index, cores) for index, cores in enumerate(groups)]
+        for worker in self._workers:
+            self._spawn(worker)
+        self._started = True
+        logger.info(
+            "Processos de inferência iniciados: {} (réplicas por modelo: {})",
+            self._size,
+            self._replicas,
+        )
+
+    def _spawn(self, worker: _Worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(
+                child_conn,
+                self._model_paths,
+                worker.cores,
+                self._threads,
+                self._max_batch_size,
+                self._registry_limits,
+            ),
+            name=f"inference-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.conn = parent_conn
+        if not parent_conn.poll(_START_TIMEOUT_S):
+            raise InferenceWorkerError(
+                f"Processo de inferência {worker.index} não iniciou"
+            )
+        _, worker.pid = parent_conn.recv()
+        worker.resident, worker.memory_bytes, worker.warm = [], 0, set()
+
+    def _restart(self, worker: _Worker):
+        worker.restarts += 1
+        logger.error(
+            "Reiniciando o processo de inferência {} (pid {})", worker.index, worker.pid
+        )
+        try:
+            worker.conn.close()
+        except OSError:
+            pass
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=10)
+        self._spawn(worker)
+
+    def workers_for(self, exam_type: str) -> List[_Worker]:
+        """Processos que atendem o tipo de exame."""
+        position = sorted(self._model_paths).index(exam_type)
+        return [
+            self._workers[(position * self._replicas + offset) % len(self._workers)]
+            for offset in range(self._replicas)
+        ]
+
+    def _acquire(self, candidates: List[_Worker]) -> _Worker:
+        with self._condition:
+            while True:
+                free = [worker for worker in candidates if not worker.busy]
+                if free:
+                    worker = free[0]
+                    worker.busy = True
+                    return worker
+                self._condition.wait()
+
+    def _release(self, worker: _Worker):
+        with self._condition:
+            worker.busy = False
+            self._condition.notify_all()
+
+    def _call(self, worker: _Worker, message: tuple) -> dict:
+        # Um processo que encerrou ocioso é reiniciado antes de receber o lote
+        if not worker.process.is_alive():
+            self._restart(worker)
+        try:
+            return worker.call(message, self._timeout_s)
+        except (EOFError, OSError, TimeoutError) as e:
+            self._restart(worker)
+            raise InferenceWorkerError(
+                str(e) or "Processo de inferência encerrado"
+            ) from e
+
+    def detect(
+        self,
+        exam_type: str,
+        images: List[np.ndarray],
+        image_size: int,
+        conf: float,
+        augment: bool,
+    ) -> List[Detections]:
+        """
+        Executa a detecção em um dos processos do tipo de exame.
+
+        Args:
+            exam_type (str): O tipo de exame (modelo).
+            images (List[np.ndarray]): As imagens (arrays BGR ou imagens PIL).
+            image_size (int): O tamanho da imagem que o modelo receberá.
+            conf (float): O limiar de confiança.
+            augment (bool): Aumento de dados na inferência.
+
+        Returns:
+            List[Detections]: As detecções de cada imagem, na ordem da entrada.
+        """
+        arrays = [
+            get_array_from_image(image) if isinstance(image, Image.Image) else image
+            for image in images
+        ]
+        arrays = [np.ascontiguousarray(image, dtype=np.uint8) for image in arrays]
+        self.start()
+        with stage_timer("pool_wait"):
+            worker = self._acquire(self.workers_for(exam_type))
+        try:
+            layout = worker.write_images(arrays, self._shm_bytes)
+            payload = self._call(
+                worker,
+                (
+                    "detect",
+                    exam_type,
+                    worker.segment.name,
+                    layout,
+                    image_size,
+                    conf,
+                    augment,
+                    exam_type not in self._names,
+                ),
+            )
+            worker.batches += 1
+            worker.warm.add(exam_type)
+        finally:
+            self._release(worker)
+
+        # A etapa "predict" roda no outro processo; o tempo vem na resposta
+        STAGE_DURATION.labels(stage="predict", **current_labels()).observe(
+            payload["detect_s"]
+        )
+        # No perfil da requisição, a etapa termina com a resposta do processo
+        finished = time.perf_counter()
+        record_span("predict", finished - payload["detect_s"], finished)
+        if payload["names"] is not None:
+            self._names[exam_type] = build_name_table(payload["names"])
+        names = self._names[exam_type]
+        predicts, row = [], 0
+        for count in payload["counts"]:
+            values = payload["values"][row : row + count]
+            predicts.append(
+                Detections(values[:, :4], values[:, 4], values[:, 5], names)
+            )
+            row += count
+        return predicts
+
+    def warm_up(self, exam_types: List[str], image_size: int):
+        """Carrega e aquece os modelos em todos os processos que os atendem."""
+        for exam_type in exam_types:
+            for candidate in self.workers_for(exam_type):
+                worker = self._acquire([candidate])
+                try:
+                    self._call(worker, ("warm_up", exam_type, image_size))
+                    worker.warm.add(exam_type)
+                    logger.info(
+                        "Modelo aquecido: {} (processo {})", exam_type, worker.index
+                    )
+                except Exception as e:
+                    logger.error("Falha ao aquecer o modelo {}: {}", exam_type, str(e))
+                finally:
+                    self._release(worker)
+
+    def is_warm(self, exam_type: str) -> bool:
+        """Indica se todos os processos do tipo de exame já o aqueceram."""
+        if not self._started:
+            return False
+        return all(
+            exam_type in worker.warm and exam_type in worker.resident
+            for worker in self.workers_for(exam_type)
+        )
+
+    def resident(self) -> List[str]:
+        """Tipos de exame com modelo residente em algum processo."""
+        return sorted(
+            {exam_type for worker in self._workers for exam_type in worker.resident}
+        )
+
+    def memory_bytes(self) -> int:
+        """Memória estimada dos modelos residentes em todos os processos."""
+        return sum(worker.memory_bytes for worker in self._workers)
+
+    def stats(self) -> dict:
+        """Retorna o estado de cada processo de inferência."""
+        return {
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.pid,
+                    "alive": worker.process is not None and worker.process.is_alive(),
+                    "cores": worker.cores,
+                    "busy": worker.busy,
+                    "exam_types": [
+                        exam_type
+                        for exam_type in sorted(self._model_paths)
+                        if worker in self.workers_for(exam_type)
+                    ],
+                    "resident": worker.resident,
+                    "memory_bytes": worker.memory_bytes,
+                    "shm_bytes": (
+                        worker.segment.size if worker.segment is not None else 0
+                    ),
+                    "batches": worker.batches,
+                    "restarts": worker.restarts,
+                }
+                for worker in self._workers
+            ],
+            "replicas": self._replicas,
+        }
+
+    def stop(self):
+        """Encerra os processos e libera a memória compartilhada."""
+        for worker in self._workers:
+            try:
+                worker.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.close_segment()
+        self._workers = []
+        self._started = False
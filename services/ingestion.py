@@ -0,0 +1,294 @@
+import os
+from typing import BinaryIO, List, Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, UnidentifiedImageError
+from starlette.responses import JSONResponse
+
+from config import (
+    CINE_MAX_FILE_MB,
+    UPLOAD_CHUNK_FILES,
+    UPLOAD_MAX_FILE_MB,
+    UPLOAD_MAX_FILE_MEGAPIXELS,
+    UPLOAD_MAX_REQUEST_MEGAPIXELS,
+)
+from services.ai_services import detect_binary_images
+from services.detections import Detections
+from services.executors import run_in_stage
+from utils.logger import get_logger
+from utils.metrics import UPLOADS_REJECTED
+from utils.uses_for_images import get_image_from_bytes
+
+logger = get_logger()
+
+
+class UploadRejected(Exception):
+    """
+    Arquivo ou requisição fora dos limites de ingestão.
+
+    Args:
+        status_code (int): O status HTTP da recusa (413 ou 415).
+        detail (str): O motivo da recusa.
+        reason (str): O limite ultrapassado, usado na métrica
+            app_uploads_rejected_total.
+    """
+
+    def __init__(self, status_code: int, detail: str, reason: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.reason = reason
+
+
+def _file_size(file: BinaryIO) -> int:
+    # O upload já está em um arquivo temporário; o tamanho vem do seek, sem leitura
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+class UploadLimits:
+    """
+    Limites de tamanho e de pixels dos arquivos enviados às rotas de análise.
+
+    Os limites são verificados antes da decodificação: o tamanho pelo
+    arquivo temporário do upload e os pixels pelo cabeçalho da imagem, de
+    forma que um arquivo grande demais é recusado sem ser lido.
+
+    Args:
+        max_file_bytes (int): Tamanho de cada arquivo (0 = sem limite).
+        max_file_pixels (int): Pixels de cada imagem (0 = sem limite).
+        max_request_pixels (int): Pixels de todas as imagens da requisição
+            (0 = sem limite).
+    """
+
+    def __init__(
+        self,
+        max_file_bytes: int,
+        max_file_pixels: int,
+        max_request_pixels: int,
+    ):
+        self.max_file_bytes = max_file_bytes
+        self.max_file_pixels = max_file_pixels
+        self.max_request_pixels = max_request_pixels
+
+    def check_size(self, filename: str, file: BinaryIO) -> int:
+        """
+        Verifica apenas o tamanho de um arquivo, sem lê-lo.
+
+        Returns:
+            int: O tamanho do arquivo em bytes.
+
+        Raises:
+            UploadRejected: Se o arquivo passar de `max_file_bytes` (413).
+        """
+        size = _file_size(file)
+        if self.max_file_bytes and size > self.max_file_bytes:
+            raise UploadRejected(
+                413,
+                f"{filename}: {size / 2**20:.1f} MB, acima do limite de "
+                f"{self.max_file_bytes / 2**20:.0f} MB por arquivo",
+                "file_bytes",
+            )
+        return size
+
+    def check(self, uploads: List[Tuple[str, BinaryIO]]) -> List[Tuple[int, int]]:
+        """
+        Verifica os arquivos de uma requisição.
+
+        Args:
+            uploads (List[Tuple[str, BinaryIO]]): O nome e o arquivo de cada upload.
+
+        Returns:
+            List[Tuple[int, int]]: A largura e a altura de cada imagem.
+
+        Raises:
+            UploadRejected: Se um arquivo não for uma imagem (415) ou passar de
+                um dos limites (413).
+        """
+        sizes, total_pixels = [], 0
+        for filename, file in uploads:
+            self.check_size(filename, file)
+            try:
+                # Image.open lê apenas o cabeçalho
+                with Image.open(file) as image:
+                    width, height = image.size
+            except Image.DecompressionBombError:
+                raise UploadRejected(
+                    413, f"{filename}: imagem grande demais", "file_pixels"
+                )
+            except (UnidentifiedImageError, OSError):
+                raise UploadRejected(
+                    415, f"{filename}: formato de imagem não suportado", "format"
+                )
+            finally:
+                file.seek(0)
+
+            pixels = width * height
+            if self.max_file_pixels and pixels > self.max_file_pixels:
+                raise UploadRejected(
+                    413,
+                    f"{filename}: {pixels / 1e6:.1f} megapixels, acima do limite de "
+                    f"{self.max_file_pixels / 1e6:.0f} por arquivo",
+                    "file_pixels",
+                )
+            total_pixels += pixels
+            if self.max_request_pixels and total_pixels > self.max_request_pixels:
+                raise UploadRejected(
+                    413,
+                    f"Imagens com mais de {self.max_request_pixels / 1e6:.0f} "
+                    "megapixels na requisição",
+                    "request_pixels",
+                )
+            sizes.append((width, height))
+        return sizes
+
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI que recusa com 413 os corpos maiores que `max_bytes`.
+
+    O Content-Length é verificado antes de o corpo ser lido. Corpos sem
+    Content-Length (chunked) são contados à medida que chegam, e a leitura
+    é interrompida ao passar do limite, sem terminar de receber o upload.
+
+    Args:
+        app: A aplicação ASGI.
+        max_bytes (int): Tamanho máximo do corpo (0 = sem limite).
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _detail(self) -> str:
+        return f"Requisição acima do limite de {self.max_bytes / 2**20:.0f} MB"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            UPLOADS_REJECTED.labels(reason="request_bytes").inc()
+            logger.warning(
+                "Requisição recusada: Content-Length {}", int(content_length)
+            )
+            response = JSONResponse({"detail": self._detail()}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    UPLOADS_REJECTED.labels(reason="request_bytes").inc()
+                    # Propagada pelo FastAPI até o tratamento de HTTPException
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def check_uploads(files: List[UploadFile]) -> List[Tuple[int, int]]:
+    """
+    Verifica os limites de `upload_limits` nos arquivos enviados, fora do event loop.
+
+    Returns:
+        List[Tuple[int, int]]: A largura e a altura de cada imagem.
+
+    Raises:
+        UploadRejected: Ver `UploadLimits.check`.
+    """
+    try:
+        return await run_in_stage(
+            "ingest",
+            upload_limits.check,
+            [(file.filename, file.file) for file in files],
+        )
+    except UploadRejected as e:
+        UPLOADS_REJECTED.labels(reason=e.reason).inc()
+        logger.warning("Upload recusado ({} arquivos): {}", len(files), e.detail)
+        raise
+
+
+async def check_cine_upload(file: UploadFile) -> int:
+    """
+    Verifica o tamanho do arquivo enviado a /result_cine com `cine_limits`.
+
+    Vídeos e zips de quadros não têm um cabeçalho de imagem a verificar; os
+    quadros são limitados na decodificação (ver `services.cine`).
+
+    Returns:
+        int: O tamanho do arquivo em bytes.
+
+    Raises:
+        UploadRejected: Ver `UploadLimits.check_size`.
+    """
+    try:
+        return await run_in_stage(
+            "ingest", cine_limits.check_size, file.filename, file.file
+        )
+    except UploadRejected as e:
+        UPLOADS_REJECTED.labels(reason=e.reason).inc()
+        logger.warning("Cine recusado: {}", e.detail)
+        raise
+
+
+async def detect_uploads(
+    files: List[UploadFile], exam_type: str, chunk_size: int = UPLOAD_CHUNK_FILES
+) -> List[Detections]:
+    """
+    Lê e detecta os arquivos enviados em grupos de `chunk_size` arquivos.
+
+    Os bytes e as imagens decodificadas (em escala reduzida, ver
+    `detect_binary_images`) de um grupo são liberados antes da leitura do
+    próximo; apenas as detecções ficam em memória.
+
+    Args:
+        files (List[UploadFile]): Os arquivos enviados.
+        exam_type (str): O tipo de exame (modelo) a ser usado.
+        chunk_size (int, opcional): Arquivos lidos e detectados juntos (0 = todos).
+
+    Returns:
+        List[Detections]: As previsões de cada arquivo, na ordem recebida.
+    """
+    chunk_size = chunk_size or len(files)
+    predicts = []
+    for start in range(0, len(files), chunk_size):
+        binary_images = [
+            await file.read() for file in files[start : start + chunk_size]
+        ]
+        predicts.extend(await detect_binary_images(binary_images, exam_type))
+    return predicts
+
+
+async def load_upload_image(file: UploadFile) -> Image.Image:
+    """
+    Lê o arquivo enviado de novo e o decodifica em resolução original, para anotação.
+
+    Os bytes só existem durante a decodificação.
+    """
+    await file.seek(0)
+    return await run_in_stage("decode", get_image_from_bytes, await file.read())
+
+
+# Limites das rotas de análise
+upload_limits = UploadLimits(
+    max_file_bytes=int(UPLOAD_MAX_FILE_MB * 2**20),
+    max_file_pixels=int(UPLOAD_MAX_FILE_MEGAPIXELS * 1e6),
+    max_request_pixels=int(UPLOAD_MAX_REQUEST_MEGAPIXELS * 1e6),
+)
+
+# Limite da rota de exames com vários quadros: só o tamanho do arquivo
+cine_limits = UploadLimits(
+    max_file_bytes=int(CINE_MAX_FILE_MB * 2**20),
+    max_file_pixels=0,
+    max_request_pixels=0,
+)
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from services.executors import run_in_stage
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+def _bucket(confidence: float, precision: float) -> float:
+    if not precision:
+        return float(confidence)
+    return round(round(float(confidence) / precision) * precision, 6)
+
+
+def _is_detection_list(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and bool(value)
+        and all(isinstance(item, dict) and "name" in item for item in value)
+    )
+
+
+def normalize_detections(value: Any, precision: float) -> Any:
+    """
+    Normaliza dados de detecção para compor a chave do cache.
+
+    As confianças são arredondadas para múltiplos de `precision` e as listas
+    de detecções são ordenadas, de forma que achados equivalentes geram a
+    mesma chave independentemente da ordem ou de pequenas variações.
+
+    Args:
+        value: Lista de detecções ({"name", "confidence"}) ou qualquer
+            estrutura JSON que as contenha.
+        precision (float): Precisão do arredondamento da confiança.
+
+    Returns:
+        A estrutura normalizada.
+    """
+    if isinstance(value, dict):
+        return {
+            key: (
+                _bucket(item, precision)
+                if key == "confidence" and isinstance(item, (int, float))
+                else normalize_detections(item, precision)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        items = [normalize_detections(item, precision) for item in value]
+        if _is_detection_list(value):
+            items.sort(key=lambda item: json.dumps(item, sort_keys=True, default=str))
+        return items
+    return value
+
+
+def interpretation_key(
+    kind: str,
+    detections: Any,
+    exam_type: str,
+    model: str,
+    temperature: float,
+    precision: float,
+) -> str:
+    """
+    Gera a chave de cache de uma interpretação clínica.
+
+    Args:
+        kind (str): O tipo de prompt (ex: "interpretation", "chat").
+        detections: Os dados de detecção enviados ao modelo.
+        exam_type (str): O tipo de exame.
+        model (str): O modelo GPT usado.
+        temperature (float): A temperatura da chamada.
+        precision (float): Precisão do arredondamento da confiança.
+
+    Returns:
+        str: Hash SHA-256 da forma normalizada.
+    """
+    payload = json.dumps(
+        {
+            "kind": kind,
+            "exam_type": exam_type,
+            "model": model,
+            "temperature": temperature,
+            "detections": normalize_detections(detections, precision),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InterpretationCache:
+    """
+    Cache das interpretações clínicas em dois níveis.
+
+    O primeiro nível é um LRU em memória com TTL, por worker. O segundo nível,
+    opcional, é um banco sqlite em disco compartilhado entre os workers do
+    gunicorn no mesmo host.
+
+    Args:
+        max_entries (int): Número máximo de entradas em memória.
+        ttl_s (float): Tempo de vida das entradas em segundos.
+        db_path (str, opcional): Caminho do banco sqlite. Sem ele, apenas a
+            memória é usada.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, db_path: Optional[str] = None):
+        self._max_entries = max(1, max_entries)
+        self._ttl_s = ttl_s
+        self._db_path = db_path or None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sets = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Uma conexão por thread do pool de execução
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS interpretations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT value, expires_at FROM interpretations "
+                "WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return (row[1], row[0]) if row else None
+
+    def _disk_set(self, key: str, value: str, expires_at: float, purge: bool):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO interpretations (key, value, expires_at) "
+            "VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+        if purge:
+            conn.execute(
+                "DELETE FROM interpretations WHERE expires_at < ?", (time.time(),)
+            )
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Busca uma interpretação na memória e, em seguida, no disco.
+
+        Args:
+            key (str): A chave gerada por `interpretation_key`.
+
+        Returns:
+            str: A interpretação em cache ou None.
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self.hits_memory += 1
+            return value
+
+        if self._db_path:
+            try:
+                entry = await run_in_stage("cache", self._disk_get, key)
+            except sqlite3.Error as e:
+                logger.error("Falha ao ler o cache de interpretações: {}", str(e))
+                entry = None
+            if entry is not None:
+                expires_at, value = entry
+                self._memory_set(key, value, expires_at)
+                self.hits_disk += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """
+        Armazena uma interpretação na memória e no disco.
+
+        Args:
+            key (str): A chave gerada por `interpretation_key`.
+            value (str): A interpretação clínica.
+        """
+        expires_at = time.time() + self._ttl_s
+        self._memory_set(key, value, expires_at)
+        if self._db_path:
+            self._sets += 1
+            try:
+                await run_in_stage(
+                    "cache",
+                    self._disk_set,
+                    key,
+                    value,
+                    expires_at,
+                    self._sets % 1000 == 0,
+                )
+            except sqlite3.Error as e:
+                logger.error("Falha ao gravar o cache de interpretações: {}", str(e))
+
+    def stats(self) -> dict:
+        """Retorna os contadores de acerto e falha do cache."""
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "ttl_s": self._ttl_s,
+            "disk": bool(self._db_path),
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_ratio": (
+                (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0
+            ),
+        }
@@ -0,0 +1,398 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+# Estados de um job; "uploading" só existe enquanto os arquivos são gravados
+UPLOADING = "uploading"
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, exam_type TEXT NOT NULL, analysis TEXT NOT NULL, "
+    "options TEXT NOT NULL, status TEXT NOT NULL, total INTEGER NOT NULL, "
+    "error TEXT, worker TEXT, created_at REAL NOT NULL, started_at REAL, "
+    "finished_at REAL, heartbeat_at REAL)",
+    "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)",
+    "CREATE TABLE IF NOT EXISTS job_files ("
+    "job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT, data BLOB, "
+    "result TEXT, error TEXT, finished_at REAL, PRIMARY KEY (job_id, idx))",
+)
+
+# Bytes de um arquivo enviado copiados para o banco por vez
+_COPY_CHUNK_BYTES = 1 << 20
+
+_JOB_COLUMNS = (
+    "id, exam_type, analysis, options, status, total, error, "
+    "created_at, started_at, finished_at"
+)
+
+
+class JobStore:
+    """
+    Armazenamento durável dos jobs de análise em um banco sqlite local.
+
+    Guarda os arquivos enviados, o estado de cada job e o resultado de cada
+    arquivo assim que ele termina, o que permite consultar resultados
+    parciais e retomar jobs interrompidos. O banco pode ser compartilhado
+    pelos workers do gunicorn no mesmo host.
+
+    Todos os métodos são bloqueantes; no event loop devem ser chamados via
+    `run_in_stage("jobs", ...)`.
+
+    Args:
+        db_path (str): Caminho do banco sqlite.
+    """
+
+    def __init__(self, db_path: str):
+        self._db_path = db_path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Uma conexão por thread do pool de execução
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _job_from_row(row) -> dict:
+        job = dict(zip(_JOB_COLUMNS.split(", "), row))
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def create(
+        self,
+        exam_type: str,
+        analysis: str,
+        options: dict,
+        files: List[Tuple[str, BinaryIO]],
+    ) -> str:
+        """
+        Registra um novo job na fila.
+
+        Os arquivos são copiados para o banco um de cada vez, em blocos de
+        `_COPY_CHUNK_BYTES`, cada um em uma transação curta: o conteúdo de um
+        job grande nunca fica todo em memória nem trava o banco por toda a
+        cópia. O job fica "uploading" durante a cópia e só entra na fila
+        depois do último arquivo; se a cópia falhar, o job é removido.
+
+        Args:
+            exam_type (str): O tipo de exame (modelo).
+            analysis (str): O tipo de análise (ver `services.jobs.ANALYSES`).
+            options (dict): As opções da análise (formato da imagem etc.).
+            files (List[Tuple[str, BinaryIO]]): Nome e arquivo de cada upload.
+
+        Returns:
+            str: O identificador do job.
+        """
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (id, exam_type, analysis, options, status, total, "
+            "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                exam_type,
+                analysis,
+                json.dumps(options),
+                UPLOADING,
+                len(files),
+                time.time(),
+            ),
+        )
+        try:
+            for index, (name, file) in enumerate(files):
+                self._copy_file(conn, job_id, index, name, file)
+            conn.execute(
+                "UPDATE jobs SET status = ?, created_at = ? WHERE id = ?",
+                (QUEUED, time.time(), job_id),
+            )
+        except BaseException:
+            self._delete(conn, job_id)
+            raise
+        return job_id
+
+    @staticmethod
+    def _copy_file(
+        conn: sqlite3.Connection, job_id: str, index: int, name: str, file: BinaryIO
+    ):
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(0)
+        with conn:
+            conn.execute("BEGIN")
+            if not hasattr(conn, "blobopen"):
+                # Python < 3.11: sem escrita incremental, o arquivo é lido inteiro
+                conn.execute(
+                    "INSERT INTO job_files (job_id, idx, filename, data) "
+                    "VALUES (?, ?, ?, ?)",
+                    (job_id, index, name, file.read()),
+                )
+                return
+            # O blob é reservado com o tamanho do arquivo e preenchido em blocos
+            rowid = conn.execute(
+                "INSERT INTO job_files (job_id, idx, filename, data) "
+                "VALUES (?, ?, ?, zeroblob(?))",
+                (job_id, index, name, size),
+            ).lastrowid
+            with conn.blobopen("job_files", "data", rowid) as blob:
+                while True:
+                    chunk = file.read(_COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    blob.write(chunk)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, job_id: str):
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Retorna o estado e o progresso de um job.
+
+        Returns:
+            dict: Os campos do job com "completed" e "failed", ou None se o
+                job não existir.
+        """
+        conn = self._connect()
+        row = conn.execute(
+            f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = self._job_from_row(row)
+        completed, failed = conn.execute(
+            "SELECT COUNT(finished_at), COUNT(error) FROM job_files WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        job["completed"] = completed
+        job["failed"] = failed
+        return job
+
+    def status(self, job_id: str) -> Optional[str]:
+        row = (
+            self._connect()
+            .execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def results(self, job_id: str) -> List[dict]:
+        """
+        Retorna os resultados dos arquivos já processados, em ordem.
+
+        Returns:
+            List[dict]: {"index", "filename"} com o resultado do arquivo ou
+                "error" quando o arquivo falhou.
+        """
+        rows = self._connect().execute(
+            "SELECT idx, filename, result, error FROM job_files "
+            "WHERE job_id = ? AND finished_at IS NOT NULL ORDER BY idx",
+            (job_id,),
+        )
+        results = []
+        for index, filename, result, error in rows:
+            item = {"index": index, "filename": filename}
+            if error is not None:
+                item["error"] = error
+            else:
+                item.update(json.loads(result))
+            results.append(item)
+        return results
+
+    def claim(
+        self,
+        worker: str,
+        limits: Dict[str, int],
+        default_limit: int,
+        stale_s: float,
+    ) -> Optional[dict]:
+        """
+        Reserva o próximo job da fila respeitando o limite por tipo de exame.
+
+        Jobs em execução sem heartbeat há mais de `stale_s` segundos (worker
+        encerrado no meio do job) voltam a ser elegíveis e são retomados a
+        partir dos arquivos que ainda não têm resultado.
+
+        Args:
+            worker (str): Identificador do worker que reserva o job.
+            limits (dict): Jobs simultâneos permitidos por tipo de exame.
+            default_limit (int): Limite dos tipos de exame sem valor em `limits`.
+            stale_s (float): Tempo sem heartbeat para considerar o job abandonado.
+
+        Returns:
+            dict: O job reservado ou None se não houver job elegível.
+        """
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            # Trava de escrita: a reserva é atômica entre os processos
+            conn.execute("BEGIN IMMEDIATE")
+            running = dict(
+                conn.execute(
+                    "SELECT exam_type, COUNT(*) FROM jobs WHERE status = ? "
+                    "AND heartbeat_at >= ? GROUP BY exam_type",
+                    (RUNNING, now - stale_s),
+                ).fetchall()
+            )
+            candidates = conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = ? "
+                "OR (status = ? AND heartbeat_at < ?) ORDER BY created_at LIMIT 100",
+                (QUEUED, RUNNING, now - stale_s),
+            ).fetchall()
+            for row in candidates:
+                job = self._job_from_row(row)
+                limit = limits.get(job["exam_type"], default_limit)
+                if running.get(job["exam_type"], 0) >= limit:
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, heartbeat_at = ?, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (RUNNING, worker, now, now, job["id"]),
+                )
+                job["status"] = RUNNING
+                return job
+        return None
+
+    def heartbeat(self, job_id: str) -> Optional[str]:
+        """Renova o heartbeat de um job em execução e retorna o estado atual."""
+        conn = self._connect()
+        conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+            (time.time(), job_id, RUNNING),
+        )
+        return self.status(job_id)
+
+    def pending_files(self, job_id: str) -> List[Tuple[int, str]]:
+        """Retorna (índice, nome) dos arquivos ainda sem resultado."""
+        return (
+            self._connect()
+            .execute(
+                "SELECT idx, filename FROM job_files "
+                "WHERE job_id = ? AND finished_at IS NULL ORDER BY idx",
+                (job_id,),
+            )
+            .fetchall()
+        )
+
+    def load_files(self, job_id: str, indexes: List[int]) -> List[bytes]:
+        """Lê o conteúdo dos arquivos pedidos, na ordem de `indexes`."""
+        placeholders = ", ".join("?" * len(indexes))
+        rows = dict(
+            self._connect().execute(
+                "SELECT idx, data FROM job_files "
+                f"WHERE job_id = ? AND idx IN ({placeholders})",
+                (job_id, *indexes),
+            )
+        )
+        return [rows[index] for index in indexes]
+
+    def save_result(
+        self, job_id: str, index: int, result: dict = None, error: str = None
+    ):
+        """Grava o resultado (ou o erro) de um arquivo de um job em execução."""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            running = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?",
+                (now, job_id, RUNNING),
+            ).rowcount
+            # Resultados que chegam depois do cancelamento são descartados
+            if running:
+                conn.execute(
+                    "UPDATE job_files SET result = ?, error = ?, finished_at = ?, "
+                    "data = NULL WHERE job_id = ? AND idx = ?",
+                    (
+                        None if result is None else json.dumps(result),
+                        error,
+                        now,
+                        job_id,
+                        index,
+                    ),
+                )
+
+    def finish(self, job_id: str, status: str, error: str = None) -> bool:
+        """
+        Encerra um job em execução.
+
+        Returns:
+            bool: False se o job não estava mais em execução (ex: cancelado).
+        """
+        return self._close(job_id, status, error, (RUNNING,))
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancela um job na fila ou em execução.
+
+        Returns:
+            bool: False se o job já tinha terminado ou não existe.
+        """
+        return self._close(job_id, CANCELLED, None, (QUEUED, RUNNING))
+
+    def _close(
+        self, job_id: str, status: str, error: Optional[str], from_statuses: tuple
+    ) -> bool:
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            placeholders = ", ".join("?" * len(from_statuses))
+            updated = conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                f"WHERE id = ? AND status IN ({placeholders})",
+                (status, error, time.time(), job_id, *from_statuses),
+            ).rowcount
+            if updated:
+                # Os arquivos enviados não são mais necessários
+                conn.execute(
+                    "UPDATE job_files SET data = NULL WHERE job_id = ?", (job_id,)
+                )
+        return bool(updated)
+
+    def purge(self, ttl_s: float) -> int:
+        """
+        Remove os jobs encerrados há mais de `ttl_s` segundos e os jobs cuja
+        cópia dos arquivos foi interrompida (worker encerrado durante o envio).
+        """
+        cutoff = time.time() - ttl_s
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            placeholders = ", ".join("?" * len(FINISHED_STATUSES))
+            expired = [
+                row[0]
+                for row in conn.execute(
+                    f"SELECT id FROM jobs WHERE (status IN ({placeholders}) "
+                    "AND finished_at < ?) OR (status = ? AND created_at < ?)",
+                    (*FINISHED_STATUSES, cutoff, UPLOADING, cutoff),
+                )
+            ]
+            for job_id in expired:
+                conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(expired)
+
+    def counts(self) -> Dict[str, int]:
+        """Número de jobs por estado."""
+        return dict(
+            self._connect()
+            .execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            .fetchall()
+        )
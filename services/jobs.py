@@ -0,0 +1,333 @@
+import asyncio
+import base64
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Dict, List, Optional
+
+from config import (
+    JOB_CHUNK_SIZE,
+    JOB_DEFAULT_EXAM_TYPE_CONCURRENCY,
+    JOB_EXAM_TYPE_CONCURRENCY,
+    JOB_HEARTBEAT_S,
+    JOB_STALE_S,
+    JOB_TTL_S,
+    JOB_WORKERS,
+    JOBS_DB,
+    UPLOAD_MAX_DECODED_IMAGES,
+)
+from services.ai_services import detect_binary_images
+from services.executors import run_in_stage
+from services.gpt_services import SharedInterpretations
+from services.image_processing import render_annotated_image
+from services.job_store import CANCELLED, DONE, FAILED, JobStore
+from services.response_modes import ImageOptions, iter_completed
+from utils.logger import get_logger
+from utils.metrics import set_labels, stage_timer
+from utils.uses_for_images import get_image_from_bytes
+
+logger = get_logger()
+
+# Análises disponíveis, equivalentes às rotas síncronas /analise/{exam_type}/result_*
+ANALYSES = ("full", "object", "img", "interpretation")
+ANALYSIS_PATTERN = "^(" + "|".join(ANALYSES) + ")$"
+
+# Intervalo das buscas na fila quando nenhum job novo é sinalizado
+POLL_INTERVAL_S = 1.0
+PURGE_INTERVAL_S = 600.0
+
+
+@asynccontextmanager
+async def analyze_chunk(
+    job: dict, binary_images: List[bytes]
+) -> AsyncIterator[List[Awaitable[dict]]]:
+    """
+    Faz a detecção de um lote de arquivos do job e prepara o resultado de cada um.
+
+    A interpretação compartilhada pelos arquivos do lote é encerrada ao
+    sair do bloco, inclusive quando os arquivos falham ou o job é cancelado.
+
+    Args:
+        job (dict): O job (ver `JobStore.claim`).
+        binary_images (List[bytes]): O conteúdo dos arquivos do lote.
+
+    Yields:
+        List[Awaitable[dict]]: Uma corrotina por arquivo que retorna o mesmo
+            resultado da rota síncrona correspondente.
+    """
+    exam_type, analysis = job["exam_type"], job["analysis"]
+    options = ImageOptions(**job["options"])
+    predicts = await detect_binary_images(binary_images, exam_type)
+
+    interpretations = None
+    if analysis in ("full", "interpretation"):
+        # Uma chamada ao GPT para os arquivos do lote (ver INTERPRETATION_BATCH_ENABLED)
+        interpretations = SharedInterpretations(
+            [predict.to_records() for predict in predicts], exam_type
+        )
+
+    # Como nas rotas síncronas: a inferência usa a decodificação reduzida, e a
+    # resolução original é decodificada só para a anotação, poucas por vez
+    decoded_images = asyncio.Semaphore(UPLOAD_MAX_DECODED_IMAGES or len(binary_images))
+
+    async def annotated_image(index: int) -> str:
+        async with decoded_images:
+            input_image = await run_in_stage(
+                "decode", get_image_from_bytes, binary_images[index]
+            )
+            image_bytes = await render_annotated_image(
+                input_image, predicts[index], options
+            )
+        with stage_timer("base64"):
+            return base64.b64encode(image_bytes).decode("utf-8")
+
+    async def file_result(index: int) -> dict:
+        predict = predicts[index]
+        if analysis == "object":
+            return {
+                "detect_objects_names": ", ".join(predict.labels),
+                "detect_objects": predict.to_records(),
+            }
+        if analysis == "img":
+            return {"annotated_image": await annotated_image(index)}
+
+        records = predict.to_records()
+        if analysis == "interpretation":
+            return {
+                "exam_type": exam_type,
+                "clinical_interpretation": await interpretations.get(index),
+            }
+        interpretation, image = await asyncio.gather(
+            interpretations.get(index), annotated_image(index)
+        )
+        return {
+            "data": {"exam_type": exam_type, "analysis_results": records},
+            "clinical_interpretation": interpretation,
+            "annotated_image": image,
+        }
+
+    try:
+        yield [file_result(index) for index in range(len(binary_images))]
+    finally:
+        if interpretations is not None:
+            interpretations.close()
+
+
+class JobRunner:
+    """
+    Pool de workers assíncronos que drena a fila de jobs do JobStore.
+
+    Cada worker reserva um job por vez, respeitando o limite de jobs
+    simultâneos por tipo de exame, e processa os arquivos em lotes de
+    `chunk_size`. O resultado de cada arquivo é gravado assim que termina.
+    Um heartbeat periódico mantém o job reservado e detecta cancelamentos
+    feitos por outros processos.
+
+    Args:
+        store (JobStore): O armazenamento dos jobs.
+        workers (int): Número de jobs processados simultaneamente.
+        exam_type_limits (dict): Jobs simultâneos por tipo de exame.
+        default_limit (int): Limite dos tipos de exame sem valor próprio.
+        chunk_size (int): Arquivos por lote de inferência.
+        heartbeat_s (float): Intervalo do heartbeat.
+        stale_s (float): Tempo sem heartbeat para retomar um job abandonado.
+        ttl_s (float): Tempo de retenção dos jobs encerrados.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int,
+        exam_type_limits: Dict[str, int],
+        default_limit: int,
+        chunk_size: int,
+        heartbeat_s: float,
+        stale_s: float,
+        ttl_s: float,
+    ):
+        self._store = store
+        self._workers = workers
+        self._limits = exam_type_limits
+        self._default_limit = max(1, default_limit)
+        self._chunk_size = max(1, chunk_size)
+        self._heartbeat_s = heartbeat_s
+        self._stale_s = stale_s
+        self._ttl_s = ttl_s
+        self._worker_id = f"{os.uname().nodename}:{os.getpid()}"
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._last_purge = 0.0
+
+    def start(self):
+        """Inicia os workers no event loop atual."""
+        if self._tasks or self._workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{n}")
+            for n in range(self._workers)
+        ]
+        logger.info("Workers de jobs iniciados: {}", self._workers)
+
+    async def stop(self):
+        """
+        Para os workers. Os jobs interrompidos continuam reservados até o
+        heartbeat expirar e então são retomados por outro worker.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Avisa os workers locais de que há um job novo na fila."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, job_id: str):
+        """Interrompe o job se ele estiver em execução neste processo."""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    def running(self) -> List[str]:
+        return list(self._running)
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error("Falha ao buscar jobs na fila: {}", str(e))
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run(job))
+            self._running[job["id"]] = task
+            try:
+                # wait() não propaga o cancelamento do job para o worker
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                self._running.pop(job["id"], None)
+            if task.cancelled():
+                logger.info("Job {} cancelado", job["id"])
+
+    async def _claim(self) -> Optional[dict]:
+        now = time.monotonic()
+        if now - self._last_purge > PURGE_INTERVAL_S:
+            self._last_purge = now
+            purged = await run_in_stage("jobs", self._store.purge, self._ttl_s)
+            if purged:
+                logger.info("Jobs expirados removidos: {}", purged)
+        return await run_in_stage(
+            "jobs",
+            self._store.claim,
+            self._worker_id,
+            self._limits,
+            self._default_limit,
+            self._stale_s,
+        )
+
+    async def _heartbeat(self, job_id: str, task: asyncio.Task):
+        last_beat = time.monotonic()
+        while True:
+            await asyncio.sleep(self._heartbeat_s)
+            try:
+                status = await run_in_stage("jobs", self._store.heartbeat, job_id)
+            except Exception as e:
+                # Ex: "database is locked"; tenta de novo no próximo intervalo
+                logger.warning("Falha no heartbeat do job {}: {}", job_id, str(e))
+                if time.monotonic() - last_beat + self._heartbeat_s >= self._stale_s:
+                    # Antes que outro worker retome o job, para não processá-lo em dobro
+                    logger.error("Job {} interrompido: heartbeat sem sucesso", job_id)
+                    task.cancel()
+                    return
+                continue
+            last_beat = time.monotonic()
+            if status == CANCELLED:
+                # Cancelado por outro processo
+                task.cancel()
+                return
+
+    async def _run(self, job: dict):
+        job_id = job["id"]
+        set_labels(endpoint="job", exam_type=job["exam_type"])
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, asyncio.current_task()))
+        try:
+            pending = await run_in_stage("jobs", self._store.pending_files, job_id)
+            logger.info(
+                "Job {} ({}, {}): {} de {} arquivos pendentes",
+                job_id,
+                job["exam_type"],
+                job["analysis"],
+                len(pending),
+                job["total"],
+            )
+            for start in range(0, len(pending), self._chunk_size):
+                await self._run_chunk(job, pending[start : start + self._chunk_size])
+            await run_in_stage("jobs", self._store.finish, job_id, DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Falha no job {}: {}", job_id, str(e))
+            await run_in_stage("jobs", self._store.finish, job_id, FAILED, str(e))
+        finally:
+            heartbeat.cancel()
+
+    async def _run_chunk(self, job: dict, files: list):
+        job_id = job["id"]
+        indexes = [index for index, _ in files]
+        binary_images = await run_in_stage(
+            "jobs", self._store.load_files, job_id, indexes
+        )
+        async with AsyncExitStack() as stack:
+            try:
+                file_results = await stack.enter_async_context(
+                    analyze_chunk(job, binary_images)
+                )
+            except Exception as e:
+                # A detecção do lote falhou: todos os arquivos do lote ficam com erro
+                logger.error("Falha na detecção do job {}: {}", job_id, str(e))
+                for index in indexes:
+                    await run_in_stage(
+                        "jobs", self._store.save_result, job_id, index, error=str(e)
+                    )
+                return
+
+            async for position, task in iter_completed(file_results):
+                index, filename = files[position]
+                try:
+                    result, error = task.result(), None
+                except Exception as e:
+                    logger.error(
+                        "Falha no arquivo {} do job {}: {}", filename, job_id, str(e)
+                    )
+                    result, error = None, str(e)
+                await run_in_stage(
+                    "jobs", self._store.save_result, job_id, index, result, error
+                )
+
+
+job_store = JobStore(JOBS_DB)
+
+job_runner = JobRunner(
+    job_store,
+    workers=JOB_WORKERS,
+    exam_type_limits=JOB_EXAM_TYPE_CONCURRENCY,
+    default_limit=JOB_DEFAULT_EXAM_TYPE_CONCURRENCY,
+    chunk_size=JOB_CHUNK_SIZE,
+    heartbeat_s=JOB_HEARTBEAT_S,
+    stale_s=JOB_STALE_S,
+    ttl_s=JOB_TTL_S,
+)
@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+def estimate_model_bytes(model, model_path: str) -> int:
+    """
+    Estima a memória ocupada por um modelo carregado.
+
+    Usa o tamanho informado pelo próprio modelo (`size_bytes`), o tamanho dos
+    parâmetros do modelo torch quando disponível e, caso contrário, o tamanho
+    do arquivo de pesos em disco.
+
+    Args:
+        model: O modelo carregado.
+        model_path (str): O caminho do arquivo de pesos.
+
+    Returns:
+        int: Tamanho estimado em bytes.
+    """
+    size_bytes = getattr(model, "size_bytes", None)
+    if size_bytes is not None:
+        return int(size_bytes)
+    try:
+        return int(sum(p.numel() * p.element_size() for p in model.model.parameters()))
+    except Exception:
+        try:
+            return os.path.getsize(model_path)
+        except OSError:
+            return 0
+
+
+class _Entry:
+    __slots__ = ("model", "size_bytes")
+
+    def __init__(self, model, size_bytes: int):
+        self.model = model
+        self.size_bytes = size_bytes
+
+
+class ModelRegistry:
+    """
+    Mantém os modelos residentes em memória por tipo de exame.
+
+    Os modelos são carregados sob demanda, reaproveitados entre as requisições
+    e descartados na ordem LRU quando o número de modelos ou o orçamento de
+    memória é excedido. O carregamento é protegido por um lock por tipo de
+    exame, de forma que requisições concorrentes nunca carregam o mesmo modelo
+    duas vezes.
+
+    Args:
+        paths (dict): Mapeamento tipo de exame -> caminho do arquivo de pesos.
+        loader (Callable): Função que recebe o caminho e retorna o modelo.
+        max_models (int, opcional): Número máximo de modelos residentes.
+        max_memory_bytes (int, opcional): Orçamento de memória em bytes.
+    """
+
+    def __init__(
+        self,
+        paths: Dict[str, str],
+        loader: Callable[[str], object],
+        max_models: Optional[int] = None,
+        max_memory_bytes: Optional[int] = None,
+    ):
+        self._paths = paths
+        self._loader = loader
+        self._max_models = max_models or None
+        self._max_memory_bytes = max_memory_bytes or None
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._inference_locks: Dict[str, threading.Lock] = {}
+        self._warm = set()
+
+    def get(self, exam_type: str):
+        """
+        Retorna o modelo do tipo de exame, carregando-o se necessário.
+
+        Args:
+            exam_type (str): O tipo de exame (chave de `paths`).
+
+        Returns:
+            O modelo carregado.
+
+        Raises:
+            ValueError: Se o tipo de exame não for suportado.
+        """
+        if exam_type not in self._paths:
+            logger.error("Tipo de exame/modelo não suportado: {}", exam_type)
+            raise ValueError("Modelo não suportado")
+
+        with self._lock:
+            entry = self._entries.get(exam_type)
+            if entry is not None:
+                self._entries.move_to_end(exam_type)
+                return entry.model
+            load_lock = self._load_locks.setdefault(exam_type, threading.Lock())
+
+        with load_lock:
+            # Outra thread pode ter carregado o modelo enquanto aguardávamos
+            with self._lock:
+                entry = self._entries.get(exam_type)
+                if entry is not None:
+                    self._entries.move_to_end(exam_type)
+                    return entry.model
+
+            model_path = self._paths[exam_type]
+            model = self._loader(model_path)
+            size_bytes = estimate_model_bytes(model, model_path)
+            logger.info(
+                "Modelo carregado: {} ({:.1f} MB)", model_path, size_bytes / 2**20
+            )
+
+            with self._lock:
+                self._entries[exam_type] = _Entry(model, size_bytes)
+                self._evict()
+            return model
+
+    def inference_lock(self, exam_type: str) -> threading.Lock:
+        """
+        Retorna o lock que serializa a inferência de um modelo.
+
+        O predictor do ultralytics guarda estado entre chamadas e não pode ser
+        usado por duas threads ao mesmo tempo.
+        """
+        with self._lock:
+            return self._inference_locks.setdefault(exam_type, threading.Lock())
+
+    def _evict(self):
+        """Descarta os modelos menos usados até respeitar os limites."""
+        while len(self._entries) > 1 and (
+            (self._max_models and len(self._entries) > self._max_models)
+            or (
+                self._max_memory_bytes and self._memory_bytes() > self._max_memory_bytes
+            )
+        ):
+            exam_type, _ = self._entries.popitem(last=False)
+            self._warm.discard(exam_type)
+            logger.info("Modelo removido da memória (LRU): {}", exam_type)
+
+    def _memory_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def memory_bytes(self) -> int:
+        """Retorna a memória estimada de todos os modelos residentes."""
+        with self._lock:
+            return self._memory_bytes()
+
+    def resident(self) -> list:
+        """Retorna os tipos de exame com modelo residente, do menos ao mais usado."""
+        with self._lock:
+            return list(self._entries)
+
+    def is_loading(self, exam_type: str) -> bool:
+        """Indica se o modelo do tipo de exame está sendo carregado agora."""
+        with self._lock:
+            load_lock = self._load_locks.get(exam_type)
+            return (
+                load_lock is not None
+                and load_lock.locked()
+                and exam_type not in self._entries
+            )
+
+    def is_warm(self, exam_type: str) -> bool:
+        """Indica se o modelo do tipo de exame está residente e aquecido."""
+        with self._lock:
+            return exam_type in self._warm and exam_type in self._entries
+
+    def warm_up(self, exam_types: Iterable[str], warm_fn: Callable[[str], None]):
+        """
+        Carrega e aquece uma lista de modelos.
+
+        Args:
+            exam_types (Iterable[str]): Tipos de exame a pré-carregar.
+            warm_fn (Callable): Função que recebe o tipo de exame e executa a
+                inferência de aquecimento.
+        """
+        for exam_type in exam_types:
+            try:
+                self.get(exam_type)
+                warm_fn(exam_type)
+            except Exception as e:
+                logger.error("Falha ao aquecer o modelo {}: {}", exam_type, str(e))
+                continue
+            with self._lock:
+                if exam_type in self._entries:
+                    self._warm.add(exam_type)
+            logger.info("Modelo aquecido: {}", exam_type)
+
+    def clear(self):
+        """Remove todos os modelos residentes."""
+        with self._lock:
+            self._entries.clear()
+            self._warm.clear()
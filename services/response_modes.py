@@ -0,0 +1,192 @@
+import asyncio
+import json
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Iterable, List, Optional, Tuple
+
+# Modos de resposta dos endpoints que retornam imagens anotadas
+RESPONSE_MODES = ("json", "ndjson", "multipart", "boxes")
+RESPONSE_MODE_PATTERN = "^(" + "|".join(RESPONSE_MODES) + ")$"
+
+# Formato da query -> (formato do PIL, media type, extensão)
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "png": ("PNG", "image/png", "png"),
+}
+IMAGE_FORMAT_PATTERN = "^(" + "|".join(IMAGE_FORMATS) + ")$"
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MULTIPART_MEDIA_TYPE = "multipart/mixed"
+SSE_MEDIA_TYPE = "text/event-stream"
+# Evita que proxies guardem a resposta em buffer antes de repassá-la
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def resolve_response_mode(response_mode: Optional[str], accept: Optional[str]) -> str:
+    """
+    Escolhe o modo de resposta pela query ou, na ausência dela, pelo Accept.
+
+    Args:
+        response_mode (str, opcional): O valor do parâmetro `response_mode`.
+        accept (str, opcional): O cabeçalho Accept da requisição.
+
+    Returns:
+        str: Um dos modos em RESPONSE_MODES.
+    """
+    if response_mode:
+        return response_mode
+    accept = (accept or "").lower()
+    if NDJSON_MEDIA_TYPE in accept:
+        return "ndjson"
+    if MULTIPART_MEDIA_TYPE in accept:
+        return "multipart"
+    return "json"
+
+
+def wants_event_stream(stream: bool, accept: Optional[str]) -> bool:
+    """Indica se a resposta deve ser em Server-Sent Events (`stream` ou Accept)."""
+    return stream or SSE_MEDIA_TYPE in (accept or "").lower()
+
+
+class ImageOptions:
+    """
+    Opções de codificação das imagens anotadas.
+
+    Args:
+        image_format (str): "jpeg", "webp" ou "png".
+        quality (int): Qualidade dos formatos com perda (1-100).
+        preview_size (int, opcional): Maior dimensão da imagem retornada; a
+            imagem é reduzida quando for maior.
+    """
+
+    __slots__ = ("pil_format", "media_type", "extension", "quality", "preview_size")
+
+    def __init__(
+        self, image_format: str = "jpeg", quality: int = 85, preview_size: int = None
+    ):
+        self.pil_format, self.media_type, self.extension = IMAGE_FORMATS[image_format]
+        self.quality = quality
+        self.preview_size = preview_size
+
+
+async def iter_completed(
+    awaitables: Iterable[Awaitable],
+) -> AsyncIterator[Tuple[int, asyncio.Future]]:
+    """
+    Itera sobre as tarefas na ordem em que terminam.
+
+    Cada item é (índice da tarefa na entrada, tarefa concluída); o chamador
+    obtém o resultado ou a exceção com `task.result()`. Se a iteração for
+    interrompida, por exemplo porque o cliente desconectou, as tarefas
+    pendentes são canceladas.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    indexes = {task: index for index, task in enumerate(tasks)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in sorted(done, key=indexes.get):
+                yield indexes[task], task
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def merge_streams(
+    streams: List[AsyncIterator[Any]],
+) -> AsyncIterator[Tuple[int, Any, Optional[Exception]]]:
+    """
+    Itera sobre vários iteradores assíncronos ao mesmo tempo.
+
+    Cada item é (índice do iterador, item, None) assim que chega, e o fim de
+    cada iterador é sinalizado por (índice, None, exceção ou None); por isso
+    os iteradores não devem produzir None. Se a iteração for interrompida,
+    por exemplo porque o cliente desconectou, os iteradores pendentes são
+    cancelados.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def consume(index: int, stream: AsyncIterator[Any]):
+        try:
+            async for item in stream:
+                await queue.put((index, item, None))
+        except Exception as e:
+            await queue.put((index, None, e))
+            return
+        await queue.put((index, None, None))
+
+    tasks = [
+        asyncio.ensure_future(consume(index, stream))
+        for index, stream in enumerate(streams)
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            index, item, error = await queue.get()
+            if item is None:
+                remaining -= 1
+            yield index, item, error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def sse_stream(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[bytes]:
+    """Serializa cada (evento, dados) como um Server-Sent Event com dados em JSON."""
+    async for event, data in events:
+        payload = json.dumps(data, ensure_ascii=False)
+        yield f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+async def ndjson_stream(items: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Serializa cada item como uma linha JSON (NDJSON)."""
+    async for item in items:
+        yield json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def multipart_boundary() -> str:
+    return uuid.uuid4().hex
+
+
+async def multipart_stream(
+    parts: AsyncIterator[Tuple[dict, bytes]], boundary: str
+) -> AsyncIterator[bytes]:
+    """
+    Serializa cada parte (cabeçalhos, corpo) em um corpo multipart/mixed.
+
+    Args:
+        parts (AsyncIterator[Tuple[dict, bytes]]): As partes da resposta.
+        boundary (str): O delimitador informado no Content-Type.
+    """
+    delimiter = f"--{boundary}\r\n".encode("ascii")
+    async for headers, body in parts:
+        head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        yield delimiter + head.encode("utf-8") + b"\r\n" + body + b"\r\n"
+    yield f"--{boundary}--\r\n".encode("ascii")
+
+
+def json_part(payload: dict) -> Tuple[dict, bytes]:
+    """Cria uma parte multipart com um documento JSON."""
+    return (
+        {"Content-Type": "application/json"},
+        json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+    )
+
+
+def image_part(
+    image_bytes: bytes, options: ImageOptions, index: int, filename: str
+) -> Tuple[dict, bytes]:
+    """Cria uma parte multipart com os bytes de uma imagem anotada."""
+    stem = (filename or f"image_{index}").rsplit(".", 1)[0].replace('"', "")
+    return (
+        {
+            "Content-Type": options.media_type,
+            "Content-Disposition": f'attachment; filename="{stem}.{options.extension}"',
+            "Content-Length": str(len(image_bytes)),
+            "X-File-Index": str(index),
+        },
+        image_bytes,
+    )
@@ -0,0 +1,188 @@
+import math
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from services.detections import Detections
+from services.inference_engines import NMS_MAX_DETECTIONS
+
+
+def tile_starts(length: int, tile_size: int, overlap: float) -> List[int]:
+    """
+    Posições iniciais dos blocos em um eixo, distribuídas de forma uniforme.
+
+    O primeiro bloco começa em 0 e o último termina na borda da imagem; a
+    sobreposição entre blocos vizinhos é de pelo menos `overlap` do bloco.
+
+    Args:
+        length (int): O comprimento da imagem no eixo.
+        tile_size (int): O tamanho do bloco.
+        overlap (float): A sobreposição mínima, como fração do bloco.
+
+    Returns:
+        List[int]: As posições iniciais dos blocos.
+    """
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1 - overlap)))
+    count = math.ceil((length - tile_size) / stride) + 1
+    return np.linspace(0, length - tile_size, count).round().astype(int).tolist()
+
+
+def box_ios(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Interseção sobre a área da menor caixa, entre a caixa xyxy (4,) e (N, 4)."""
+    inter_w = np.clip(
+        np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None
+    )
+    inter_h = np.clip(
+        np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None
+    )
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter_w * inter_h / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def merge_detections(
+    detections: Detections, threshold: float, max_detections: int = NMS_MAX_DETECTIONS
+) -> Detections:
+    """
+    Junta as detecções repetidas de blocos vizinhos (NMS guloso por classe).
+
+    Um objeto cortado na borda de um bloco aparece inteiro no bloco vizinho
+    e em parte no outro, com IoU baixo entre as caixas. Por isso a sobreposição
+    é medida pela interseção sobre a menor caixa, e a caixa mantida passa a
+    cobrir as caixas que ela absorveu, com a maior confiança entre elas.
+
+    Args:
+        detections (Detections): As detecções de todos os blocos, em
+            coordenadas da imagem inteira.
+        threshold (float): A sobreposição a partir da qual duas caixas da
+            mesma classe são o mesmo objeto.
+        max_detections (int, opcional): Número máximo de detecções.
+
+    Returns:
+        Detections: As detecções sem repetições, em ordem decrescente de confiança.
+    """
+    boxes, confidence, class_id = (
+        detections.boxes,
+        detections.confidence,
+        detections.class_id,
+    )
+    order = np.argsort(-confidence, kind="stable")
+    merged_boxes, keep = [], []
+    while len(order) and len(keep) < max_detections:
+        best, rest = order[0], order[1:]
+        same = np.zeros(len(rest), dtype=bool)
+        candidates = np.flatnonzero(class_id[rest] == class_id[best])
+        same[candidates] = box_ios(boxes[best], boxes[rest[candidates]]) >= threshold
+        group = boxes[np.append(best, rest[same])]
+        merged_boxes.append(
+            np.concatenate([group[:, :2].min(axis=0), group[:, 2:].max(axis=0)])
+        )
+        keep.append(best)
+        order = rest[~same]
+    if not keep:
+        return Detections.empty(detections.names)
+    return Detections(
+        np.stack(merged_boxes), confidence[keep], class_id[keep], detections.names
+    )
+
+
+class TilePlan:
+    """
+    Divisão de uma imagem em blocos sobrepostos para a inferência.
+
+    Imagens em que a grade passaria de `max_tiles` blocos são reduzidas
+    antes da divisão. Com `full_image`, a imagem inteira entra no lote
+    depois dos blocos, para os objetos maiores que um bloco.
+
+    Args:
+        shape (Tuple[int, int]): Altura e largura da imagem.
+        tile_size (int): O tamanho do bloco em pixels.
+        overlap (float): A sobreposição entre blocos vizinhos (fração do bloco).
+        max_tiles (int): Número máximo de blocos da imagem.
+        full_image (bool): Inclui a imagem inteira no lote.
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        tile_size: int,
+        overlap: float,
+        max_tiles: int,
+        full_image: bool,
+    ):
+        height, width = shape
+        self.original_shape = shape
+        self.scale = 1.0
+        while True:
+            self.shape = (
+                max(1, round(height * self.scale)),
+                max(1, round(width * self.scale)),
+            )
+            rows = tile_starts(self.shape[0], tile_size, overlap)
+            columns = tile_starts(self.shape[1], tile_size, overlap)
+            if len(rows) * len(columns) <= max(1, max_tiles):
+                break
+            self.scale *= 0.9
+        self.windows = [
+            (
+                top,
+                left,
+                min(top + tile_size, self.shape[0]),
+                min(left + tile_size, self.shape[1]),
+            )
+            for top in rows
+            for left in columns
+        ]
+        # Uma imagem que cabe em um bloco já é analisada inteira
+        self.full_image = full_image and len(self.windows) > 1
+
+    def __len__(self) -> int:
+        return len(self.windows) + self.full_image
+
+    def split(self, image: np.ndarray) -> List[np.ndarray]:
+        """Recorta os blocos (e a imagem inteira, com `full_image`) de `image`."""
+        if self.scale != 1:
+            size = (self.shape[1], self.shape[0])
+            image = np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+        tiles = [
+            image[top:bottom, left:right] for top, left, bottom, right in self.windows
+        ]
+        if self.full_image:
+            tiles.append(image)
+        return tiles
+
+    def merge(self, predicts: List[Detections], threshold: float) -> Detections:
+        """
+        Junta as detecções dos blocos nas coordenadas da imagem original.
+
+        Args:
+            predicts (List[Detections]): As detecções de cada item de `split`, na
+                mesma ordem.
+            threshold (float): Ver `merge_detections`.
+
+        Returns:
+            Detections: As detecções da imagem.
+        """
+        offsets = [(left, top, left, top) for top, left, _, _ in self.windows]
+        if self.full_image:
+            offsets.append((0, 0, 0, 0))
+        detections = Detections(
+            np.concatenate(
+                [
+                    predict.boxes + np.float32(offset)
+                    for predict, offset in zip(predicts, offsets)
+                ]
+            ),
+            np.concatenate([predict.confidence for predict in predicts]),
+            np.concatenate([predict.class_id for predict in predicts]),
+            predicts[0].names,
+        )
+        # Cada eixo da imagem reduzida foi arredondado separadamente
+        factors = (
+            self.original_shape[1] / self.shape[1],
+            self.original_shape[0] / self.shape[0],
+        )
+        return merge_detections(detections, threshold).scaled(factors)
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# O config.py exige a chave da OpenAI; os testes não acessam a rede nem gravam
+# log em arquivo
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault(
+    "JOBS_DB", os.path.join(tempfile.mkdtemp(prefix="jobs-"), "jobs.db")
+)
+
+# Os módulos do projeto são importados a partir da raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
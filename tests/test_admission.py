@@ -0,0 +1,66 @@
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(max_images=10, per_exam_type=None, default_per_exam_type=0):
+    return AdmissionController(
+        max_images=max_images,
+        max_images_per_exam_type=per_exam_type or {},
+        default_max_images_per_exam_type=default_per_exam_type,
+        retry_after_s=2.5,
+    )
+
+
+def test_worker_limit_rejects_until_release():
+    controller = _controller(max_images=10)
+    controller.acquire("ecg", 6)
+    controller.acquire("eeg", 4)
+    assert controller.saturated()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("ecg", 1)
+    assert rejected.value.retry_after == "3"
+
+    controller.release("ecg", 6)
+    controller.acquire("ecg", 5)
+    assert controller.stats()["in_flight_by_exam_type"] == {"ecg": 5, "eeg": 4}
+    assert controller.stats()["rejected"] == {"worker": 1}
+
+
+def test_single_request_above_the_limit_is_admitted():
+    controller = _controller(max_images=4, per_exam_type={"ecg": 2})
+
+    controller.acquire("ecg", 50)
+
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("eeg", 1)
+
+
+def test_exam_type_limit_is_independent_of_other_exam_types():
+    controller = _controller(
+        max_images=0, per_exam_type={"ecg": 4}, default_per_exam_type=2
+    )
+    controller.acquire("ecg", 3)
+    controller.acquire("eeg", 2)
+
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("ecg", 2)
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("eeg", 1)
+    controller.acquire("ecg", 1)
+    controller.acquire("emg", 2)
+
+    assert controller.stats()["rejected"] == {"exam_type": 2}
+    assert not controller.saturated()
+
+
+def test_release_drops_idle_exam_types():
+    controller = _controller()
+    controller.acquire("ecg", 2)
+    controller.release("ecg", 2)
+
+    stats = controller.stats()
+    assert stats["in_flight_images"] == 0
+    assert stats["in_flight_by_exam_type"] == {}
+    assert stats["admitted"] == 1
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.batch_scheduler import MicroBatchScheduler
+
+
+class RecordingInfer:
+    """Inferência falsa que devolve o dobro de cada imagem e registra os lotes."""
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, exam_type, images):
+        with self._lock:
+            self.batches.append((exam_type, list(images)))
+        time.sleep(self.delay_s)
+        return [image * 2 for image in images]
+
+
+def test_concurrent_requests_share_one_batch():
+    infer = RecordingInfer()
+    scheduler = MicroBatchScheduler(infer, max_batch_size=16, max_wait_ms=50)
+
+    async def main():
+        return await asyncio.gather(
+            scheduler.detect("ecg", [1, 2]),
+            scheduler.detect("ecg", [3]),
+            scheduler.detect("ecg", [4, 5, 6]),
+        )
+
+    results = asyncio.run(main())
+
+    assert results == [[2, 4], [6], [8, 10, 12]]
+    assert infer.batches == [("ecg", [1, 2, 3, 4, 5, 6])]
+    stats = scheduler.stats()["models"]["ecg"]
+    assert stats["batches"] == 1
+    assert stats["images"] == 6
+    assert stats["flushed_timeout"] == 1
+
+
+def test_full_batch_is_flushed_without_waiting():
+    infer = RecordingInfer()
+    scheduler = MicroBatchScheduler(infer, max_batch_size=2, max_wait_ms=10_000)
+
+    async def main():
+        return await asyncio.wait_for(scheduler.detect("ecg", [1, 2, 3, 4]), timeout=5)
+
+    assert asyncio.run(main()) == [2, 4, 6, 8]
+    assert [images for _, images in infer.batches] == [[1, 2], [3, 4]]
+    assert scheduler.stats()["models"]["ecg"]["flushed_full"] == 2
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    infer = RecordingInfer()
+    scheduler = MicroBatchScheduler(infer, max_batch_size=16, max_wait_ms=20)
+
+    async def main():
+        start = time.perf_counter()
+        result = await scheduler.detect("ecg", [1])
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(main())
+
+    assert result == [2]
+    assert 0.015 <= elapsed < 2
+    assert scheduler.stats()["models"]["ecg"]["flushed_timeout"] == 1
+
+
+def test_exam_types_are_batched_separately():
+    infer = RecordingInfer()
+    scheduler = MicroBatchScheduler(infer, max_batch_size=16, max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(
+            scheduler.detect("ecg", [1]), scheduler.detect("eeg", [2])
+        )
+
+    assert asyncio.run(main()) == [[2], [4]]
+    assert sorted(infer.batches) == [("ecg", [1]), ("eeg", [2])]
+
+
+def test_images_arriving_during_a_batch_form_the_next_batch():
+    infer = RecordingInfer(delay_s=0.1)
+    scheduler = MicroBatchScheduler(infer, max_batch_size=16, max_wait_ms=1)
+
+    async def main():
+        first = asyncio.ensure_future(scheduler.detect("ecg", [1]))
+        await asyncio.sleep(0.03)
+        rest = await asyncio.gather(
+            scheduler.detect("ecg", [2]), scheduler.detect("ecg", [3])
+        )
+        return await first, rest
+
+    assert asyncio.run(main()) == ([2], [[4], [6]])
+    assert [images for _, images in infer.batches] == [[1], [2, 3]]
+
+
+def test_batch_error_is_propagated_to_every_caller():
+    def infer(exam_type, images):
+        raise RuntimeError("modelo indisponível")
+
+    scheduler = MicroBatchScheduler(infer, max_batch_size=16, max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(
+            scheduler.detect("ecg", [1]),
+            scheduler.detect("ecg", [2]),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert [str(result) for result in results] == ["modelo indisponível"] * 2
+    assert scheduler.stats()["models"]["ecg"]["errors"] == 1
+
+
+def test_cancelled_images_are_dropped_from_the_batch():
+    infer = RecordingInfer()
+    scheduler = MicroBatchScheduler(infer, max_batch_size=16, max_wait_ms=50)
+
+    async def main():
+        cancelled = scheduler.submit("ecg", 1)
+        kept = scheduler.submit("ecg", 2)
+        cancelled.cancel()
+        return await kept
+
+    assert asyncio.run(main()) == 4
+    assert infer.batches == [("ecg", [2])]
+
+
+@pytest.mark.parametrize("max_concurrent_batches", [1, 2])
+def test_concurrent_batches_are_limited(max_concurrent_batches):
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def infer(exam_type, images):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return images
+
+    scheduler = MicroBatchScheduler(
+        infer,
+        max_batch_size=1,
+        max_wait_ms=0,
+        max_concurrent_batches=max_concurrent_batches,
+    )
+
+    async def main():
+        return await scheduler.detect("ecg", [1, 2, 3, 4])
+
+    assert asyncio.run(main()) == [1, 2, 3, 4]
+    assert peak == max_concurrent_batches
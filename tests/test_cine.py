@@ -0,0 +1,178 @@
+import asyncio
+import io
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import services.cine as cine
+from services.cine import (
+    CineFormatError,
+    FrameSampler,
+    analyze_cine,
+    dhash,
+    open_frames,
+)
+from services.detections import Detections, build_name_table
+
+NAMES = build_name_table({0: "onda_p", 1: "qrs"})
+
+# Quadros do exame por padrão de ruído: quadros com a mesma letra são idênticos
+SEQUENCE = "AAABBCCCCDEE"
+
+
+def _pattern(letter: str, size=(48, 64)) -> np.ndarray:
+    return np.random.default_rng(ord(letter)).integers(
+        0, 256, (*size, 3), dtype=np.uint8
+    )
+
+
+def _zip(sequence: str = SEQUENCE, size=(48, 64), image_format="PNG") -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for index, letter in enumerate(sequence):
+            frame = io.BytesIO()
+            Image.fromarray(_pattern(letter, size)).save(frame, image_format)
+            # Nomes sem zeros à esquerda: a ordem é a natural, e não a alfabética
+            archive.writestr(
+                f"frame_{index + 1}.{image_format.lower()}", frame.getvalue()
+            )
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def detected(monkeypatch):
+    """Substitui o modelo: uma detecção de "qrs" no canto de cada quadro."""
+    batches = []
+
+    async def detect_images(images, exam_type):
+        batches.append(len(images))
+        return [
+            Detections(np.array([[0, 0, 10, 10]]), [0.8], [1], NAMES) for _ in images
+        ]
+
+    monkeypatch.setattr(cine, "detect_images", detect_images)
+    return batches
+
+
+def _analyze(
+    file, stride=1, max_frames=64, max_decoded=3000, max_distance=4, batch_size=4
+):
+    return asyncio.run(
+        analyze_cine(
+            file,
+            "exame.zip",
+            "ecg",
+            stride,
+            max_frames,
+            max_decoded,
+            max_distance,
+            batch_size,
+        )
+    )
+
+
+def test_dhash_separates_distinct_frames():
+    assert dhash(_pattern("A")) == dhash(_pattern("A").copy())
+    assert (dhash(_pattern("A")) ^ dhash(_pattern("B"))).bit_count() > 64
+
+
+def test_zip_frames_are_read_in_natural_order():
+    frames = list(open_frames(_zip(), "exame.zip"))
+
+    assert [index for index, _, _ in frames] == list(range(len(SEQUENCE)))
+    np.testing.assert_array_equal(frames[9][1][..., ::-1], _pattern("D"))
+
+
+def test_duplicates_are_counted_as_repeats(detected):
+    result = _analyze(_zip())
+
+    assert [(f["frame"], f["repeats"]) for f in result["frames"]] == [
+        (0, 2),
+        (3, 1),
+        (5, 3),
+        (9, 0),
+        (10, 1),
+    ]
+    summary = result["summary"]
+    assert summary["frames_decoded"] == 12
+    assert summary["frames_analyzed"] == 5
+    assert summary["frames_skipped_duplicate"] == 7
+    assert summary["complete"] is True
+    assert summary["detections"] == [
+        {
+            "name": "qrs",
+            "frames": 5,
+            "frame_ratio": 1.0,
+            "detections": 5,
+            "max_confidence": 0.8,
+            "mean_confidence": 0.8,
+        }
+    ]
+    assert detected == [4, 1]
+
+
+def test_dedupe_can_be_disabled(detected):
+    summary = _analyze(_zip(), max_distance=-1)["summary"]
+
+    assert summary["frames_analyzed"] == 12
+    assert summary["frames_skipped_duplicate"] == 0
+
+
+def test_frame_stride_skips_source_frames(detected):
+    result = _analyze(_zip(), stride=2)
+
+    # Quadros 0, 2, 4, 6, 8 e 10: A, A, B, C, C, E
+    assert [(f["frame"], f["repeats"]) for f in result["frames"]] == [
+        (0, 1),
+        (4, 0),
+        (6, 1),
+        (10, 0),
+    ]
+    summary = result["summary"]
+    assert (summary["frame_stride"], summary["frames_decoded"]) == (2, 6)
+    assert summary["complete"] is True
+
+
+def test_frame_cap_stops_reading_the_source(detected):
+    summary = _analyze(_zip(), max_frames=2)["summary"]
+
+    # Para no segundo quadro distinto (índice 3), sem ler o restante
+    assert summary["frames_analyzed"] == 2
+    assert summary["frames_decoded"] == 4
+    assert summary["complete"] is False
+
+
+def test_decoded_cap_counts_duplicates(detected):
+    summary = _analyze(_zip(), max_decoded=3)["summary"]
+
+    assert (summary["frames_decoded"], summary["frames_analyzed"]) == (3, 1)
+    assert summary["frames_skipped_duplicate"] == 2
+    assert summary["complete"] is False
+
+
+def test_large_frames_are_reduced_and_boxes_mapped_back(detected):
+    result = _analyze(_zip("AB", size=(960, 1280), image_format="JPEG"))
+
+    assert (result["width"], result["height"]) == (1280, 960)
+    # O JPEG foi decodificado em 1/2: a caixa volta à resolução original
+    assert result["frames"][0]["detections"][0]["box"] == [0.0, 0.0, 20.0, 20.0]
+
+
+def test_sampler_without_frames_reports_exhausted():
+    sampler = FrameSampler(iter([]), max_frames=4, max_decoded=10, max_distance=4)
+
+    assert sampler.next_batch(4) == []
+    assert sampler.exhausted
+
+
+def test_empty_zip_is_rejected(detected):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("leia-me.txt", "sem quadros")
+    buffer.seek(0)
+
+    with pytest.raises(CineFormatError):
+        _analyze(buffer)
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from services.detection_cache import DetectionCache, detection_key
+
+
+def test_detection_key_depends_on_content_and_parameters():
+    key = detection_key(b"abc", "ecg", 640, 0.25, False, 640)
+
+    assert key == detection_key(b"abc", "ecg", 640, 0.25, False, 640)
+    assert key != detection_key(b"abd", "ecg", 640, 0.25, False, 640)
+    assert key != detection_key(b"abc", "ecg", 1280, 0.25, False, 640)
+    assert key != detection_key(b"abc", "ecg", 640, 0.25, False, 640, tiling="640:0.2")
+
+
+def test_detection_key_depends_on_the_decode_mode():
+    # Decodificação reduzida e em resolução original não compartilham a entrada
+    reduced = detection_key(b"abc", "ecg", 640, 0.25, False, 640)
+
+    assert reduced != detection_key(b"abc", "ecg", 640, 0.25, False, None)
+    assert reduced != detection_key(b"abc", "ecg", 640, 0.25, False, 1280)
+
+
+def test_only_missing_keys_are_computed():
+    cache = DetectionCache(max_entries=10)
+    calls = []
+
+    async def compute_many(indexes):
+        calls.append(list(indexes))
+        return [f"r{index}" for index in indexes]
+
+    async def main():
+        first = await cache.get_many(["a", "b"], compute_many)
+        second = await cache.get_many(["b", "c", "a"], compute_many)
+        return first, second
+
+    assert asyncio.run(main()) == (["r0", "r1"], ["r1", "r1", "r0"])
+    assert calls == [[0, 1], [1]]
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_concurrent_lookups_are_coalesced():
+    cache = DetectionCache(max_entries=10)
+    calls = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def compute_many(indexes):
+            calls.append(list(indexes))
+            await release.wait()
+            return ["resultado"] * len(indexes)
+
+        owner = asyncio.ensure_future(cache.get_many(["a"], compute_many))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.ensure_future(cache.get_many(["a"], compute_many)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert cache.stats()["inflight"] == 1
+        release.set()
+        return await owner, await asyncio.gather(*waiters)
+
+    owner, waiters = asyncio.run(main())
+
+    assert owner == ["resultado"]
+    assert waiters == [["resultado"]] * 3
+    assert calls == [[0]]
+    assert cache.coalesced == 3
+    assert cache.stats()["inflight"] == 0
+
+
+def test_error_is_propagated_to_coalesced_callers_and_not_cached():
+    cache = DetectionCache(max_entries=10)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def failing(indexes):
+            await release.wait()
+            raise RuntimeError("falha na inferência")
+
+        owner = asyncio.ensure_future(cache.get_many(["a"], failing))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_many(["a"], failing))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(owner, waiter, return_exceptions=True)
+
+        async def succeeding(indexes):
+            return ["ok"] * len(indexes)
+
+        return results, await cache.get_many(["a"], succeeding)
+
+    (owner_error, waiter_error), retry = asyncio.run(main())
+
+    assert isinstance(owner_error, RuntimeError)
+    assert waiter_error is owner_error
+    assert retry == ["ok"]
+    assert cache.stats()["inflight"] == 0
+
+
+def test_cancelled_owner_fails_coalesced_callers():
+    cache = DetectionCache(max_entries=10)
+
+    async def main():
+        async def compute_many(indexes):
+            await asyncio.sleep(10)
+
+        owner = asyncio.ensure_future(cache.get_many(["a"], compute_many))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_many(["a"], compute_many))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(RuntimeError):
+            await waiter
+        assert owner.cancelled()
+
+    asyncio.run(main())
+    assert cache.stats()["inflight"] == 0
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = DetectionCache(max_entries=2, max_bytes=100, size_fn=len)
+
+    async def compute_many(indexes):
+        return ["x" * 40] * len(indexes)
+
+    async def main():
+        await cache.get_many(["a", "b"], compute_many)
+        # "a" passa a ser a mais recente; "b" é a próxima a sair
+        await cache.get_many(["a"], compute_many)
+        await cache.get_many(["c"], compute_many)
+
+    asyncio.run(main())
+
+    assert list(cache._entries) == ["a", "c"]
+    assert cache.stats()["bytes"] == 80
+
+    cache = DetectionCache(max_entries=10, max_bytes=100, size_fn=len)
+    asyncio.run(cache.get_many(["a", "b", "c"], compute_many))
+    assert list(cache._entries) == ["b", "c"]
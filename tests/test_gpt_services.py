@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import pytest
+
+import services.gpt_services as gpt_services
+from services.gpt_services import (
+    BATCH_SYSTEM_MESSAGE,
+    SharedInterpretations,
+    get_clinical_interpretations,
+    parse_batch_interpretations,
+)
+
+DETECTIONS = [
+    [{"name": "qrs", "confidence": 0.9}],
+    [{"name": "onda_p", "confidence": 0.6}],
+    [],
+]
+
+
+def _batch_answer(texts):
+    return json.dumps(
+        {
+            "interpretations": [
+                {"file": i, "interpretation": t} for i, t in enumerate(texts)
+            ]
+        }
+    )
+
+
+class FakeCompletion:
+    """`create_chat_completion` falso: o lote recebe `batch_answer`."""
+
+    def __init__(self, batch_answer):
+        self.batch_answer = batch_answer
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    async def __call__(
+        self, prompt, system_message=gpt_services.SYSTEM_MESSAGE, response_format=None
+    ):
+        if system_message == BATCH_SYSTEM_MESSAGE:
+            self.batch_calls += 1
+            return self.batch_answer
+        self.single_calls += 1
+        return "individual: " + prompt[-40:]
+
+
+@pytest.fixture
+def completion(monkeypatch):
+    def install(batch_answer):
+        fake = FakeCompletion(batch_answer)
+        monkeypatch.setattr(gpt_services, "create_chat_completion", fake)
+        return fake
+
+    monkeypatch.setattr(gpt_services, "INTERPRETATION_BATCH_ENABLED", True)
+    monkeypatch.setattr(gpt_services, "INTERPRETATION_CACHE_ENABLED", False)
+    monkeypatch.setattr(gpt_services, "INTERPRETATION_BATCH_MAX_FILES", 10)
+    return install
+
+
+def test_parse_batch_interpretations_orders_by_file_index():
+    content = json.dumps(
+        {
+            "interpretations": [
+                {"file": 1, "interpretation": " segundo "},
+                {"file": 0, "interpretation": "primeiro"},
+            ]
+        }
+    )
+
+    assert parse_batch_interpretations(content, 2) == ["primeiro", "segundo"]
+    # Uma lista sem o objeto externo também é aceita, na ordem dos arquivos
+    assert parse_batch_interpretations('[{"interpretation": "a"}]', 1) == ["a"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "não é json",
+        '{"interpretations": [{"file": 0, "interpretation": "a"}]}',
+        _batch_answer(["a", "b"]).replace('"file": 1', '"file": 0'),
+        _batch_answer(["a", " "]),
+        '{"interpretations": ["a", "b"]}',
+        '{"outra_chave": []}',
+    ],
+)
+def test_parse_batch_interpretations_rejects_malformed_answers(content):
+    with pytest.raises(ValueError):
+        parse_batch_interpretations(content, 2)
+
+
+def test_batch_answer_is_split_per_file(completion):
+    fake = completion(_batch_answer(["a", "b", "c"]))
+
+    assert asyncio.run(get_clinical_interpretations(DETECTIONS, "ecg")) == [
+        "a",
+        "b",
+        "c",
+    ]
+    assert (fake.batch_calls, fake.single_calls) == (1, 0)
+
+
+@pytest.mark.parametrize(
+    "batch_answer",
+    ["{truncado", _batch_answer(["a", "b"]), '{"interpretations": null}'],
+)
+def test_malformed_batch_answer_falls_back_to_one_call_per_file(
+    completion, batch_answer
+):
+    fake = completion(batch_answer)
+
+    interpretations = asyncio.run(get_clinical_interpretations(DETECTIONS, "ecg"))
+
+    assert (fake.batch_calls, fake.single_calls) == (1, 3)
+    assert all(text.startswith("individual: ") for text in interpretations)
+    assert len(set(interpretations)) == 3
+
+
+def test_identical_detections_are_interpreted_once(completion):
+    fake = completion(_batch_answer(["a", "b"]))
+    detections = [DETECTIONS[0], DETECTIONS[1], DETECTIONS[0]]
+
+    assert asyncio.run(get_clinical_interpretations(detections, "ecg")) == [
+        "a",
+        "b",
+        "a",
+    ]
+    assert fake.batch_calls == 1
+
+
+def test_shared_interpretations_close_cancels_the_pending_call(monkeypatch):
+    started = []
+
+    async def slow(detections_per_file, exam_type):
+        started.append(True)
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(gpt_services, "get_clinical_interpretations", slow)
+
+    async def main():
+        shared = SharedInterpretations(DETECTIONS, "ecg")
+        reader = asyncio.ensure_future(shared.get(0))
+        await asyncio.sleep(0)
+        reader.cancel()
+        await asyncio.sleep(0)
+        # O leitor cancelado não cancela a chamada compartilhada; o close sim
+        assert not shared._task.done()
+        shared.close()
+        await asyncio.sleep(0)
+        return shared._task.cancelled()
+
+    assert asyncio.run(main())
+    assert started == [True]
@@ -0,0 +1,43 @@
+import numpy as np
+
+from services.inference_engines import _nms, box_iou, non_max_suppression
+
+
+def test_box_iou():
+    boxes = np.array(
+        [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32
+    )
+
+    np.testing.assert_allclose(box_iou(boxes[0], boxes), [1.0, 1 / 3, 0.0], rtol=1e-6)
+
+
+def test_nms_keeps_the_best_of_each_overlapping_group():
+    boxes = np.array(
+        [[0, 0, 10, 10], [1, 0, 11, 10], [20, 0, 30, 10], [21, 0, 31, 10]],
+        dtype=np.float32,
+    )
+    scores = np.array([0.8, 0.9, 0.5, 0.7], dtype=np.float32)
+
+    assert _nms(boxes, scores, iou=0.5, max_detections=10).tolist() == [1, 3]
+    assert _nms(boxes, scores, iou=0.95, max_detections=10).tolist() == [1, 0, 3, 2]
+    assert _nms(boxes, scores, iou=0.5, max_detections=1).tolist() == [1]
+
+
+def test_non_max_suppression_separates_classes_and_applies_conf():
+    # Saída do YOLOv8 (4 + classes, âncoras) com caixas em xywh
+    prediction = np.array(
+        [
+            # x, y, w, h, classe 0, classe 1
+            [50, 50, 20, 20, 0.9, 0.1],
+            [51, 50, 20, 20, 0.1, 0.8],
+            [52, 50, 20, 20, 0.7, 0.0],
+            [90, 90, 10, 10, 0.2, 0.1],
+        ],
+        dtype=np.float32,
+    ).T
+
+    boxes, scores, class_id = non_max_suppression(prediction, conf=0.25, iou=0.5)
+
+    np.testing.assert_allclose(boxes, [[40, 40, 60, 60], [41, 40, 61, 60]])
+    np.testing.assert_allclose(scores, [0.9, 0.8])
+    assert class_id.tolist() == [0, 1]
@@ -0,0 +1,117 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from PIL import Image
+
+from services.ingestion import UploadLimitMiddleware, UploadLimits, UploadRejected
+
+
+def _png(width: int, height: int) -> io.BytesIO:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, "PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def _limits(max_file_bytes=0, max_file_pixels=0, max_request_pixels=0):
+    return UploadLimits(max_file_bytes, max_file_pixels, max_request_pixels)
+
+
+def test_check_returns_image_sizes_from_the_header():
+    uploads = [("a.png", _png(40, 30)), ("b.png", _png(10, 20))]
+
+    assert _limits(10**6, 10**6, 10**6).check(uploads) == [(40, 30), (10, 20)]
+    # Os arquivos voltam ao início para a leitura seguinte
+    assert all(file.tell() == 0 for _, file in uploads)
+
+
+def test_file_above_the_byte_limit_is_rejected():
+    file = _png(40, 30)
+    size = len(file.getvalue())
+
+    assert _limits(max_file_bytes=size).check_size("a.png", file) == size
+    with pytest.raises(UploadRejected) as rejected:
+        _limits(max_file_bytes=size - 1).check([("a.png", file)])
+    assert (rejected.value.status_code, rejected.value.reason) == (413, "file_bytes")
+
+
+def test_image_above_the_file_megapixels_is_rejected():
+    with pytest.raises(UploadRejected) as rejected:
+        _limits(max_file_pixels=40 * 30 - 1).check([("a.png", _png(40, 30))])
+
+    assert (rejected.value.status_code, rejected.value.reason) == (413, "file_pixels")
+    assert "a.png" in rejected.value.detail
+
+
+def test_images_above_the_request_megapixels_are_rejected():
+    uploads = [("a.png", _png(40, 30)), ("b.png", _png(40, 30))]
+
+    assert len(_limits(max_request_pixels=2 * 40 * 30).check(uploads)) == 2
+    with pytest.raises(UploadRejected) as rejected:
+        _limits(max_request_pixels=2 * 40 * 30 - 1).check(uploads)
+    assert (rejected.value.status_code, rejected.value.reason) == (
+        413,
+        "request_pixels",
+    )
+
+
+def test_non_image_is_rejected_as_unsupported():
+    with pytest.raises(UploadRejected) as rejected:
+        _limits().check([("a.txt", io.BytesIO(b"texto simples"))])
+
+    assert (rejected.value.status_code, rejected.value.reason) == (415, "format")
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    received = []
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        body = await request.body()
+        received.append(len(body))
+        return {"bytes": len(body)}
+
+    limited = UploadLimitMiddleware(app, max_bytes=1000)
+
+    async def post(content, headers=None):
+        transport = httpx.ASGITransport(app=limited)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as http:
+            return await http.post("/upload", content=content, headers=headers)
+
+    def request(content, headers=None):
+        return asyncio.run(post(content, headers))
+
+    request.received = received
+    return request
+
+
+def test_body_within_the_limit_is_accepted(client):
+    response = client(b"x" * 1000)
+
+    assert response.status_code == 200
+    assert response.json() == {"bytes": 1000}
+
+
+def test_content_length_above_the_limit_is_rejected_before_reading(client):
+    response = client(b"x" * 1001)
+
+    assert response.status_code == 413
+    assert client.received == []
+
+
+def test_chunked_body_is_cut_off_above_the_limit(client):
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 300
+
+    response = client(chunks())
+
+    assert response.status_code == 413
+    assert client.received == []
@@ -0,0 +1,128 @@
+import io
+import os
+
+import pytest
+
+from services.job_store import CANCELLED, DONE, QUEUED, RUNNING, UPLOADING, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def _create(store, exam_type="ecg", files=((b"a", "0.jpg"), (b"b", "1.jpg"))):
+    uploads = [(name, io.BytesIO(data)) for data, name in files]
+    return store.create(exam_type, "object", {"quality": 85}, uploads)
+
+
+def test_create_stores_every_file(store):
+    content = os.urandom(3 * 2**20 + 5)
+    job_id = _create(store, files=((content, "big.jpg"), (b"", "empty.jpg")))
+
+    job = store.get(job_id)
+    assert job["status"] == QUEUED
+    assert job["total"] == 2
+    assert job["options"] == {"quality": 85}
+    assert store.pending_files(job_id) == [(0, "big.jpg"), (1, "empty.jpg")]
+    assert store.load_files(job_id, [1, 0]) == [b"", content]
+
+
+def test_failed_upload_removes_the_job(store):
+    class BrokenFile(io.BytesIO):
+        def read(self, size=-1):
+            raise OSError("upload interrompido")
+
+    with pytest.raises(OSError):
+        store.create(
+            "ecg", "object", {}, [("0.jpg", io.BytesIO(b"a")), ("1.jpg", BrokenFile())]
+        )
+
+    assert store.counts() == {}
+    assert store._connect().execute("SELECT COUNT(*) FROM job_files").fetchone() == (0,)
+
+
+def test_claim_respects_the_limit_per_exam_type(store):
+    first = _create(store, "ecg")
+    second = _create(store, "ecg")
+    other = _create(store, "eeg")
+
+    claimed = store.claim("w1", {"ecg": 1}, default_limit=1, stale_s=60)
+    assert claimed["id"] == first
+    assert claimed["status"] == RUNNING
+
+    # O segundo job de ecg espera; o de eeg tem vaga própria
+    assert store.claim("w2", {"ecg": 1}, default_limit=1, stale_s=60)["id"] == other
+    assert store.claim("w3", {"ecg": 1}, default_limit=1, stale_s=60) is None
+
+    assert store.finish(first, DONE)
+    assert store.claim("w3", {"ecg": 1}, default_limit=1, stale_s=60)["id"] == second
+
+
+def test_stale_job_is_reclaimed_from_pending_files(store):
+    job_id = _create(store)
+    assert store.claim("w1", {}, default_limit=1, stale_s=60)["id"] == job_id
+    store.save_result(job_id, 0, result={"detect_objects": []})
+
+    # Sem heartbeat há mais de stale_s: o worker morreu no meio do job
+    assert store.claim("w2", {}, default_limit=1, stale_s=60) is None
+    reclaimed = store.claim("w2", {}, default_limit=1, stale_s=-1)
+    assert reclaimed["id"] == job_id
+    assert store.pending_files(job_id) == [(1, "1.jpg")]
+    assert store.load_files(job_id, [1]) == [b"b"]
+
+
+def test_results_keep_order_and_errors(store):
+    job_id = _create(store)
+    store.claim("w1", {}, default_limit=1, stale_s=60)
+    store.save_result(job_id, 1, error="arquivo inválido")
+    store.save_result(job_id, 0, result={"detect_objects": []})
+
+    assert store.results(job_id) == [
+        {"index": 0, "filename": "0.jpg", "detect_objects": []},
+        {"index": 1, "filename": "1.jpg", "error": "arquivo inválido"},
+    ]
+    job = store.get(job_id)
+    assert (job["completed"], job["failed"]) == (2, 1)
+
+
+def test_cancel_discards_later_results(store):
+    job_id = _create(store)
+    store.claim("w1", {}, default_limit=1, stale_s=60)
+
+    assert store.cancel(job_id)
+    assert not store.cancel(job_id)
+    assert store.status(job_id) == CANCELLED
+    assert store.heartbeat(job_id) == CANCELLED
+
+    store.save_result(job_id, 0, result={"detect_objects": []})
+    assert store.results(job_id) == []
+    assert not store.finish(job_id, DONE)
+    assert store.claim("w2", {}, default_limit=1, stale_s=-1) is None
+
+
+def test_cancel_queued_job_and_unknown_job(store):
+    job_id = _create(store)
+
+    assert store.cancel(job_id)
+    assert store.claim("w1", {}, default_limit=1, stale_s=60) is None
+    assert not store.cancel("inexistente")
+    assert store.get("inexistente") is None
+
+
+def test_purge_removes_expired_and_interrupted_uploads(store):
+    finished = _create(store)
+    store.cancel(finished)
+    queued = _create(store)
+    # Upload interrompido no meio: o job nunca saiu de "uploading"
+    store._connect().execute(
+        "INSERT INTO jobs (id, exam_type, analysis, options, status, total, "
+        "created_at) VALUES ('parcial', 'ecg', 'object', '{}', ?, 1, 0)",
+        (UPLOADING,),
+    )
+
+    assert store.purge(ttl_s=3600) == 1
+    assert store.purge(ttl_s=-1) == 1
+    assert store.get(finished) is None
+    assert store.status(queued) == QUEUED
+    assert store.counts() == {QUEUED: 1}
@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+
+from services.job_store import CANCELLED, RUNNING
+from services.jobs import JobRunner
+
+
+class FlakyStore:
+    """JobStore falso cujo heartbeat falha nas chamadas indicadas."""
+
+    def __init__(self, failures, status=RUNNING):
+        self.failures = set(failures)
+        self.status = status
+        self.calls = 0
+
+    def heartbeat(self, job_id):
+        self.calls += 1
+        if self.calls in self.failures:
+            raise sqlite3.OperationalError("database is locked")
+        return self.status
+
+
+def _runner(store, heartbeat_s=0.01, stale_s=0.1):
+    return JobRunner(
+        store,
+        workers=0,
+        exam_type_limits={},
+        default_limit=1,
+        chunk_size=1,
+        heartbeat_s=heartbeat_s,
+        stale_s=stale_s,
+        ttl_s=60,
+    )
+
+
+async def _heartbeat_outcome(store, duration_s=0.2):
+    job = asyncio.create_task(asyncio.sleep(duration_s))
+    heartbeat = asyncio.create_task(_runner(store)._heartbeat("job", job))
+    try:
+        await job
+        return "completed"
+    except asyncio.CancelledError:
+        return "cancelled"
+    finally:
+        heartbeat.cancel()
+
+
+def test_heartbeat_survives_transient_store_errors():
+    store = FlakyStore(failures={1, 3})
+
+    assert asyncio.run(_heartbeat_outcome(store)) == "completed"
+    assert store.calls > 3
+
+
+def test_heartbeat_cancels_the_job_after_a_sustained_outage():
+    store = FlakyStore(failures=set(range(1, 1000)))
+
+    assert asyncio.run(_heartbeat_outcome(store, duration_s=2)) == "cancelled"
+
+
+def test_heartbeat_cancels_a_job_cancelled_elsewhere():
+    store = FlakyStore(failures=(), status=CANCELLED)
+
+    assert asyncio.run(_heartbeat_outcome(store)) == "cancelled"
+    assert store.calls == 1
@@ -0,0 +1,89 @@
+import numpy as np
+
+from services.detections import Detections, build_name_table
+from services.tiling import TilePlan, merge_detections, tile_starts
+
+NAMES = build_name_table({0: "onda_p", 1: "qrs"})
+
+
+def _detections(boxes, confidence, class_id):
+    return Detections(np.array(boxes), np.array(confidence), np.array(class_id), NAMES)
+
+
+def test_tile_starts_cover_the_axis_with_overlap():
+    assert tile_starts(500, 640, 0.2) == [0]
+    starts = tile_starts(2000, 640, 0.2)
+
+    assert starts[0] == 0 and starts[-1] == 2000 - 640
+    assert all(640 - (b - a) >= 0.2 * 640 for a, b in zip(starts, starts[1:]))
+
+
+def test_merge_joins_a_box_cut_at_the_tile_border():
+    # O objeto aparece inteiro em um bloco e cortado no vizinho (IoU baixo, IoS alto)
+    detections = _detections(
+        [[500, 10, 700, 110], [600, 10, 700, 110], [100, 10, 200, 110]],
+        [0.6, 0.9, 0.8],
+        [1, 1, 1],
+    )
+
+    merged = merge_detections(detections, threshold=0.8)
+
+    np.testing.assert_allclose(merged.boxes, [[500, 10, 700, 110], [100, 10, 200, 110]])
+    np.testing.assert_allclose(merged.confidence, [0.9, 0.8])
+
+
+def test_merge_keeps_classes_apart():
+    detections = _detections([[0, 0, 10, 10], [0, 0, 10, 10]], [0.9, 0.8], [0, 1])
+
+    merged = merge_detections(detections, threshold=0.5)
+
+    assert merged.class_id.tolist() == [0, 1]
+
+
+def test_merge_limits_detections_and_handles_empty_input():
+    boxes = [[i * 20, 0, i * 20 + 10, 10] for i in range(5)]
+    detections = _detections(boxes, [0.1, 0.5, 0.3, 0.9, 0.7], [0] * 5)
+
+    merged = merge_detections(detections, threshold=0.5, max_detections=2)
+
+    np.testing.assert_allclose(merged.confidence, [0.9, 0.7])
+    assert len(merge_detections(Detections.empty(NAMES), threshold=0.5).boxes) == 0
+
+
+def test_plan_merge_maps_tile_boxes_to_the_image():
+    plan = TilePlan(
+        (100, 1000), tile_size=400, overlap=0.25, max_tiles=16, full_image=False
+    )
+    assert len(plan) == len(plan.windows) > 1
+    second_left = plan.windows[1][1]
+
+    empty = Detections.empty(NAMES)
+    predicts = [empty] * len(plan)
+    predicts[1] = _detections([[10, 20, 30, 40]], [0.9], [1])
+
+    merged = plan.merge(predicts, threshold=0.8)
+
+    np.testing.assert_allclose(
+        merged.boxes, [[second_left + 10, 20, second_left + 30, 40]]
+    )
+
+
+def test_downscaled_plan_merges_in_original_coordinates():
+    plan = TilePlan(
+        (300, 3000), tile_size=100, overlap=0.1, max_tiles=4, full_image=True
+    )
+    assert plan.scale < 1
+    assert len(plan) == len(plan.windows) + 1
+
+    image = np.zeros((300, 3000, 3), dtype=np.uint8)
+    tiles = plan.split(image)
+    assert len(tiles) == len(plan)
+    assert tiles[-1].shape[:2] == plan.shape
+
+    height, width = plan.shape
+    predicts = [Detections.empty(NAMES)] * len(plan)
+    predicts[-1] = _detections([[0, 0, width / 2, height]], [0.9], [0])
+
+    merged = plan.merge(predicts, threshold=0.8)
+
+    np.testing.assert_allclose(merged.boxes, [[0, 0, 1500, 300]], rtol=1e-5)
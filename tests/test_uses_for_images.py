@@ -0,0 +1,59 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from services.detections import Detections, build_name_table
+from utils.uses_for_images import get_array_from_bytes
+
+# Retângulo claro em coordenadas da imagem original (xmin, ymin, xmax, ymax)
+RECTANGLE = (2000, 600, 2800, 1050)
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    xmin, ymin, xmax, ymax = RECTANGLE
+    pixels[ymin:ymax, xmin:xmax] = 255
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def _bright_box(pixels: np.ndarray) -> list:
+    rows, columns = np.nonzero(pixels.mean(axis=2) > 127)
+    return [columns.min(), rows.min(), columns.max() + 1, rows.max() + 1]
+
+
+@pytest.mark.parametrize(
+    "size, reduced_size",
+    [
+        ((4000, 1500), (1000, 375)),
+        # Eixos ímpares: o decodificador arredonda cada eixo para cima
+        ((4001, 1501), (2001, 751)),
+    ],
+)
+def test_reduced_decode_factors_map_boxes_to_the_original(size, reduced_size):
+    width, height = size
+
+    pixels, (sx, sy) = get_array_from_bytes(_jpeg(width, height), target_size=1000)
+
+    assert (pixels.shape[1], pixels.shape[0]) == reduced_size
+    assert (sx, sy) == (width / reduced_size[0], height / reduced_size[1])
+
+    detections = Detections(
+        np.array([_bright_box(pixels)]), [0.9], [0], build_name_table({0: "qrs"})
+    )
+    np.testing.assert_allclose(detections.scaled((sx, sy)).boxes[0], RECTANGLE, atol=8)
+
+
+def test_small_or_non_jpeg_images_are_decoded_at_full_resolution():
+    pixels, scale = get_array_from_bytes(_jpeg(4000, 1500), target_size=2500)
+    assert pixels.shape[:2] == (1500, 4000)
+    assert scale == (1.0, 1.0)
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (4000, 1500)).save(buffer, "PNG")
+    pixels, scale = get_array_from_bytes(buffer.getvalue(), target_size=1000)
+    assert pixels.shape[:2] == (1500, 4000)
+    assert scale == (1.0, 1.0)
@@ -0,0 +1,159 @@
+"""
+Compara as detecções de um motor de inferência com as do modelo PyTorch.
+
+Executa o .pt (ultralytics) e o modelo exportado nas mesmas imagens, com os
+parâmetros dos endpoints de análise, e associa as detecções por classe e IoU.
+Termina com código 1 se alguma imagem ficar fora da tolerância. Exemplo:
+
+    python tools/check_engine_parity.py --exam-type ecg_signal --engine onnxruntime
+    python tools/check_engine_parity.py --exam-type ecg_signal \\
+        --model ./AI/cardiac/ecg-signal-detec.int8.onnx --conf-tol 0.1
+
+Detecções sem par com confiança a até --conf-tol do limiar de confiança são
+listadas, mas não reprovam a imagem: elas mudam de lado do limiar com
+diferenças numéricas pequenas.
+"""
+
+import argparse
+import os
+import sys
+from typing import List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# O config exige a chave da OpenAI, que não é usada na comparação
+os.environ.setdefault("OPENAI_API_KEY", "check-engine-parity")
+
+from services.ai_services import (  # noqa: E402
+    DETECTION_CONF,
+    DETECTION_IMAGE_SIZE,
+    ai_paths,
+)
+from services.detections import Detections  # noqa: E402
+from services.inference_engines import (  # noqa: E402
+    ENGINES,
+    box_iou,
+    engine_model_path,
+    load_engine,
+)
+from utils.uses_for_images import get_array_from_bytes  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def match_detections(
+    reference: Detections, candidate: Detections, iou_threshold: float
+) -> Tuple[List[Tuple[int, int, float]], List[int], List[int]]:
+    """
+    Associa as detecções de mesma classe com IoU >= `iou_threshold`, em ordem
+    decrescente de confiança da referência.
+
+    Returns:
+        Tuple: Pares (índice da referência, índice do candidato, IoU), índices
+            da referência sem par e índices do candidato sem par.
+    """
+    pairs = []
+    free = np.ones(len(candidate), dtype=bool)
+    missing = []
+    for index in np.argsort(-reference.confidence, kind="stable"):
+        options = np.flatnonzero(
+            free & (candidate.class_id == reference.class_id[index])
+        )
+        if len(options):
+            ious = box_iou(reference.boxes[index], candidate.boxes[options])
+            best = int(np.argmax(ious))
+            if ious[best] >= iou_threshold:
+                pairs.append((int(index), int(options[best]), float(ious[best])))
+                free[options[best]] = False
+                continue
+        missing.append(int(index))
+    return pairs, missing, np.flatnonzero(free).tolist()
+
+
+def compare(reference: Detections, candidate: Detections, args) -> dict:
+    pairs, missing, extra = match_detections(reference, candidate, args.iou)
+    borderline = DETECTION_CONF + args.conf_tol
+    conf_diffs = [
+        abs(float(reference.confidence[ref] - candidate.confidence[cand]))
+        for ref, cand, _ in pairs
+    ]
+    failures = (
+        sum(reference.confidence[index] > borderline for index in missing)
+        + sum(candidate.confidence[index] > borderline for index in extra)
+        + sum(diff > args.conf_tol for diff in conf_diffs)
+    )
+    return {
+        "matched": len(pairs),
+        "missing": [reference.labels[index] for index in missing],
+        "extra": [candidate.labels[index] for index in extra],
+        "max_conf_diff": max(conf_diffs, default=0.0),
+        "min_iou": min((iou for _, _, iou in pairs), default=1.0),
+        "ok": not failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--exam-type", required=True, help="Tipo de exame de ai_paths")
+    parser.add_argument(
+        "--engine", choices=[e for e in ENGINES if e != "torch"], default="onnxruntime"
+    )
+    parser.add_argument(
+        "--model", help="Arquivo do modelo exportado (padrão: o caminho do motor)"
+    )
+    parser.add_argument(
+        "--images", default="imgs", help="Diretório das imagens de teste"
+    )
+    parser.add_argument(
+        "--iou", type=float, default=0.9, help="IoU mínimo de um par de detecções"
+    )
+    parser.add_argument(
+        "--conf-tol", type=float, default=0.05, help="Diferença de confiança tolerada"
+    )
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    args = parser.parse_args()
+    if args.exam_type not in ai_paths:
+        parser.error(f"Tipo de exame não suportado: {args.exam_type}")
+
+    weights_path = ai_paths[args.exam_type]
+    model_path = args.model or engine_model_path(args.engine, weights_path)
+    reference_engine = load_engine(weights_path)
+    candidate_engine = load_engine(model_path, args.cpu_threads)
+    print(
+        f"Referência: {weights_path} | "
+        f"candidato: {model_path} ({candidate_engine.engine})"
+    )
+
+    filenames = sorted(
+        name
+        for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not filenames:
+        parser.error(f"Nenhuma imagem em {args.images}")
+    failed = 0
+    for filename in filenames:
+        with open(os.path.join(args.images, filename), "rb") as file:
+            pixels, _ = get_array_from_bytes(file.read(), DETECTION_IMAGE_SIZE)
+        reference = reference_engine.detect(
+            [pixels], DETECTION_IMAGE_SIZE, DETECTION_CONF
+        )[0]
+        candidate = candidate_engine.detect(
+            [pixels], DETECTION_IMAGE_SIZE, DETECTION_CONF
+        )[0]
+        result = compare(reference, candidate, args)
+        failed += not result["ok"]
+        print(
+            f"{'OK   ' if result['ok'] else 'FALHA'} {filename}: "
+            f"pares={result['matched']} sem_par_ref={result['missing']} "
+            f"sem_par_candidato={result['extra']} "
+            f"max_diff_conf={result['max_conf_diff']:.4f} "
+            f"min_iou={result['min_iou']:.3f}"
+        )
+    print(f"{len(filenames) - failed}/{len(filenames)} imagens dentro da tolerância")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
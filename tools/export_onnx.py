@@ -0,0 +1,90 @@
+"""
+Exporta os modelos .pt para os motores de inferência em CPU.
+
+Gera os arquivos nos caminhos esperados por INFERENCE_ENGINES (ao lado do .pt)
+e, com --int8, uma cópia do ONNX com pesos quantizados em INT8. Exemplo:
+
+    python tools/export_onnx.py --exam-type ecg_signal --format onnx --int8
+    python tools/export_onnx.py --exam-type all --format openvino
+
+Depois da exportação, confira a paridade com tools/check_engine_parity.py.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# O config exige a chave da OpenAI, que não é usada na exportação
+os.environ.setdefault("OPENAI_API_KEY", "export-onnx")
+
+from services.ai_services import DETECTION_IMAGE_SIZE, ai_paths  # noqa: E402
+from services.inference_engines import (  # noqa: E402
+    engine_model_path,
+    import_inference_stack,
+)
+
+ENGINE_BY_FORMAT = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+
+def quantize_int8(onnx_path: str) -> str:
+    """
+    Quantiza os pesos do modelo ONNX em INT8 (quantização dinâmica do ONNX Runtime).
+
+    Returns:
+        str: O caminho do modelo quantizado (`modelo.int8.onnx`).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+    quantize_dynamic(onnx_path, output, weight_type=QuantType.QUInt8)
+    return output
+
+
+def export(
+    exam_type: str, export_format: str, image_size: int, dynamic: bool, int8: bool
+):
+    weights_path = ai_paths[exam_type]
+    YOLO = import_inference_stack()
+    YOLO(weights_path).export(
+        format=export_format,
+        imgsz=image_size,
+        dynamic=dynamic,
+        simplify=export_format == "onnx",
+    )
+    model_path = engine_model_path(ENGINE_BY_FORMAT[export_format], weights_path)
+    print(f"{exam_type}: {model_path}")
+    if int8:
+        print(f"{exam_type}: {quantize_int8(model_path)} (INT8)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--exam-type", required=True, help="Tipo de exame de ai_paths, ou all"
+    )
+    parser.add_argument("--format", choices=sorted(ENGINE_BY_FORMAT), default="onnx")
+    parser.add_argument("--image-size", type=int, default=DETECTION_IMAGE_SIZE)
+    parser.add_argument(
+        "--dynamic",
+        action="store_true",
+        help="Lote e tamanho de entrada dinâmicos (permite lotes com várias imagens)",
+    )
+    parser.add_argument(
+        "--int8",
+        action="store_true",
+        help="Gera também o modelo ONNX quantizado em INT8",
+    )
+    args = parser.parse_args()
+    if args.int8 and args.format != "onnx":
+        parser.error("--int8 só é suportado com --format onnx")
+
+    exam_types = list(ai_paths) if args.exam_type == "all" else [args.exam_type]
+    for exam_type in exam_types:
+        if exam_type not in ai_paths:
+            parser.error(f"Tipo de exame não suportado: {exam_type}")
+        export(exam_type, args.format, args.image_size, args.dynamic, args.int8)
+
+
+if __name__ == "__main__":
+    main()
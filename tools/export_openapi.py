@@ -0,0 +1,38 @@
+"""
+Gera o openapi.json da API sem iniciar o servidor.
+
+Executado no build da imagem (ou após mudar as rotas), para que o worker não
+precise gerar o schema a cada inicialização. Exemplo:
+
+    python tools/export_openapi.py --output openapi.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Permite executar a partir da raiz do repositório: python tools/export_openapi.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# O config exige a chave da OpenAI, que não é usada para gerar o schema
+os.environ.setdefault("OPENAI_API_KEY", "export-openapi")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--output", default=None, help="Arquivo de saída (padrão: OPENAPI_JSON_PATH)"
+    )
+    args = parser.parse_args()
+
+    from config import OPENAPI_JSON_PATH
+    from main import app
+
+    output = args.output or OPENAPI_JSON_PATH
+    with open(output, "w") as file:
+        json.dump(app.openapi(), file)
+    print(f"Schema OpenAPI gravado em {output}")
+
+
+if __name__ == "__main__":
+    main()
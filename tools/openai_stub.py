@@ -0,0 +1,163 @@
+"""
+Servidor local que imita o endpoint chat-completions da OpenAI.
+
+Usado para testar e medir a API sem acessar a OpenAI. Exemplo:
+
+    python tools/openai_stub.py --port 8100 --latency-ms 800 --error-rate 0.1
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=stub uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_CONTENT = (
+    "Os achados descritos são compatíveis com um traçado dentro dos limites da "
+    "normalidade, sem sinais evidentes de alterações significativas."
+)
+
+
+def _batch_content(body: dict, content: str) -> str:
+    # Resposta em JSON das interpretações em lote, com um item por arquivo do prompt
+    prompt = body["messages"][-1]["content"]
+    _, _, files = prompt.partition("Arquivos: ")
+    try:
+        count = len(json.loads(files))
+    except ValueError:
+        count = 1
+    return json.dumps(
+        {
+            "interpretations": [
+                {"file": index, "interpretation": content} for index in range(count)
+            ]
+        },
+        ensure_ascii=False,
+    )
+
+
+def create_app(
+    latency_ms: float = 500.0,
+    jitter_ms: float = 0.0,
+    error_rate: float = 0.0,
+    content: str = DEFAULT_CONTENT,
+) -> FastAPI:
+    """
+    Cria o app do servidor stub.
+
+    Args:
+        latency_ms (float): Latência simulada de cada resposta; com `stream`,
+            o primeiro trecho chega em 20% desse tempo e os demais são
+            distribuídos no restante.
+        jitter_ms (float): Variação aleatória somada à latência.
+        error_rate (float): Fração das chamadas que retornam 429 ou 500.
+        content (str): Texto retornado pelo "modelo".
+
+    Returns:
+        FastAPI: O app do servidor stub.
+    """
+    app = FastAPI(title="OpenAI stub")
+    app.state.calls = 0
+    app.state.streams_open = 0
+    app.state.streams_cancelled = 0
+
+    def chunk(body: dict, delta: dict, finish_reason: str = None) -> bytes:
+        data = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    async def stream_content(body: dict, latency_s: float):
+        words = content.split(" ")
+        app.state.streams_open += 1
+        try:
+            await asyncio.sleep(latency_s * 0.2)
+            yield chunk(body, {"role": "assistant", "content": ""})
+            for index, word in enumerate(words):
+                yield chunk(body, {"content": word if index == 0 else " " + word})
+                await asyncio.sleep(latency_s * 0.8 / len(words))
+            yield chunk(body, {}, "stop")
+            yield b"data: [DONE]\n\n"
+        except asyncio.CancelledError:
+            app.state.streams_cancelled += 1
+            raise
+        finally:
+            app.state.streams_open -= 1
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        latency_s = (latency_ms + random.uniform(0, jitter_ms)) / 1000
+        if body.get("stream") and random.random() >= error_rate:
+            return StreamingResponse(
+                stream_content(body, latency_s), media_type="text/event-stream"
+            )
+        await asyncio.sleep(latency_s)
+
+        if random.random() < error_rate:
+            status_code = random.choice([429, 500])
+            return JSONResponse(
+                status_code=status_code,
+                content={"error": {"message": "stub error", "type": "stub"}},
+                headers={"retry-after-ms": "50"},
+            )
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": (
+                            _batch_content(body, content)
+                            if body.get("response_format")
+                            else content
+                        ),
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "calls": app.state.calls,
+            "streams_open": app.state.streams_open,
+            "streams_cancelled": app.state.streams_cancelled,
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,71 @@
 from loguru import logger
+import hashlib
+import random
 import sys
 
+from config import (
+    LOG_COMPRESSION,
+    LOG_FILE,
+    LOG_FILE_LEVEL,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_PAYLOAD_MAX_CHARS,
+    LOG_PAYLOAD_MAX_ITEMS,
+    LOG_PAYLOAD_SAMPLE_RATE,
+    LOG_PAYLOAD_SAMPLE_RATES,
+    LOG_RETENTION,
+    LOG_ROTATION,
+)
+from utils.metrics import current_labels
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{module}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+
+# Bytes usados na impressão digital dos textos e binários grandes
+_FINGERPRINT_BYTES = 4096
+_MAX_DEPTH = 6
+
+
+def _text_format(record) -> str:
+    # O resumo do payload só aparece nas linhas registradas com log_payload
+    if "payload" in record["extra"]:
+        return TEXT_FORMAT + " | {extra[payload]}\n{exception}"
+    return TEXT_FORMAT + "\n{exception}"
+
 
 def setup_logger():
+    """
+    Configura os sinks do loguru.
+
+    Os registros são gravados por uma thread em segundo plano (enqueue=True):
+    a requisição apenas coloca o registro na fila, e a escrita, a rotação e a
+    compressão do arquivo não bloqueiam o event loop nem o pool de threads.
+    O arquivo de log recebe uma linha JSON por registro.
+    """
     logger.remove()
-    logger.add(
-        sys.stderr,
-        colorize=True,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{module}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    )
-    logger.add("log.log", rotation="1 MB", level="DEBUG", compression="zip")
+    if LOG_FORMAT == "json":
+        logger.add(sys.stderr, level=LOG_LEVEL, serialize=True, enqueue=True)
+    else:
+        logger.add(
+            sys.stderr,
+            level=LOG_LEVEL,
+            colorize=True,
+            format=_text_format,
+            enqueue=True,
+        )
+    if LOG_FILE:
+        logger.add(
+            LOG_FILE,
+            level=LOG_FILE_LEVEL,
+            serialize=True,
+            enqueue=True,
+            rotation=LOG_ROTATION,
+            retention=int(LOG_RETENTION) if LOG_RETENTION.isdigit() else LOG_RETENTION,
+            compression=LOG_COMPRESSION or None,
+        )
 
 
 setup_logger()
@@ -17,3 +73,86 @@ setup_logger()
 
 def get_logger():
     return logger
+
+
+def _fingerprint(data: bytes, size: int) -> str:
+    # Hash do início do conteúdo e do tamanho total: custo constante
+    digest = hashlib.blake2b(data[:_FINGERPRINT_BYTES], digest_size=8)
+    digest.update(str(size).encode("ascii"))
+    return digest.hexdigest()
+
+
+def summarize_payload(
+    value,
+    max_chars: int = LOG_PAYLOAD_MAX_CHARS,
+    max_items: int = LOG_PAYLOAD_MAX_ITEMS,
+    _depth: int = 0,
+):
+    """
+    Resume um payload para o log, com custo limitado.
+
+    Textos longos (ex: imagens em base64) e binários viram tamanho e hash,
+    listas e dicionários são cortados em `max_items` itens e objetos
+    desconhecidos viram o nome do tipo.
+
+    Args:
+        value: O payload (dict, list, str, bytes, números...).
+        max_chars (int, opcional): Tamanho máximo dos textos mantidos.
+        max_items (int, opcional): Número máximo de itens por lista ou dicionário.
+
+    Returns:
+        Um valor serializável em JSON.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        data = value[:_FINGERPRINT_BYTES].encode("utf-8", "replace")
+        return f"<str len={len(value)} hash={_fingerprint(data, len(value))}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value[:_FINGERPRINT_BYTES])
+        return f"<bytes len={len(value)} hash={_fingerprint(data, len(value))}>"
+    if _depth >= _MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        summary = {
+            str(key): summarize_payload(item, max_chars, max_items, _depth + 1)
+            for key, item in list(value.items())[:max_items]
+        }
+        if len(value) > max_items:
+            summary["..."] = f"+{len(value) - max_items} chaves"
+        return summary
+    if isinstance(value, (list, tuple)):
+        summary = [
+            summarize_payload(item, max_chars, max_items, _depth + 1)
+            for item in value[:max_items]
+        ]
+        if len(value) > max_items:
+            summary.append(f"... +{len(value) - max_items} itens")
+        return summary
+    if hasattr(value, "__len__"):
+        return f"<{type(value).__name__} len={len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def log_payload(message: str, payload, level: str = "INFO"):
+    """
+    Registra um payload de resposta resumido, com amostragem por rota.
+
+    A rota vem do contexto da requisição (ver `utils.metrics`), e a fração
+    registrada vem de LOG_PAYLOAD_SAMPLE_RATES ou LOG_PAYLOAD_SAMPLE_RATE.
+    Registros não amostrados não são resumidos nem formatados.
+
+    Args:
+        message (str): A mensagem do registro (ex: "results").
+        payload: O payload a ser resumido.
+        level (str, opcional): O nível do registro. Padrão é INFO.
+    """
+    route = current_labels()["endpoint"]
+    rate = LOG_PAYLOAD_SAMPLE_RATES.get(route, LOG_PAYLOAD_SAMPLE_RATE)
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    logger.bind(route=route, payload=summarize_payload(payload)).opt(depth=1).log(
+        level, message
+    )
@@ -0,0 +1,491 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.profiling import active_profiles
+
+# Buckets padrão dos histogramas de latência, em segundos
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Buckets dos histogramas de memória, em bytes (16 MB a 8 GB)
+MEMORY_BUCKETS = tuple(float(2**power) for power in range(24, 34))
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Rótulos da requisição em andamento (endpoint e exam_type), propagados para
+# as tarefas e para as threads de `run_in_stage`
+_request_labels: contextvars.ContextVar = contextvars.ContextVar(
+    "metric_labels", default={"endpoint": "", "exam_type": ""}
+)
+
+
+# Memória da requisição em andamento: [RSS no início, maior RSS observado]
+_request_memory: contextvars.ContextVar = contextvars.ContextVar(
+    "request_memory", default=None
+)
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def current_rss_bytes() -> int:
+    """Memória residente (RSS) do processo, lida de /proc (0 fora do Linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+# Intervalo mínimo entre as leituras de /proc no fim das etapas; dentro dele
+# as etapas reaproveitam a última amostra do processo
+MEMORY_SAMPLE_INTERVAL_S = 0.05
+
+# Última amostra de RSS do processo: (instante monotônico, bytes)
+_last_rss_sample: Tuple[float, int] = (float("-inf"), 0)
+
+
+def _sampled_rss_bytes(force: bool) -> int:
+    global _last_rss_sample
+    now = time.monotonic()
+    sampled_at, rss = _last_rss_sample
+    if force or now - sampled_at >= MEMORY_SAMPLE_INTERVAL_S:
+        rss = current_rss_bytes()
+        _last_rss_sample = (now, rss)
+    return rss
+
+
+def sample_memory(force: bool = False):
+    """
+    Atualiza o pico de RSS da requisição em andamento (sem efeito fora de uma
+    requisição).
+
+    Args:
+        force (bool, opcional): Lê o RSS mesmo que a última amostra do processo
+            tenha menos de `MEMORY_SAMPLE_INTERVAL_S` segundos.
+    """
+    memory = _request_memory.get()
+    if memory is not None:
+        memory[1] = max(memory[1], _sampled_rss_bytes(force))
+
+
+def set_labels(**labels):
+    """Define os rótulos de métricas do contexto atual (ex: endpoint, exam_type)."""
+    return _request_labels.set({**_request_labels.get(), **labels})
+
+
+def current_labels(**overrides) -> Dict[str, str]:
+    """Retorna os rótulos do contexto atual, com os valores de `overrides`."""
+    labels = _request_labels.get()
+    if overrides:
+        labels = {**labels, **{k: v for k, v in overrides.items() if v is not None}}
+    return labels
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(
+    names: Tuple[str, ...], values: Tuple[str, ...], extra: str = ""
+) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base das métricas: uma série por combinação de valores dos rótulos."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """Retorna a série dos valores de rótulo informados (criada na primeira vez)."""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Contador monotônico."""
+
+    kind = "counter"
+
+    def _new_series(self):
+        return _Value()
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} "
+            f"{_format_value(series.value)}"
+            for key, series in list(self._series.items())
+        ]
+
+
+class Gauge(Counter):
+    """Valor que sobe e desce (ex: requisições em andamento)."""
+
+    kind = "gauge"
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """Histograma com buckets fixos, no formato cumulativo do Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in list(self._series.items()):
+            with series._lock:
+                counts, total = list(series.counts), series.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} "
+                    f"{cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Conjunto das métricas expostas em /metrics.
+
+    Além das métricas registradas, aceita coletores: funções chamadas apenas
+    na leitura de /metrics que retornam métricas calculadas naquele momento
+    (ex: estatísticas dos caches), sem custo no caminho das requisições.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Serializa todas as métricas no formato de texto do Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.register(
+    Histogram(
+        "app_stage_duration_seconds",
+        "Duração de cada etapa do processamento.",
+        ("stage", "endpoint", "exam_type"),
+    )
+)
+STAGE_ERRORS = REGISTRY.register(
+    Counter(
+        "app_stage_errors_total",
+        "Etapas que terminaram com exceção.",
+        ("stage", "endpoint", "exam_type"),
+    )
+)
+STAGE_WAIT = REGISTRY.register(
+    Histogram(
+        "app_stage_wait_seconds",
+        "Espera pelo limite de concorrência e pelo pool de threads antes de cada "
+        "etapa.",
+        ("stage",),
+    )
+)
+IMAGES_PROCESSED = REGISTRY.register(
+    Counter(
+        "app_images_processed_total",
+        "Arquivos enviados para detecção.",
+        ("endpoint", "exam_type"),
+    )
+)
+INTERPRETATION_BATCHES = REGISTRY.register(
+    Counter(
+        "app_interpretation_batches_total",
+        "Chamadas de interpretação em lote ao GPT, por resultado (ok ou fallback).",
+        ("result",),
+    )
+)
+HTTP_REQUESTS = REGISTRY.register(
+    Counter(
+        "app_http_requests_total",
+        "Requisições HTTP encerradas.",
+        ("endpoint", "method", "status"),
+    )
+)
+HTTP_DURATION = REGISTRY.register(
+    Histogram(
+        "app_http_request_duration_seconds",
+        "Duração das requisições HTTP, incluindo o envio das respostas em streaming.",
+        ("endpoint", "method"),
+    )
+)
+REQUEST_PEAK_RSS = REGISTRY.register(
+    Histogram(
+        "app_request_peak_rss_bytes",
+        "Maior RSS do worker durante cada requisição (inclui as requisições "
+        "simultâneas).",
+        ("endpoint",),
+        buckets=MEMORY_BUCKETS,
+    )
+)
+REQUEST_RSS_GROWTH = REGISTRY.register(
+    Histogram(
+        "app_request_rss_growth_bytes",
+        "Crescimento do RSS do worker durante cada requisição, em relação ao início.",
+        ("endpoint",),
+        buckets=MEMORY_BUCKETS,
+    )
+)
+UPLOADS_REJECTED = REGISTRY.register(
+    Counter(
+        "app_uploads_rejected_total",
+        "Requisições recusadas pelos limites de tamanho e de pixels dos arquivos "
+        "enviados.",
+        ("reason",),
+    )
+)
+HTTP_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "app_http_requests_in_flight",
+        "Requisições HTTP em andamento.",
+        ("endpoint",),
+    )
+)
+
+
+@contextmanager
+def stage_timer(stage: str, exam_type: Optional[str] = None):
+    """
+    Mede a duração de uma etapa no histograma app_stage_duration_seconds.
+
+    Os rótulos endpoint e exam_type vêm do contexto da requisição; exceções
+    também são contadas em app_stage_errors_total. Ao fim da etapa, o RSS
+    do worker entra no pico de memória da requisição (lido no máximo a cada
+    `MEMORY_SAMPLE_INTERVAL_S`), e a etapa entra no perfil da requisição,
+    quando ela está sendo perfilada.
+
+    Args:
+        stage (str): Nome da etapa (ex: "decode", "predict", "gpt").
+        exam_type (str, opcional): Substitui o exam_type do contexto.
+    """
+    labels = current_labels(exam_type=exam_type)
+    profiles = active_profiles()
+    if profiles:
+        profile_starts = [profile.enter() for profile in profiles]
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage=stage, **labels).inc()
+        raise
+    finally:
+        STAGE_DURATION.labels(stage=stage, **labels).observe(
+            time.perf_counter() - start
+        )
+        sample_memory()
+        if profiles:
+            for profile, profile_start in zip(profiles, profile_starts):
+                profile.exit(stage, profile_start)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede as requisições HTTP e define os rótulos
+    endpoint (o template da rota, ex: "/analise/{exam_type}/result_full") e
+    exam_type usados pelas métricas das etapas.
+
+    O pico de RSS de cada requisição é lido no início e no fim da resposta e
+    amostrado no fim das etapas (ver `stage_timer`), com no máximo uma
+    leitura de /proc a cada `MEMORY_SAMPLE_INTERVAL_S` no processo. O RSS é
+    do processo: com requisições simultâneas, o pico de uma inclui a
+    memória das demais.
+
+    Args:
+        app: A aplicação ASGI.
+        exam_types (Iterable[str], opcional): Tipos de exame conhecidos; os
+            demais valores do caminho viram "other", o que limita o número de
+            séries.
+    """
+
+    def __init__(self, app, exam_types: Iterable[str] = None):
+        self.app = app
+        self.exam_types = None if exam_types is None else frozenset(exam_types)
+
+    def _route_labels(self, scope) -> Tuple[str, str]:
+        from starlette.routing import Match
+
+        for route in scope["app"].router.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                exam_type = child_scope.get("path_params", {}).get("exam_type", "")
+                if (
+                    exam_type
+                    and self.exam_types is not None
+                    and exam_type not in self.exam_types
+                ):
+                    exam_type = "other"
+                return getattr(route, "path", "other"), exam_type
+        return "other", ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint, exam_type = self._route_labels(scope)
+        token = set_labels(endpoint=endpoint, exam_type=exam_type)
+        rss = _sampled_rss_bytes(force=True)
+        memory = [rss, rss]
+        memory_token = _request_memory.set(memory)
+        in_flight = HTTP_IN_FLIGHT.labels(endpoint=endpoint)
+        in_flight.inc()
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            method = scope["method"]
+            HTTP_DURATION.labels(endpoint=endpoint, method=method).observe(
+                time.perf_counter() - start
+            )
+            HTTP_REQUESTS.labels(endpoint=endpoint, method=method, status=status).inc()
+            sample_memory(force=True)
+            if memory[1]:
+                REQUEST_PEAK_RSS.labels(endpoint=endpoint).observe(memory[1])
+                REQUEST_RSS_GROWTH.labels(endpoint=endpoint).observe(
+                    memory[1] - memory[0]
+                )
+                if method == "POST":
+                    logger.debug(
+                        "Memória de {}: pico de RSS {:.0f} MB (+{:.0f} MB)",
+                        endpoint,
+                        memory[1] / 2**20,
+                        (memory[1] - memory[0]) / 2**20,
+                    )
+            _request_memory.reset(memory_token)
+            _request_labels.reset(token)
@@ -0,0 +1,425 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# Perfis das requisições em andamento no contexto atual; vazio fora do
+# perfilamento, de forma que as etapas só consultam a variável de contexto
+_active_profiles: contextvars.ContextVar = contextvars.ContextVar(
+    "profiles", default=()
+)
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+def active_profiles() -> tuple:
+    """Perfis que recebem as etapas do contexto atual (vazio sem perfilamento)."""
+    return _active_profiles.get()
+
+
+@contextmanager
+def attach_profiles(profiles: tuple):
+    """
+    Registra as etapas do bloco também em `profiles`.
+
+    Usado nos trabalhos compartilhados entre requisições, como os lotes do
+    micro-batching, que rodam fora do contexto das requisições.
+    """
+    token = _active_profiles.set(profiles)
+    try:
+        yield
+    finally:
+        _active_profiles.reset(token)
+
+
+def record_span(stage: str, start: float, end: float = None):
+    """
+    Registra nos perfis ativos uma etapa medida fora de `stage_timer`.
+
+    Args:
+        stage (str): O nome da etapa.
+        start (float): O início da etapa, em `time.perf_counter()`.
+        end (float, opcional): O fim da etapa (padrão: agora).
+    """
+    for profile in _active_profiles.get():
+        profile.add_span(stage, start, time.perf_counter() if end is None else end)
+
+
+class RequestProfile:
+    """
+    Perfil de uma requisição: linha do tempo das etapas e amostras de pilha.
+
+    As etapas medidas por `stage_timer` (decode, model_load, predict,
+    postprocess, annotate, encode, gpt...) entram na linha do tempo da
+    thread em que rodaram. Enquanto a requisição tem etapas em threads do
+    pool, uma thread amostra as pilhas dessas threads a cada `interval_s`.
+    O event loop não é amostrado, porque é compartilhado com as demais
+    requisições; o tempo de espera (ex: GPT) aparece apenas na linha do tempo.
+
+    Args:
+        profile_id (str): O identificador do perfil.
+        method (str): O método HTTP da requisição.
+        path (str): O caminho da requisição.
+        interval_s (float): O intervalo entre as amostras de pilha.
+    """
+
+    def __init__(self, profile_id: str, method: str, path: str, interval_s: float):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.interval_s = interval_s
+        self.created_at = time.time()
+        self.status = None
+        self.duration_ms = None
+        self._start = time.perf_counter()
+        self._loop_thread = threading.get_ident()
+        self._lock = threading.Lock()
+        # (etapa, thread, início, fim), em segundos desde o início da requisição
+        self._spans: List[Tuple[str, int, float, float]] = []
+        self._thread_names: Dict[int, str] = {}
+        # Etapas em andamento por thread do pool
+        self._busy: Dict[int, int] = {}
+        # (thread, instante, pilha da raiz para a folha)
+        self._samples: List[Tuple[int, float, Tuple[Tuple[str, str, int], ...]]] = []
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._run, name=f"profiler-{profile_id}", daemon=True
+        )
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self, status: Optional[int]):
+        self._stop.set()
+        self._sampler.join()
+        self.status = status
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+
+    def enter(self) -> float:
+        """Início de uma etapa na thread atual; retorna o instante para `exit`."""
+        thread = threading.get_ident()
+        if thread != self._loop_thread:
+            with self._lock:
+                self._busy[thread] = self._busy.get(thread, 0) + 1
+        return time.perf_counter()
+
+    def exit(self, stage: str, start: float):
+        thread = threading.get_ident()
+        if thread != self._loop_thread:
+            with self._lock:
+                self._busy[thread] -= 1
+                if not self._busy[thread]:
+                    del self._busy[thread]
+        self.add_span(stage, start, time.perf_counter(), thread)
+
+    def add_span(self, stage: str, start: float, end: float, thread: int = None):
+        thread = threading.get_ident() if thread is None else thread
+        with self._lock:
+            self._thread_names.setdefault(thread, threading.current_thread().name)
+            self._spans.append((stage, thread, start - self._start, end - self._start))
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            with self._lock:
+                threads = list(self._busy)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            at = time.perf_counter() - self._start
+            for thread in threads:
+                frame = frames.get(thread)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = getattr(code, "co_qualname", code.co_name)
+                    stack.append((name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    self._samples.append((thread, at, tuple(reversed(stack))))
+
+    def stages(self) -> Dict[str, dict]:
+        """Tempo total (ms) e número de execuções de cada etapa."""
+        totals: Dict[str, dict] = {}
+        for stage, _, start, end in self._spans:
+            entry = totals.setdefault(stage, {"total_ms": 0.0, "count": 0})
+            entry["total_ms"] += (end - start) * 1000
+            entry["count"] += 1
+        for entry in totals.values():
+            entry["total_ms"] = round(entry["total_ms"], 3)
+        return dict(sorted(totals.items(), key=lambda item: -item[1]["total_ms"]))
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "created_at": self.created_at,
+            "duration_ms": self.duration_ms,
+            "samples": len(self._samples),
+            "stages": self.stages(),
+        }
+
+    def to_speedscope(self) -> dict:
+        """
+        Serializa o perfil no formato do speedscope (https://www.speedscope.app).
+
+        Cada thread tem um perfil "evented" com as etapas; as etapas
+        simultâneas da mesma thread (ex: várias chamadas ao GPT no event loop)
+        ficam em faixas separadas. As threads amostradas têm também um perfil
+        "sampled" com as pilhas.
+        """
+        frames, frame_index = [], {}
+
+        def frame_id(key) -> int:
+            index = frame_index.get(key)
+            if index is None:
+                index = frame_index[key] = len(frames)
+                name, file, line = key if isinstance(key, tuple) else (key, None, None)
+                frame = (
+                    {"name": name, "file": file, "line": line}
+                    if file
+                    else {"name": name}
+                )
+                frames.append(frame)
+            return index
+
+        end_ms = self.duration_ms or 0.0
+        profiles = []
+        # O event loop primeiro, depois as threads do pool
+        threads = sorted(
+            {thread for _, thread, _, _ in self._spans},
+            key=lambda t: t != self._loop_thread,
+        )
+        for thread in threads:
+            if thread == self._loop_thread:
+                name = "event loop"
+            else:
+                name = self._thread_names.get(thread, str(thread))
+            spans = sorted(
+                (
+                    (stage, start * 1000, end * 1000)
+                    for stage, span_thread, start, end in self._spans
+                    if span_thread == thread
+                ),
+                key=lambda span: (span[1], -span[2]),
+            )
+            for lane, lane_spans in enumerate(_lanes(spans)):
+                events, stack = [], []
+                for stage, start, end in lane_spans:
+                    while stack and stack[-1][2] <= start:
+                        closed = stack.pop()
+                        events.append(
+                            {"type": "C", "frame": frame_id(closed[0]), "at": closed[2]}
+                        )
+                    events.append({"type": "O", "frame": frame_id(stage), "at": start})
+                    stack.append((stage, start, end))
+                while stack:
+                    closed = stack.pop()
+                    events.append(
+                        {"type": "C", "frame": frame_id(closed[0]), "at": closed[2]}
+                    )
+                profiles.append(
+                    {
+                        "type": "evented",
+                        "name": f"etapas: {name}" + (f" #{lane + 1}" if lane else ""),
+                        "unit": "milliseconds",
+                        "startValue": 0,
+                        "endValue": max(end_ms, events[-1]["at"]),
+                        "events": events,
+                    }
+                )
+
+        interval_ms = self.interval_s * 1000
+        for thread in sorted({thread for thread, _, _ in self._samples}):
+            samples = [stack for t, _, stack in self._samples if t == thread]
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": f"amostras: {self._thread_names.get(thread, str(thread))}",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": len(samples) * interval_ms,
+                    "samples": [[frame_id(key) for key in stack] for stack in samples],
+                    "weights": [interval_ms] * len(samples),
+                }
+            )
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": f"{self.method} {self.path} ({self.id})",
+            "exporter": "object-detection-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+def _lanes(
+    spans: List[Tuple[str, float, float]]
+) -> List[List[Tuple[str, float, float]]]:
+    # Distribui as etapas (ordenadas por início) em faixas em que elas são
+    # sequenciais ou aninhadas, como exige o perfil "evented"
+    lanes, open_ends = [], []
+    for span in spans:
+        _, start, end = span
+        for lane, ends in zip(lanes, open_ends):
+            while ends and ends[-1] <= start:
+                ends.pop()
+            if not ends or ends[-1] >= end:
+                lane.append(span)
+                ends.append(end)
+                break
+        else:
+            lanes.append([span])
+            open_ends.append([end])
+    return lanes
+
+
+class ProfileStore:
+    """
+    Últimos perfis do worker, em memória e opcionalmente em disco.
+
+    Com `directory`, cada perfil também é gravado como
+    `<id>.speedscope.json`, o que permite obtê-lo de qualquer worker.
+
+    Args:
+        max_profiles (int): Número de perfis mantidos em memória.
+        directory (str): Diretório dos arquivos (vazio = apenas memória).
+    """
+
+    def __init__(self, max_profiles: int, directory: str = ""):
+        self._max_profiles = max(1, max_profiles)
+        self._directory = directory
+        self._profiles: "OrderedDict[str, Tuple[dict, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self._directory, f"{profile_id}.speedscope.json")
+
+    def save(self, profile: RequestProfile):
+        document = profile.to_speedscope()
+        with self._lock:
+            self._profiles[profile.id] = (profile.summary(), document)
+            while len(self._profiles) > self._max_profiles:
+                self._profiles.popitem(last=False)
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+            with open(self._path(profile.id), "w") as file:
+                json.dump(document, file)
+
+    def list(self) -> List[dict]:
+        """Resumo dos perfis em memória, do mais recente para o mais antigo."""
+        with self._lock:
+            return [summary for summary, _ in reversed(self._profiles.values())]
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        """O arquivo speedscope do perfil, da memória ou do diretório."""
+        with self._lock:
+            entry = self._profiles.get(profile_id)
+        if entry is not None:
+            return entry[1]
+        # O identificador vem da URL; apenas identificadores gerados aqui são aceitos
+        if self._directory and len(profile_id) == 32 and profile_id.isalnum():
+            try:
+                with open(self._path(profile_id)) as file:
+                    return json.load(file)
+            except FileNotFoundError:
+                return None
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila as requisições de `path_prefix` sob demanda.
+
+    Uma requisição é perfilada quando traz o cabeçalho X-Profile-Token com
+    o token configurado, ou por sorteio, com a fração `sample_rate`. O
+    identificador do perfil volta no cabeçalho X-Profile-Id, e o perfil é
+    guardado em `store` ao fim da resposta. O middleware só deve ser
+    instalado com o perfilamento ativo; as demais requisições seguem direto.
+
+    Args:
+        app: A aplicação ASGI.
+        store (ProfileStore): Onde guardar os perfis.
+        token (str): O token do cabeçalho (vazio = apenas o sorteio).
+        sample_rate (float): Fração das requisições perfiladas sem o cabeçalho.
+        interval_s (float): O intervalo entre as amostras de pilha.
+        path_prefix (str, opcional): As rotas perfiladas.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        token: str,
+        sample_rate: float,
+        interval_s: float,
+        path_prefix: str = "/analise/",
+    ):
+        self.app = app
+        self.store = store
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.interval_s = interval_s
+        self.path_prefix = path_prefix
+
+    def _wants_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile-token":
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.path_prefix)
+            or not self._wants_profile(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            uuid.uuid4().hex, scope["method"], scope["path"], self.interval_s
+        )
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _active_profiles.set((profile,))
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _active_profiles.reset(token)
+            profile.stop(status)
+            # A serialização (e a gravação em disco) roda fora do event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.store.save, profile
+            )
+            logger.info(
+                "Perfil {} de {} {}: {} ms",
+                profile.id,
+                profile.method,
+                profile.path,
+                profile.duration_ms,
+            )
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+def _process_age_s() -> Optional[float]:
+    """Tempo desde a criação do processo, lido de /proc (apenas Linux)."""
+    try:
+        with open("/proc/self/stat") as file:
+            # O nome do processo pode conter espaços; os campos vêm depois do ")"
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as file:
+            uptime_s = float(file.read().split()[0])
+        start_ticks = int(fields[19])
+        return uptime_s - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """
+    Mede as fases da inicialização do worker.
+
+    `mark` registra o tempo desde a marca anterior (ex: importações) e
+    `phase` mede um bloco (ex: um hook de startup). `report` retorna o total
+    e o tempo de cada fase em milissegundos.
+    """
+
+    def __init__(self):
+        self._process_age_at_start = _process_age_s()
+        self._started = time.perf_counter()
+        self._last_mark = self._started
+        self._phases: Dict[str, float] = {}
+        self._ready_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def mark(self, name: str):
+        """Registra como fase `name` o tempo desde a marca anterior."""
+        now = time.perf_counter()
+        with self._lock:
+            self._phases[name] = (now - self._last_mark) * 1000
+            self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Mede a duração do bloco como fase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phases[name] = (time.perf_counter() - start) * 1000
+
+    def mark_ready(self):
+        """Registra o momento em que o worker passa a aceitar requisições."""
+        self._ready_ms = (time.perf_counter() - self._started) * 1000
+
+    def report(self) -> dict:
+        """
+        Retorna o relatório da inicialização.
+
+        Returns:
+            dict: "ready_ms" (da importação do main até aceitar requisições),
+                "interpreter_ms" (do início do processo até a importação do
+                main, quando disponível) e "phases" em milissegundos.
+        """
+        with self._lock:
+            phases = {name: round(ms, 1) for name, ms in self._phases.items()}
+        return {
+            "ready_ms": None if self._ready_ms is None else round(self._ready_ms, 1),
+            "interpreter_ms": (
+                None
+                if self._process_age_at_start is None
+                else round(self._process_age_at_start * 1000, 1)
+            ),
+            "phases": phases,
+        }
+
+
+# Criado na importação do main, antes das demais importações
+startup_timer = StartupTimer()
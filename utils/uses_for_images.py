@@ -1,8 +1,10 @@
 from PIL import Image
 import io
+import math
+import numpy as np
 from loguru import logger
 import base64
-from typing import List
+from typing import Tuple
 
 
 def get_image_from_bytes(binary_image: bytes) -> Image:
@@ -19,25 +21,115 @@ def get_image_from_bytes(binary_image: bytes) -> Image:
     return input_image
 
 
-def get_bytes_from_image(image: Image) -> bytes:
+def get_array_from_image(image: Image) -> np.ndarray:
+    """Converte a imagem PIL RGB em um array BGR (H, W, 3) pronto para o modelo
+
+    O array é criado com uma única cópia dos pixels e pode ser somente leitura.
+
+    Args:
+        image (Image): Uma instância de imagem PIL RGB
+
+    Returns:
+        np.ndarray: Os pixels da imagem na ordem BGR
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width, height = image.size
+    return np.frombuffer(image.tobytes("raw", "BGR"), dtype=np.uint8).reshape(
+        height, width, 3
+    )
+
+
+def get_array_from_bytes(
+    binary_image: bytes, target_size: int = None
+) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """Decodifica a imagem de bytes diretamente para o array usado pelo modelo
+
+    Quando a imagem é um JPEG pelo menos duas vezes maior que `target_size`,
+    a decodificação é feita em escala reduzida (1/2, 1/4 ou 1/8) pelo próprio
+    decodificador JPEG, sem decodificar a resolução original.
+
+    Args:
+        binary_image (bytes): A representação binária da imagem
+        target_size (int, opcional): O tamanho da imagem usado na inferência
+
+    Returns:
+        Tuple[np.ndarray, Tuple[float, float]]: Os pixels na ordem BGR e os
+            fatores de escala (x, y) entre a resolução original e a decodificada.
+            O decodificador arredonda cada eixo para cima separadamente, e por
+            isso os dois fatores podem ser diferentes
+    """
+    image = Image.open(io.BytesIO(binary_image))
+    width, height = image.size
+    if (
+        target_size
+        and image.format == "JPEG"
+        and max(width, height) >= 2 * target_size
+    ):
+        ratio = max(width, height) / target_size
+        image.draft("RGB", (math.ceil(width / ratio), math.ceil(height / ratio)))
+    pixels = get_array_from_image(image)
+    return pixels, (width / pixels.shape[1], height / pixels.shape[0])
+
+
+def get_image_size(binary_image: bytes) -> Tuple[int, int]:
+    """Lê a largura e a altura da imagem a partir do cabeçalho, sem decodificá-la
+
+    Args:
+        binary_image (bytes): A representação binária da imagem
+
+    Returns:
+        Tuple[int, int]: A largura e a altura da imagem
+    """
+    return Image.open(io.BytesIO(binary_image)).size
+
+
+def resize_to_preview(image: Image, max_size: int = None) -> Image:
+    """Reduz a imagem para que a maior dimensão seja no máximo `max_size`
+
+    Args:
+        image (Image): Uma instância de imagem PIL
+        max_size (int, opcional): A maior dimensão permitida
+
+    Returns:
+        Image: A imagem reduzida, ou a própria imagem se já for menor
+    """
+    if not max_size or max(image.size) <= max_size:
+        return image
+    ratio = max_size / max(image.size)
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    return image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def get_bytes_from_image(
+    image: Image, image_format: str = "JPEG", quality: int = 85, max_size: int = None
+) -> bytes:
     """
     Converte a imagem PIL para bytes
 
     Args:
     image (Image): Uma instância de imagem PIL
+    image_format (str, opcional): O formato do PIL ("JPEG", "WEBP" ou "PNG").
+        Padrão é JPEG
+    quality (int, opcional): A qualidade dos formatos com perda. Padrão é 85
+    max_size (int, opcional): A maior dimensão da imagem; imagens maiores são reduzidas
 
     Returns:
-    bytes : Objeto BytesIO que contém a imagem no formato JPEG com qualidade 85
+    bytes : Objeto BytesIO que contém a imagem no formato pedido
     """
+    image = resize_to_preview(image, max_size)
     return_image = io.BytesIO()
-    image.save(
-        return_image, format="JPEG", quality=85
-    )  # salva a imagem em formato JPEG com qualidade 85
+    if image_format == "PNG":
+        image.save(return_image, format=image_format)
+    else:
+        image.save(return_image, format=image_format, quality=quality)
     return_image.seek(0)  # define o ponteiro para o início do arquivo
     return return_image
 
-def encode_image_to_base64(image: Image) -> str:
-    image_bytes = get_bytes_from_image(image)
+def encode_image_to_base64(
+    image: Image, image_format: str = "JPEG", quality: int = 85, max_size: int = None
+) -> str:
+    image_bytes = get_bytes_from_image(image, image_format, quality, max_size)
     return base64.b64encode(image_bytes.getvalue()).decode("utf-8")
 
 def decode_base64_to_image(base64_str: str) -> Image: